@@ -0,0 +1,110 @@
+import os
+import json
+import logging
+import threading
+import intake
+
+# Webhook admission control. Each webhook endpoint has a concurrency limit
+# (429 when exceeded), and when the intake backlog grows, low-priority events
+# (Jellyfin progress ticks) are shed first, then everything else (503). The
+# backlog counts events that are due or being handled; events waiting out a
+# retry backoff (e.g. during a Sonarr outage) don't push new events away.
+ADMISSION_CONTROL = os.getenv('ADMISSION_CONTROL', 'true').lower() == 'true'
+ADMISSION_LOW_PRIORITY_DEPTH = int(os.getenv('ADMISSION_LOW_PRIORITY_DEPTH', 200))
+ADMISSION_MAX_QUEUE_DEPTH = int(os.getenv('ADMISSION_MAX_QUEUE_DEPTH', 2000))
+ADMISSION_BUSY_RETRY_AFTER = int(os.getenv('ADMISSION_BUSY_RETRY_AFTER', 5))
+ADMISSION_OVERLOAD_RETRY_AFTER = int(os.getenv('ADMISSION_OVERLOAD_RETRY_AFTER', 60))
+
+LOW, NORMAL = 'low', 'normal'
+
+logger = logging.getLogger(__name__)
+
+
+class Endpoint:
+    """Admission state for one webhook path."""
+
+    def __init__(self, priority, limit):
+        self.priority = priority
+        self.limit = limit
+        self.slots = threading.BoundedSemaphore(limit)
+        self.in_flight = 0
+        self.admitted = 0
+        self.shed_busy = 0
+        self.shed_overload = 0
+
+    def stats(self):
+        return {
+            'priority': self.priority,
+            'limit': self.limit,
+            'in_flight': self.in_flight,
+            'admitted': self.admitted,
+            'shed_busy': self.shed_busy,
+            'shed_overload': self.shed_overload
+        }
+
+
+ENDPOINTS = {
+    '/jellyfin-webhook': Endpoint(LOW, int(os.getenv('ADMISSION_JELLYFIN_CONCURRENCY', 8))),
+    '/webhook': Endpoint(NORMAL, int(os.getenv('ADMISSION_SERVER_CONCURRENCY', 4))),
+    '/sonarr-webhook': Endpoint(NORMAL, int(os.getenv('ADMISSION_SONARR_CONCURRENCY', 8))),
+    '/seerr-webhook': Endpoint(NORMAL, int(os.getenv('ADMISSION_SEERR_CONCURRENCY', 4))),
+}
+_lock = threading.Lock()
+
+
+def overloaded(priority):
+    """Whether the intake backlog is too deep to accept events of this priority."""
+    depth = intake.ready_depth()
+    if depth >= ADMISSION_MAX_QUEUE_DEPTH:
+        return True
+    return priority == LOW and depth >= ADMISSION_LOW_PRIORITY_DEPTH
+
+
+def _reject(start_response, status, retry_after, message):
+    body = json.dumps({'status': 'error', 'message': message}).encode()
+    start_response(status, [('Content-Type', 'application/json'), ('Content-Length', str(len(body))),
+                            ('Retry-After', str(retry_after))])
+    return [body]
+
+
+def middleware(wsgi_app):
+    """Wrap a WSGI app so webhook requests pass admission control first."""
+    def admit(environ, start_response):
+        endpoint = ENDPOINTS.get(environ.get('PATH_INFO'))
+        if not ADMISSION_CONTROL or endpoint is None or environ.get('REQUEST_METHOD') != 'POST':
+            return wsgi_app(environ, start_response)
+
+        if overloaded(endpoint.priority):
+            with _lock:
+                endpoint.shed_overload += 1
+            return _reject(start_response, '503 Service Unavailable', ADMISSION_OVERLOAD_RETRY_AFTER,
+                           'Event backlog is full, try again later')
+        if not endpoint.slots.acquire(blocking=False):
+            with _lock:
+                endpoint.shed_busy += 1
+            return _reject(start_response, '429 Too Many Requests', ADMISSION_BUSY_RETRY_AFTER,
+                           'Too many concurrent requests')
+        with _lock:
+            endpoint.in_flight += 1
+            endpoint.admitted += 1
+        try:
+            # Responses here are small and fully built, so the slot can be released on return
+            return list(wsgi_app(environ, start_response))
+        finally:
+            with _lock:
+                endpoint.in_flight -= 1
+            endpoint.slots.release()
+    return admit
+
+
+def stats():
+    with _lock:
+        endpoints = {path: endpoint.stats() for path, endpoint in ENDPOINTS.items()}
+    return {
+        'enabled': ADMISSION_CONTROL,
+        'queue_depth': intake.depth(),
+        'ready_depth': intake.ready_depth(),
+        'low_priority_depth': ADMISSION_LOW_PRIORITY_DEPTH,
+        'max_queue_depth': ADMISSION_MAX_QUEUE_DEPTH,
+        'endpoints': endpoints
+    }
@@ -0,0 +1,276 @@
+import os
+import time
+import random
+import logging
+import threading
+import requests
+from contextlib import contextmanager
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+# Load environment variables from .env file
+load_dotenv()
+
+SONARR_URL = os.getenv('SONARR_URL', 'http://sonarr:8989')
+SONARR_API_KEY = os.getenv('SONARR_API_KEY')
+OVERSEERR_URL = os.getenv('OVERSEERR_URL')
+OVERSEERR_API_KEY = os.getenv('OVERSEERR_API_KEY')
+
+# Connection pool sizing (per upstream)
+POOL_CONNECTIONS = int(os.getenv('HTTP_POOL_CONNECTIONS', 4))
+POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', 16))
+
+# Per-call timeouts (seconds) and the overall budget for one webhook event
+CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', 3.05))
+READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', 20))
+EVENT_DEADLINE = float(os.getenv('EVENT_DEADLINE', 90))
+
+# Retries apply to idempotent methods only; POST/DELETE are sent once
+RETRY_ATTEMPTS = int(os.getenv('HTTP_RETRY_ATTEMPTS', 3))
+RETRY_BACKOFF = float(os.getenv('HTTP_RETRY_BACKOFF', 0.5))
+RETRY_BACKOFF_MAX = float(os.getenv('HTTP_RETRY_BACKOFF_MAX', 8))
+IDEMPOTENT_METHODS = {'GET', 'PUT'}
+RETRY_STATUSES = {429, 502, 503, 504}
+
+# Circuit breaker: open after N consecutive failures, probe again after the cooldown
+BREAKER_FAILURE_THRESHOLD = int(os.getenv('BREAKER_FAILURE_THRESHOLD', 5))
+BREAKER_RESET_TIMEOUT = float(os.getenv('BREAKER_RESET_TIMEOUT', 30))
+
+logger = logging.getLogger(__name__)
+
+_local = threading.local()
+
+
+class CircuitOpenError(requests.exceptions.ConnectionError):
+    """Raised instead of calling a service whose circuit breaker is open."""
+
+
+class DeadlineExceeded(requests.exceptions.Timeout):
+    """Raised when the current event has used up its time budget."""
+
+
+@contextmanager
+def deadline(seconds=None):
+    """
+    Bound every upstream call made by this thread inside the block.
+
+    Nested deadlines never extend an outer one.
+    """
+    seconds = EVENT_DEADLINE if seconds is None else seconds
+    previous = getattr(_local, 'deadline', None)
+    expires = time.monotonic() + seconds
+    _local.deadline = expires if previous is None else min(previous, expires)
+    try:
+        yield
+    finally:
+        _local.deadline = previous
+
+
+def remaining_time():
+    """Seconds left in the current deadline, or None if there is none."""
+    expires = getattr(_local, 'deadline', None)
+    if expires is None:
+        return None
+    return expires - time.monotonic()
+
+
+def _backoff(attempt):
+    """Full-jitter exponential backoff for a retry attempt (0-based)."""
+    return random.uniform(0, min(RETRY_BACKOFF_MAX, RETRY_BACKOFF * (2 ** attempt)))
+
+
+class CircuitBreaker:
+    """Track consecutive failures of a service and fail fast while it is down."""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = None
+        self.last_error = None
+        self.rejected = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        """Return True if a request may be sent now."""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                logger.info(f"Circuit for {self.name} half-open, probing")
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        with self._lock:
+            if self.state != self.CLOSED:
+                logger.info(f"Circuit for {self.name} closed")
+            self.state = self.CLOSED
+            self.failures = 0
+            self.opened_at = None
+            self._probe_in_flight = False
+
+    def record_failure(self, error):
+        with self._lock:
+            self.failures += 1
+            self.last_error = str(error)
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    logger.warning(f"Circuit for {self.name} opened after {self.failures} failures: {error}")
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def snapshot(self):
+        """Current breaker state as a plain dict."""
+        with self._lock:
+            retry_in = None
+            if self.state == self.OPEN:
+                retry_in = max(0.0, round(self.reset_timeout - (time.monotonic() - self.opened_at), 1))
+            return {
+                'state': self.state,
+                'consecutive_failures': self.failures,
+                'rejected_calls': self.rejected,
+                'retry_in_seconds': retry_in,
+                'last_error': self.last_error
+            }
+
+
+def build_session(headers=None):
+    """Create a requests session with a keep-alive connection pool."""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    if headers:
+        # Drop unset values (e.g. missing API key) rather than sending "None"
+        session.headers.update({k: v for k, v in headers.items() if v is not None})
+    return session
+
+
+class ServiceClient:
+    """
+    Pooled HTTP client for a single upstream service.
+
+    Requests are made against paths relative to the service base URL and reuse
+    one session, so the TCP/TLS connection and auth headers are set up once.
+    Every call gets a timeout, idempotent calls are retried with jittered
+    backoff, and a circuit breaker fails fast while the service is down.
+    """
+
+    def __init__(self, name, base_url, headers=None):
+        self.name = name
+        self.base_url = (base_url or '').rstrip('/')
+        self.session = build_session(headers)
+        self.breaker = CircuitBreaker(name)
+
+    def url(self, path):
+        """Build an absolute URL for a path on this service."""
+        if path.startswith('http://') or path.startswith('https://'):
+            return path
+        return f"{self.base_url}{path}"
+
+    def _timeout(self, requested):
+        """Clamp the per-call timeout to whatever is left of the deadline."""
+        timeout = requested if requested is not None else (CONNECT_TIMEOUT, READ_TIMEOUT)
+        remaining = remaining_time()
+        if remaining is None:
+            return timeout
+        if remaining <= 0:
+            raise DeadlineExceeded(f"Deadline exceeded before calling {self.name}")
+        if isinstance(timeout, tuple):
+            return tuple(min(t, remaining) for t in timeout)
+        return min(timeout, remaining)
+
+    def request(self, method, path, **kwargs):
+        method = method.upper()
+        url = self.url(path)
+        requested_timeout = kwargs.pop('timeout', None)
+        attempts = max(1, RETRY_ATTEMPTS) if method in IDEMPOTENT_METHODS else 1
+
+        for attempt in range(attempts):
+            timeout = self._timeout(requested_timeout)
+            if not self.breaker.allow():
+                raise CircuitOpenError(f"{self.name} circuit is open, not calling {method} {path}")
+
+            last_attempt = attempt == attempts - 1
+            try:
+                response = self.session.request(method, url, timeout=timeout, **kwargs)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self.breaker.record_failure(e)
+                if last_attempt:
+                    raise
+                logger.warning(f"{self.name} {method} {path} failed ({e}), retrying")
+                self._sleep(_backoff(attempt))
+                continue
+            except requests.exceptions.RequestException as e:
+                # Not transient, so no retry; still record it so a half-open probe is released
+                self.breaker.record_failure(e)
+                raise
+
+            if response.status_code >= 500:
+                self.breaker.record_failure(f"HTTP {response.status_code}")
+            else:
+                self.breaker.record_success()
+
+            if response.status_code in RETRY_STATUSES and not last_attempt:
+                logger.warning(f"{self.name} {method} {path} returned {response.status_code}, retrying")
+                delay = _backoff(attempt)
+                retry_after = response.headers.get('Retry-After', '')
+                if retry_after.isdigit():
+                    delay = max(delay, float(retry_after))
+                self._sleep(delay)
+                continue
+            return response
+
+    def _sleep(self, delay):
+        """Sleep before a retry without running past the deadline."""
+        remaining = remaining_time()
+        if remaining is not None:
+            if remaining <= delay:
+                raise DeadlineExceeded(f"Deadline exceeded while retrying {self.name}")
+        time.sleep(delay)
+
+    def get(self, path, **kwargs):
+        return self.request('GET', path, **kwargs)
+
+    def put(self, path, **kwargs):
+        return self.request('PUT', path, **kwargs)
+
+    def post(self, path, **kwargs):
+        return self.request('POST', path, **kwargs)
+
+    def delete(self, path, **kwargs):
+        return self.request('DELETE', path, **kwargs)
+
+
+# Shared clients, one connection pool per upstream
+sonarr = ServiceClient('sonarr', SONARR_URL, {
+    'X-Api-Key': SONARR_API_KEY,
+    'Content-Type': 'application/json'
+})
+
+overseerr = ServiceClient('overseerr', OVERSEERR_URL, {
+    'X-Api-Key': OVERSEERR_API_KEY,
+    'Content-Type': 'application/json',
+    'Accept': 'application/json'
+})
+
+# Session handed to pyTelegramBotAPI so bot calls reuse one pool
+telegram_session = build_session()
+
+
+def get_status():
+    """Circuit breaker state for each upstream, for the status endpoint."""
+    return {client.name: client.breaker.snapshot() for client in (sonarr, overseerr)}
@@ -0,0 +1,116 @@
+"""
+Microbenchmarks for the rule algorithms on synthetic series.
+
+Compares the previous linear-scan implementations with the episode index for
+series of 10, 1,000 and 20,000 episodes. Run from the OCDarr directory:
+
+    python benchmarks/bench_rules.py [repeat]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import episode_index
+import rule_planner
+
+SERIES_SIZES = (10, 1000, 20000)
+EPISODES_PER_SEASON = 25
+RULE = {'get_option': '3', 'action_option': 'search', 'keep_watched': 2, 'monitor_watched': False}
+
+
+def synthetic_series(size):
+    """Episodes spread over seasons, in the order Sonarr returns them."""
+    episodes = []
+    for i in range(size):
+        season, number = divmod(i, EPISODES_PER_SEASON)
+        episodes.append({
+            'id': 100000 + i,
+            'seasonNumber': season + 1,
+            'episodeNumber': number + 1,
+            'monitored': i % 3 == 0,
+            'hasFile': i % 2 == 0,
+            'episodeFileId': 500000 + i,
+        })
+    return episodes
+
+
+def legacy_next_episode_ids(all_episodes, season_number, episode_number, get_option):
+    """fetch_next_episodes before the index: a filtered scan per season."""
+    next_ids = []
+    num_episodes = int(get_option)
+    season = [ep for ep in all_episodes if ep['seasonNumber'] == season_number]
+    next_ids.extend(ep['id'] for ep in season if ep['episodeNumber'] > episode_number)
+    next_season = season_number + 1
+    last_season = max(ep['seasonNumber'] for ep in all_episodes)
+    while len(next_ids) < num_episodes and next_season <= last_season:
+        next_ids.extend(ep['id'] for ep in all_episodes if ep['seasonNumber'] == next_season)
+        next_season += 1
+    return next_ids[:num_episodes]
+
+
+def legacy_last_watched_id(all_episodes, season_number, episode_number):
+    return next(ep['id'] for ep in all_episodes
+                if ep['seasonNumber'] == season_number and ep['episodeNumber'] == episode_number)
+
+
+def legacy_watched_files_to_delete(all_episodes, keep_watched, last_watched_id):
+    sorted_episodes = sorted(all_episodes, key=lambda ep: (ep['seasonNumber'], ep['episodeNumber']), reverse=True)
+    last_watched_index = next(i for i, ep in enumerate(sorted_episodes) if ep['id'] == last_watched_id)
+    keep_range = sorted_episodes[max(0, last_watched_index - keep_watched + 1):last_watched_index + 1]
+    keep_ids = {ep['id'] for ep in keep_range}
+    return [ep['episodeFileId'] for ep in all_episodes if ep['id'] not in keep_ids and ep['hasFile']]
+
+
+def legacy_rule_run(all_episodes, season_number, episode_number):
+    last_watched_id = legacy_last_watched_id(all_episodes, season_number, episode_number)
+    next_ids = legacy_next_episode_ids(all_episodes, season_number, episode_number, RULE['get_option'])
+    legacy_watched_files_to_delete(all_episodes, RULE['keep_watched'], last_watched_id)
+    return next_ids
+
+
+def indexed_rule_run(all_episodes, season_number, episode_number):
+    last_watched_id = episode_index.get_index(all_episodes).find(season_number, episode_number)['id']
+    next_ids = rule_planner.next_episode_ids(all_episodes, season_number, episode_number, RULE['get_option'])
+    rule_planner.watched_files_to_delete(all_episodes, RULE['keep_watched'], last_watched_id)
+    return next_ids
+
+
+def bench(label, fn, repeat):
+    number = max(1, 2000 // repeat)
+    best = min(timeit.repeat(fn, number=number, repeat=repeat)) / number
+    print(f"  {label:<28} {best * 1e6:12.1f} us")
+    return best
+
+
+def main(repeat=5):
+    for size in SERIES_SIZES:
+        episodes = synthetic_series(size)
+        # Watch an episode in the middle of the series, as a binge would
+        season_number, episode_number = divmod(size // 2, EPISODES_PER_SEASON)
+        season_number, episode_number = season_number + 1, episode_number + 1
+        assert legacy_rule_run(episodes, season_number, episode_number) == \
+            indexed_rule_run(episodes, season_number, episode_number)
+
+        print(f"{size} episodes")
+        last_id = legacy_last_watched_id(episodes, season_number, episode_number)
+        bench("last watched lookup (scan)", lambda: legacy_last_watched_id(episodes, season_number, episode_number), repeat)
+        bench("last watched lookup (index)",
+              lambda: episode_index.get_index(episodes).find(season_number, episode_number), repeat)
+        bench("next episodes (scan)",
+              lambda: legacy_next_episode_ids(episodes, season_number, episode_number, '3'), repeat)
+        bench("next episodes (index)",
+              lambda: rule_planner.next_episode_ids(episodes, season_number, episode_number, '3'), repeat)
+        bench("watched files (sort+scan)",
+              lambda: legacy_watched_files_to_delete(episodes, 2, last_id), repeat)
+        bench("watched files (index)",
+              lambda: rule_planner.watched_files_to_delete(episodes, 2, last_id), repeat)
+        bench("index build (cold)", lambda: episode_index.EpisodeIndex(episodes), repeat)
+        legacy = bench("full rule run (legacy)", lambda: legacy_rule_run(episodes, season_number, episode_number), repeat)
+        indexed = bench("full rule run (index)", lambda: indexed_rule_run(episodes, season_number, episode_number), repeat)
+        print(f"  speedup {legacy / indexed:.1f}x")
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 5)
@@ -0,0 +1,107 @@
+"""
+Throughput benchmark for the Jellyfin webhook endpoint.
+
+Feeds PlaybackProgress ticks for many concurrent streams straight into the
+Flask WSGI app and reports how many events per second the listener absorbs,
+with the raw-body fast path and with every tick fully decoded. HTTP parsing by
+the server in front is not included, and rule runs are counted as intake
+submissions but not executed. Run from the OCDarr directory:
+
+    python benchmarks/bench_webhooks.py [events] [streams]
+"""
+import os
+import sys
+import json
+import time
+import logging
+import tempfile
+from werkzeug.test import EnvironBuilder
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# The listener sets up file logging on import
+_workdir = tempfile.mkdtemp(prefix='ocdarr-bench-')
+os.environ.setdefault('LOG_PATH', os.path.join(_workdir, 'app.log'))
+os.environ.setdefault('MISSING_LOG_PATH', os.path.join(_workdir, 'missing.log'))
+os.environ.setdefault('DEFERRED_DELETION', 'false')
+os.environ.setdefault('INTAKE_QUEUE_PATH', os.path.join(_workdir, 'intake.db'))
+
+import intake
+import playback_sessions
+import webhook_listener
+
+TICKS_PER_EPISODE = 600   # a 45 minute episode reporting every ~5 seconds
+RUNTIME_TICKS = 27000000000
+
+
+def progress_payloads(events, streams):
+    """Progress ticks interleaved across streams, each stream walking through its episode."""
+    payloads = []
+    for i in range(events):
+        stream = i % streams
+        # Streams start at staggered points so some cross the threshold during the run
+        tick = i // streams + stream * TICKS_PER_EPISODE // streams
+        position = (tick % TICKS_PER_EPISODE) * RUNTIME_TICKS // TICKS_PER_EPISODE
+        payloads.append(json.dumps({
+            'NotificationType': 'PlaybackProgress',
+            'ItemType': 'Episode',
+            'SeriesName': f"Series {stream}",
+            'SeasonNumber': 1,
+            'EpisodeNumber': 1 + tick // TICKS_PER_EPISODE,
+            'UserId': f"user{stream % 7}",
+            'ItemId': f"item{stream}-{tick // TICKS_PER_EPISODE}",
+            'PlaySessionId': f"session{stream}",
+            'PlaybackPositionTicks': position,
+            'RunTimeTicks': RUNTIME_TICKS,
+            'NotificationUsername': f"user{stream % 7}",
+            'ClientName': 'Jellyfin Web',
+            'DeviceName': 'Browser',
+        }).encode())
+    return payloads
+
+
+def run(label, payloads):
+    playback_sessions._tracker = playback_sessions.SessionTracker()
+    queued = []
+    # Count rule runs as they are handed to intake; nothing consumes them
+    intake.submit = lambda kind, payload, key=None: queued.append(kind)
+    app = webhook_listener.app.wsgi_app
+    environs = [EnvironBuilder(path='/jellyfin-webhook', method='POST', data=payload,
+                               content_type='application/json').get_environ() for payload in payloads]
+
+    def start_response(status, headers):
+        pass
+
+    started = time.perf_counter()
+    for environ in environs:
+        b''.join(app(environ, start_response))
+    elapsed = time.perf_counter() - started
+    print(f"  {label:<22} {len(payloads) / elapsed:10.0f} events/s   {len(queued)} rule runs queued")
+    return len(payloads) / elapsed
+
+
+def main(events=20000, streams=50):
+    # Log to the file as in production, but keep the console quiet
+    for handler in list(webhook_listener.app.logger.handlers):
+        if not isinstance(handler, logging.FileHandler):
+            webhook_listener.app.logger.removeHandler(handler)
+    logging.getLogger().handlers.clear()
+    payloads = progress_payloads(events, streams)
+    print(f"{events} progress ticks across {streams} streams")
+    fast = run("fast path", payloads)
+    screen = playback_sessions.screen
+    playback_sessions.screen = lambda raw: None
+    try:
+        full = run("full decode", payloads)
+    finally:
+        playback_sessions.screen = screen
+    print(f"  speedup {fast / full:.1f}x")
+
+    started = time.perf_counter()
+    for payload in payloads:
+        screen(payload)
+    print(f"  screen() alone        {events / (time.perf_counter() - started):10.0f} events/s")
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:3]))
@@ -0,0 +1,142 @@
+import os
+import copy
+import json
+import logging
+import tempfile
+import threading
+import rules
+
+logger = logging.getLogger(__name__)
+
+# Used until config.json is first saved
+DEFAULT_CONFIG = {
+    'services': {},
+    'rules': {
+        '1n1': {
+            'get_option': '1',
+            'action_option': 'search',
+            'keep_watched': '1',
+            'monitor_watched': False,
+            'series': []
+        }
+    },
+    'default_rule': '1n1'
+}
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def _normalize(config):
+    """Fill in keys older config files don't have."""
+    config.setdefault('rules', {})
+    config.setdefault('services', {})
+    # Ensure default rule is '1n1' if not explicitly specified
+    config.setdefault('default_rule', '1n1')
+    return config
+
+
+class ConfigStore:
+    """
+    config.json held in memory, re-read only when the file's mtime, inode or size changes.
+
+    get() returns a shared snapshot that callers must not modify; changes go
+    through update(), which serializes writers and writes the file atomically.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.RLock()
+        self._key = None
+        self._config = None
+        self._rule_set = None
+
+    def _file_key(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_mtime_ns, stat.st_ino, stat.st_size)
+
+    def _reload_if_changed(self):
+        # Caller holds _lock
+        key = self._file_key()
+        if self._config is not None and key == self._key:
+            return
+        if key is None:
+            config = copy.deepcopy(DEFAULT_CONFIG)
+        else:
+            with open(self.path, 'r') as file:
+                config = _normalize(json.load(file))
+            if self._config is not None:
+                logger.info(f"Reloaded {self.path} after it changed on disk")
+        self._key, self._config, self._rule_set = key, config, None
+
+    def get(self):
+        """The current config (read-only)."""
+        with self._lock:
+            self._reload_if_changed()
+            return self._config
+
+    def rule_set(self):
+        """Compiled rules for the current config, rebuilt only when it changes."""
+        with self._lock:
+            self._reload_if_changed()
+            if self._rule_set is None:
+                self._rule_set = rules.RuleSet(self._config)
+            return self._rule_set
+
+    def update(self, change):
+        """
+        Apply change(config) to a copy of the latest config and save it.
+
+        Writers are serialized, and the file is re-read first if another process
+        changed it, so concurrent updates aren't lost.
+
+        :param change: Function modifying the config in place; its return value is passed back
+        """
+        with self._lock:
+            self._reload_if_changed()
+            config = copy.deepcopy(self._config)
+            result = change(config)
+            self._write(config)
+            return result
+
+    def save(self, config):
+        """Replace the whole config."""
+        with self._lock:
+            self._write(_normalize(copy.deepcopy(config)))
+
+    def _write(self, config):
+        # Caller holds _lock. Write a temp file in the same directory, then rename it over
+        # config.json so a crash mid-write leaves the old file intact
+        directory = os.path.dirname(self.path) or '.'
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.config-', suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'w') as file:
+                json.dump(config, file, indent=4)
+                file.flush()
+                os.fsync(file.fileno())
+            try:
+                os.chmod(tmp_path, os.stat(self.path).st_mode & 0o777)
+            except FileNotFoundError:
+                os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, self.path)
+        except BaseException:
+            try:
+                os.unlink(tmp_path)
+            except OSError:
+                pass
+            raise
+        self._key, self._config, self._rule_set = self._file_key(), config, None
+
+
+def get_store(path):
+    """The shared store for a config file path."""
+    path = os.path.abspath(path)
+    with _stores_lock:
+        store = _stores.get(path)
+        if store is None:
+            store = _stores[path] = ConfigStore(path)
+        return store
@@ -0,0 +1,289 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from api_client import sonarr
+import library_mirror
+
+# Episode file deletions are queued here instead of running mid-stream. The
+# queue drains fully once no playback has been seen for PLAYBACK_IDLE_SECONDS;
+# while something is playing it drains at the configured rate (0 = wait for idle).
+# File sizes for the byte rate come from the library mirror, or from Sonarr's
+# episode files for the series when the mirror is off.
+#
+# Playback is only seen through Jellyfin progress ticks and the playback
+# worker. Tautulli/Plex send a single trigger per episode, so PLAYBACK_IDLE_SECONDS
+# after that trigger the queue counts as idle even if the episode is still
+# playing; raise it past a typical episode length if that matters.
+#
+# Rows are claimed (removed) before Sonarr is called, so a cancel() can't race a
+# deletion already under way. Failed files go back on the queue unless they were
+# cancelled meanwhile; files claimed when the process dies are kept.
+DEFERRED_DELETION = os.getenv('DEFERRED_DELETION', 'true').lower() == 'true'
+DELETION_QUEUE_PATH = os.getenv('DELETION_QUEUE_PATH', '/app/config/deletion_queue.db')
+PLAYBACK_IDLE_SECONDS = float(os.getenv('PLAYBACK_IDLE_SECONDS', 300))
+DELETION_FILES_PER_MINUTE = float(os.getenv('DELETION_FILES_PER_MINUTE', 0))
+DELETION_BYTES_PER_MINUTE = float(os.getenv('DELETION_BYTES_PER_MINUTE', 0))
+DELETION_DRAIN_INTERVAL = float(os.getenv('DELETION_DRAIN_INTERVAL', 30))
+DELETION_BATCH_SIZE = int(os.getenv('DELETION_BATCH_SIZE', 100))
+DELETION_MAX_ATTEMPTS = int(os.getenv('DELETION_MAX_ATTEMPTS', 5))
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS pending_deletions (
+    episode_file_id INTEGER PRIMARY KEY,
+    series_id INTEGER,
+    size INTEGER,
+    queued_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    last_error TEXT
+);
+"""
+
+_local = threading.local()
+_write_lock = threading.Lock()
+_wakeup = threading.Event()
+_drainer = None
+_drainer_lock = threading.Lock()
+_last_playback_at = 0.0
+_in_flight = {}   # episode_file_id -> claimed row, guarded by _write_lock
+_budget = {'files': 0.0, 'bytes': 0.0, 'updated': time.monotonic()}
+
+
+def is_enabled():
+    return DEFERRED_DELETION
+
+
+def _connect():
+    """Per-thread connection to the queue database."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        os.makedirs(os.path.dirname(DELETION_QUEUE_PATH) or '.', exist_ok=True)
+        conn = sqlite3.connect(DELETION_QUEUE_PATH, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(SCHEMA)
+        _local.conn = conn
+    return conn
+
+
+def note_playback():
+    """Record that something is being played right now."""
+    global _last_playback_at
+    _last_playback_at = time.monotonic()
+
+
+def playback_idle():
+    return time.monotonic() - _last_playback_at >= PLAYBACK_IDLE_SECONDS
+
+
+def enqueue(episode_file_ids, series_id=None):
+    """
+    Queue episode files for deletion.
+
+    :param episode_file_ids: Episode file IDs to delete
+    :param series_id: Sonarr series ID the files belong to
+    :return: True if queued, False if the queue is unavailable (caller should delete now)
+    """
+    if not episode_file_ids:
+        return True
+    now = time.time()
+    sizes = _file_sizes(episode_file_ids, series_id)
+    rows = [(int(episode_file_id), series_id, sizes.get(int(episode_file_id)), now)
+            for episode_file_id in episode_file_ids]
+    try:
+        with _write_lock:
+            conn = _connect()
+            with conn:
+                conn.executemany(
+                    "INSERT OR IGNORE INTO pending_deletions (episode_file_id, series_id, size, queued_at) "
+                    "VALUES (?, ?, ?, ?)", rows
+                )
+    except sqlite3.Error as e:
+        logger.error(f"Deletion queue unavailable, deleting immediately: {str(e)}")
+        return False
+    logger.info(f"Queued {len(rows)} episode files for deferred deletion: {list(episode_file_ids)}")
+    start()
+    _wakeup.set()
+    return True
+
+
+def _file_sizes(episode_file_ids, series_id):
+    """
+    {episode_file_id: size} from the library mirror, else from Sonarr when the byte limit needs them.
+
+    Without a size a file doesn't count against DELETION_BYTES_PER_MINUTE.
+    """
+    sizes = {}
+    for episode_file_id in episode_file_ids:
+        episode_file = library_mirror.get_episode_file(episode_file_id)
+        if episode_file and episode_file.get('size') is not None:
+            sizes[int(episode_file_id)] = episode_file['size']
+    missing = [int(i) for i in episode_file_ids if int(i) not in sizes]
+    if not missing or not DELETION_BYTES_PER_MINUTE:
+        return sizes
+    if series_id:
+        try:
+            response = sonarr.get("/api/v3/episodefile", params={'seriesId': series_id})
+            if response.ok:
+                sizes.update((f['id'], f.get('size')) for f in response.json() if f.get('id') in missing)
+        except Exception as e:
+            logger.warning(f"Could not read episode file sizes for series {series_id}: {str(e)}")
+    unknown = [i for i in missing if sizes.get(i) is None]
+    if unknown:
+        logger.warning(f"Sizes of episode files {unknown} are unknown; they aren't held to DELETION_BYTES_PER_MINUTE")
+    return sizes
+
+
+def cancel(episode_file_ids):
+    """Drop queued deletions for files a rule wants to keep again."""
+    ids = [int(i) for i in episode_file_ids or [] if i]
+    if not ids:
+        return
+    placeholders = ','.join('?' * len(ids))
+    try:
+        with _write_lock:
+            conn = _connect()
+            with conn:
+                cancelled = conn.execute(
+                    f"DELETE FROM pending_deletions WHERE episode_file_id IN ({placeholders})", ids
+                ).rowcount
+            # Deletions already under way can't be stopped, but won't be retried
+            for episode_file_id in ids:
+                _in_flight.pop(episode_file_id, None)
+    except sqlite3.Error as e:
+        logger.error(f"Failed to cancel queued deletions: {str(e)}")
+        return
+    if cancelled:
+        logger.info(f"Cancelled {cancelled} queued deletions for files that are kept again")
+
+
+def stats():
+    try:
+        count, size = _connect().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM pending_deletions"
+        ).fetchone()
+    except sqlite3.Error:
+        count, size = None, None
+    return {
+        'enabled': is_enabled(),
+        'pending': count,
+        'pending_bytes': size,
+        'playback_idle': playback_idle()
+    }
+
+
+def _refill_budget():
+    """Per-minute allowances accrue while playback is active, capped at one minute's worth."""
+    now = time.monotonic()
+    minutes = (now - _budget['updated']) / 60
+    _budget['updated'] = now
+    _budget['files'] = min(DELETION_FILES_PER_MINUTE, _budget['files'] + minutes * DELETION_FILES_PER_MINUTE)
+    _budget['bytes'] = min(DELETION_BYTES_PER_MINUTE, _budget['bytes'] + minutes * DELETION_BYTES_PER_MINUTE)
+
+
+def _due_batch():
+    """
+    Claim the queued files to delete now, honouring the rate limits while playback is active.
+
+    Claimed rows are removed from the queue and held in _in_flight until drain_once settles them.
+    """
+    with _write_lock:
+        conn = _connect()
+        rows = conn.execute(
+            "SELECT episode_file_id, series_id, size, queued_at, attempts FROM pending_deletions "
+            "WHERE next_attempt_at <= ? ORDER BY queued_at LIMIT ?", (time.time(), DELETION_BATCH_SIZE)
+        ).fetchall()
+        batch = _within_budget(rows)
+        if batch:
+            placeholders = ','.join('?' * len(batch))
+            with conn:
+                conn.execute(f"DELETE FROM pending_deletions WHERE episode_file_id IN ({placeholders})", batch)
+            claimed = set(batch)
+            _in_flight.update((row[0], row) for row in rows if row[0] in claimed)
+    return batch
+
+
+def _within_budget(rows):
+    """IDs of the rows that may be deleted now."""
+    _refill_budget()
+    if playback_idle():
+        return [row[0] for row in rows]
+    if not DELETION_FILES_PER_MINUTE and not DELETION_BYTES_PER_MINUTE:
+        return []
+
+    batch = []
+    for episode_file_id, _, size, _, _ in rows:
+        if DELETION_FILES_PER_MINUTE and _budget['files'] < 1:
+            break
+        if DELETION_BYTES_PER_MINUTE and size and _budget['bytes'] < size:
+            break
+        batch.append(episode_file_id)
+        if DELETION_FILES_PER_MINUTE:
+            _budget['files'] -= 1
+        if DELETION_BYTES_PER_MINUTE and size:
+            _budget['bytes'] -= size
+    return batch
+
+
+def drain_once():
+    """Delete whatever is due; returns the number of files deleted."""
+    batch = _due_batch()
+    if not batch:
+        return 0
+
+    # Imported lazily: servertosonarr reads config and sets up logging on import
+    from servertosonarr import delete_episodes_in_sonarr, DeletionResult
+    try:
+        result = delete_episodes_in_sonarr(batch)
+    except Exception as e:
+        # The rows are already claimed; put the whole batch back for a retry
+        logger.error(f"Deferred deletion of {batch} failed: {str(e)}")
+        result = DeletionResult(failed=dict.fromkeys(batch, str(e)))
+
+    now = time.time()
+    with _write_lock:
+        rows = {episode_file_id: _in_flight.pop(episode_file_id, None) for episode_file_id in batch}
+        conn = _connect()
+        with conn:
+            for episode_file_id, reason in result.failed.items():
+                row = rows.get(episode_file_id)
+                if row is None:
+                    # Cancelled while the deletion was under way
+                    continue
+                _, series_id, size, queued_at, attempts = row
+                attempts += 1
+                if attempts >= DELETION_MAX_ATTEMPTS:
+                    logger.error(f"Giving up deleting episode file {episode_file_id} after {attempts} attempts: {reason}")
+                    continue
+                conn.execute(
+                    "INSERT OR REPLACE INTO pending_deletions (episode_file_id, series_id, size, queued_at, "
+                    "attempts, next_attempt_at, last_error) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (episode_file_id, series_id, size, queued_at, attempts,
+                     now + min(3600, 60 * 2 ** attempts), reason)
+                )
+    return len(result.deleted)
+
+
+def _run():
+    while True:
+        _wakeup.wait(DELETION_DRAIN_INTERVAL)
+        _wakeup.clear()
+        try:
+            drain_once()
+        except Exception as e:
+            logger.error(f"Deferred deletion drain failed: {str(e)}", exc_info=True)
+
+
+def start():
+    """Start the drain thread if deferred deletion is enabled."""
+    global _drainer
+    if not is_enabled():
+        return
+    with _drainer_lock:
+        if _drainer is None or not _drainer.is_alive():
+            _drainer = threading.Thread(target=_run, name='deferred-deletion', daemon=True)
+            _drainer.start()
+            logger.info(f"Deferred deletion queue at {DELETION_QUEUE_PATH}")
@@ -1,15 +1,20 @@
 import os
 import json
 import time
-import requests
 import logging
 import threading
 import re
-import asyncio
-import websockets
+import telebot
+from telebot import types, apihelper
 from logging.handlers import RotatingFileHandler
 from flask import Flask, request, jsonify
 from dotenv import load_dotenv
+from api_client import sonarr, overseerr, telegram_session, DeadlineExceeded
+import series_catalog
+import title_index
+import search_coalescer
+import library_mirror
+import episode_cache
 
 
 # Load environment variables
@@ -50,13 +55,15 @@ logger.addHandler(console_handler)
 # Sonarr connection details
 SONARR_URL = os.getenv('SONARR_URL', 'http://sonarr:8989')
 SONARR_API_KEY = os.getenv('SONARR_API_KEY')
-SONARR_WS_URL = os.getenv('SONARR_WS_URL', 'ws://sonarr:8989/api/v3/notification')
 
 # Telegram connection details
 TELEGRAM_TOKEN = os.getenv('TELEGRAM_TOKEN')
 TELEGRAM_CHAT_ID = os.getenv('TELEGRAM_CHAT_ID')
 TELEGRAM_ADMIN_IDS = [int(id.strip()) for id in os.getenv('TELEGRAM_ADMIN_IDS', '').split(',') if id.strip()]
 
+# Route Telegram Bot API calls through the shared keep-alive pool
+apihelper.session = telegram_session
+
 # Initialize Telegram bot
 if TELEGRAM_TOKEN:
     bot = telebot.TeleBot(TELEGRAM_TOKEN)
@@ -69,70 +76,13 @@ else:
 # Format: {series_id: {'title': 'Series Title', 'season': 1, 'episodes': [1, 2, 3, ...]}}
 pending_selections = {}
 
-def get_sonarr_headers():
-    """Get headers for Sonarr API requests."""
-    return {
-        'X-Api-Key': SONARR_API_KEY,
-        'Content-Type': 'application/json'
-    }
-async def monitor_sonarr_queue():
-    """
-    Monitor Sonarr's WebSocket for queue events and cancel 
-    unmonitored downloads for specific seasons.
-    """
-    headers = get_sonarr_headers()
-    logger.info(f"Starting WebSocket monitoring with URL: {SONARR_WS_URL}")
-    logger.info(f"WebSocket Headers: {headers}")
-    
-    # Construct WebSocket headers
-    ws_headers = {
-        "X-Api-Key": SONARR_API_KEY
-    }
-    
-    try:
-        # Log connection details
-        logger.info("Attempting to connect to WebSocket...")
-        async with websockets.connect(
-            SONARR_WS_URL, 
-            extra_headers=ws_headers, 
-            ping_interval=20,  # Send ping every 20 seconds
-            ping_timeout=10    # Wait 10 seconds for pong
-        ) as websocket:
-            logger.info("WebSocket connection established successfully")
-            
-            while True:
-                try:
-                    logger.debug("Waiting to receive WebSocket message...")
-                    message = await websocket.recv()
-                    logger.debug(f"Received WebSocket message: {message}")
-                    
-                    data = json.loads(message)
-                    logger.debug(f"Parsed WebSocket data: {data}")
-                    
-                    # Existing monitoring logic...
-                    
-                except json.JSONDecodeError:
-                    logger.warning("Received invalid JSON from WebSocket")
-                except Exception as e:
-                    logger.error(f"Error processing WebSocket message: {str(e)}")
-                
-    except Exception as e:
-        logger.error(f"WebSocket connection error: {str(e)}")
-        # Attempt to reconnect
-        await asyncio.sleep(5)
-        await monitor_sonarr_queue()
-        
 def create_episode_tag():
     """Create a single 'episodes' tag in Sonarr."""
     try:
-        headers = get_sonarr_headers()
         logger.debug(f"Making request to {SONARR_URL}/api/v3/tag")
         
         # Get existing tags
-        tags_response = requests.get(
-            f"{SONARR_URL}/api/v3/tag",
-            headers=headers
-        )
+        tags_response = sonarr.get("/api/v3/tag")
         
         if not tags_response.ok:
             logger.error(f"Failed to get tags. Status: {tags_response.status_code}")
@@ -142,9 +92,8 @@ def create_episode_tag():
         
         # Create episodes tag if it doesn't exist
         if 'episodes' not in existing_tags:
-            tag_create_response = requests.post(
-                f"{SONARR_URL}/api/v3/tag",
-                headers=headers,
+            tag_create_response = sonarr.post(
+                "/api/v3/tag",
                 json={"label": "episodes"}
             )
             if tag_create_response.ok:
@@ -160,14 +109,11 @@ def create_episode_tag():
         logger.error(f"Error creating episode tag: {str(e)}")
         return False
 
-def unmonitor_season(series_id, season_number, headers):
+def unmonitor_season(series_id, season_number):
     """Unmonitor all episodes in a specific season."""
     try:
         # Get episodes for the specific season
-        episodes_response = requests.get(
-            f"{SONARR_URL}/api/v3/episode?seriesId={series_id}&seasonNumber={season_number}",
-            headers=headers
-        )
+        episodes_response = sonarr.get(f"/api/v3/episode?seriesId={series_id}&seasonNumber={season_number}")
         
         if not episodes_response.ok:
             logger.error(f"Failed to get episodes. Status: {episodes_response.status_code}")
@@ -177,9 +123,8 @@ def unmonitor_season(series_id, season_number, headers):
         season_episode_ids = [ep['id'] for ep in episodes]
         
         if season_episode_ids:
-            unmonitor_response = requests.put(
-                f"{SONARR_URL}/api/v3/episode/monitor",
-                headers=headers,
+            unmonitor_response = sonarr.put(
+                "/api/v3/episode/monitor",
                 json={"episodeIds": season_episode_ids, "monitored": False}
             )
             
@@ -188,6 +133,8 @@ def unmonitor_season(series_id, season_number, headers):
                 return False
             else:
                 logger.info(f"Unmonitored all episodes in series ID {series_id} season {season_number}")
+                library_mirror.set_monitored(season_episode_ids, False)
+                episode_cache.set_monitored(season_episode_ids, False)
                 return True
         else:
             logger.info(f"No episodes found for series ID {series_id} season {season_number}")
@@ -197,14 +144,11 @@ def unmonitor_season(series_id, season_number, headers):
         logger.error(f"Error unmonitoring season: {str(e)}", exc_info=True)
         return False
     
-def blocklist_season_episodes(series_id, season_number, headers):
+def blocklist_season_episodes(series_id, season_number):
     """Blocklist all episodes in a specific season."""
     try:
         # Get episodes for the specific season
-        episodes_response = requests.get(
-            f"{SONARR_URL}/api/v3/episode?seriesId={series_id}&seasonNumber={season_number}",
-            headers=headers
-        )
+        episodes_response = sonarr.get(f"/api/v3/episode?seriesId={series_id}&seasonNumber={season_number}")
         
         if not episodes_response.ok:
             logger.error(f"Failed to get episodes for blocklisting. Status: {episodes_response.status_code}")
@@ -216,7 +160,7 @@ def blocklist_season_episodes(series_id, season_number, headers):
             return True
         
         # Get series title for the blocklist entry
-        series_title = get_series_title(series_id, headers)
+        series_title = get_series_title(series_id)
         
         # Create a single blocklist entry for the whole season
         # This is more efficient than creating one per episode
@@ -230,9 +174,8 @@ def blocklist_season_episodes(series_id, season_number, headers):
                 "message": "Season blocklisted by EpisEERR"
             }
             
-            blocklist_response = requests.post(
-                f"{SONARR_URL}/api/v3/blocklist",
-                headers=headers,
+            blocklist_response = sonarr.post(
+                "/api/v3/blocklist",
                 json=blocklist_data
             )
             
@@ -250,14 +193,11 @@ def blocklist_season_episodes(series_id, season_number, headers):
         logger.error(f"Error blocklisting season: {str(e)}", exc_info=True)
         return False
 
-def unblock_episodes(series_id, season_number, episode_numbers, headers):
+def unblock_episodes(series_id, season_number, episode_numbers):
     """Unblock specific episodes in a season."""
     try:
         # Get blocklist entries
-        blocklist_response = requests.get(
-            f"{SONARR_URL}/api/v3/blocklist",
-            headers=headers
-        )
+        blocklist_response = sonarr.get("/api/v3/blocklist")
         
         if not blocklist_response.ok:
             logger.error(f"Failed to get blocklist. Status: {blocklist_response.status_code}")
@@ -266,10 +206,7 @@ def unblock_episodes(series_id, season_number, episode_numbers, headers):
         blocklist = blocklist_response.json().get('records', [])
         
         # Get episodes for the specific season to match IDs
-        episodes_response = requests.get(
-            f"{SONARR_URL}/api/v3/episode?seriesId={series_id}&seasonNumber={season_number}",
-            headers=headers
-        )
+        episodes_response = sonarr.get(f"/api/v3/episode?seriesId={series_id}&seasonNumber={season_number}")
         
         if not episodes_response.ok:
             logger.error(f"Failed to get episodes for unblocking. Status: {episodes_response.status_code}")
@@ -300,10 +237,7 @@ def unblock_episodes(series_id, season_number, episode_numbers, headers):
         
         # Delete the found blocklist entries
         for entry_id in entries_to_delete:
-            delete_response = requests.delete(
-                f"{SONARR_URL}/api/v3/blocklist/{entry_id}",
-                headers=headers
-            )
+            delete_response = sonarr.delete(f"/api/v3/blocklist/{entry_id}")
             
             if delete_response.ok:
                 logger.debug(f"Deleted blocklist entry {entry_id}")
@@ -317,19 +251,13 @@ def unblock_episodes(series_id, season_number, episode_numbers, headers):
         logger.error(f"Error unblocking episodes: {str(e)}", exc_info=True)
         return False
 
-def unblock_remaining_episodes(series_id, season_number, already_unblocked, headers=None):
+def unblock_remaining_episodes(series_id, season_number, already_unblocked):
     """Unblock remaining episodes after a delay, keeping them unmonitored."""
-    if not headers:
-        headers = get_sonarr_headers()
-        
     try:
         logger.info(f"Running scheduled unblock for remaining episodes in series {series_id} season {season_number}")
         
         # Get all episodes for the season
-        episodes_response = requests.get(
-            f"{SONARR_URL}/api/v3/episode?seriesId={series_id}&seasonNumber={season_number}",
-            headers=headers
-        )
+        episodes_response = sonarr.get(f"/api/v3/episode?seriesId={series_id}&seasonNumber={season_number}")
         
         if not episodes_response.ok:
             logger.error(f"Failed to get episodes for cleanup unblock. Status: {episodes_response.status_code}")
@@ -348,7 +276,7 @@ def unblock_remaining_episodes(series_id, season_number, already_unblocked, head
             return True
             
         # Unblock these episodes (but they remain unmonitored)
-        unblock_episodes(series_id, season_number, remaining_episode_numbers, headers)
+        unblock_episodes(series_id, season_number, remaining_episode_numbers)
         
         logger.info(f"Completed scheduled unblock for {len(remaining_episode_numbers)} episodes")
         return True
@@ -357,10 +285,10 @@ def unblock_remaining_episodes(series_id, season_number, already_unblocked, head
         logger.error(f"Error in scheduled unblocking: {str(e)}", exc_info=True)
         return False
     
-def get_episode_info(episode_id, headers):
+def get_episode_info(episode_id):
     """Get episode information from Sonarr API"""
     try:
-        response = requests.get(f"{SONARR_URL}/api/v3/episode/{episode_id}", headers=headers)
+        response = sonarr.get(f"/api/v3/episode/{episode_id}")
         if response.ok:
             return response.json()
         return None
@@ -368,10 +296,10 @@ def get_episode_info(episode_id, headers):
         logger.error(f"Error getting episode info: {str(e)}")
         return None
 
-def get_series_title(series_id, headers):
+def get_series_title(series_id):
     """Get series title from Sonarr API"""
     try:
-        response = requests.get(f"{SONARR_URL}/api/v3/series/{series_id}", headers=headers)
+        response = sonarr.get(f"/api/v3/series/{series_id}")
         if response.ok:
             return response.json().get('title', 'Unknown Series')
         return 'Unknown Series'
@@ -388,13 +316,9 @@ def process_episode_selection(series_id, episode_numbers):
     """
     try:
         series_id = int(series_id)
-        headers = get_sonarr_headers()
         
         # Get series info
-        series_response = requests.get(
-            f"{SONARR_URL}/api/v3/series/{series_id}",
-            headers=headers
-        )
+        series_response = sonarr.get(f"/api/v3/series/{series_id}")
         
         if not series_response.ok:
             logger.error(f"Failed to get series. Status: {series_response.status_code}")
@@ -406,7 +330,7 @@ def process_episode_selection(series_id, episode_numbers):
         logger.info(f"Processing episode selection for {series['title']} Season {season_number}: {episode_numbers}")
         
         # Get episode IDs for searching
-        episodes = get_series_episodes(series_id, season_number, headers)
+        episodes = get_series_episodes(series_id, season_number)
         
         if not episodes:
             logger.error(f"No episodes found for series {series_id} season {season_number}")
@@ -430,8 +354,7 @@ def process_episode_selection(series_id, episode_numbers):
         monitor_success = monitor_specific_episodes(
             series_id, 
             season_number, 
-            valid_episode_numbers, 
-            headers
+            valid_episode_numbers
         )
         
         if not monitor_success:
@@ -454,7 +377,7 @@ def process_episode_selection(series_id, episode_numbers):
         logger.info(f"Episode IDs for search: {episode_ids}")
         
         # Trigger search for the episodes
-        search_success = search_episodes(series_id, episode_ids, headers)
+        search_success = search_episodes(series_id, episode_ids)
         
         if search_success:
             logger.info(f"Successfully set up monitoring and search for {len(valid_episode_numbers)} episodes")
@@ -477,7 +400,7 @@ def process_episode_selection(series_id, episode_numbers):
         logger.error(f"Error processing episode selection: {str(e)}", exc_info=True)
         return False
         
-def cancel_download(queue_id, headers):
+def cancel_download(queue_id):
     """Cancel a download in Sonarr's queue with multiple methods"""
     try:
         # Primary method: Bulk remove with client removal
@@ -487,14 +410,13 @@ def cancel_download(queue_id, headers):
             "removeFromDownloadClient": True,
             "blocklist": True
         }
-        response = requests.delete(f"{SONARR_URL}/api/v3/queue/bulk", headers=headers, json=payload)
+        response = sonarr.delete("/api/v3/queue/bulk", json=payload)
         
         # If primary method fails, try alternative
         if not response.ok:
             logger.warning(f"Bulk removal failed for queue item {queue_id}. Trying alternative method.")
-            response = requests.delete(
-                f"{SONARR_URL}/api/v3/queue/{queue_id}", 
-                headers=headers,
+            response = sonarr.delete(
+                f"/api/v3/queue/{queue_id}",
                 params={
                     "removeFromClient": "true",
                     "blocklist": "true"
@@ -506,21 +428,17 @@ def cancel_download(queue_id, headers):
         logger.error(f"Error cancelling download: {str(e)}")
         return False
 
-def monitor_specific_episodes(series_id, season_number, episode_numbers, headers):
+def monitor_specific_episodes(series_id, season_number, episode_numbers):
     """
     Monitor specific episodes in a series season.
     
     :param series_id: Sonarr series ID
     :param season_number: Season number
     :param episode_numbers: List of episode numbers to monitor
-    :param headers: Sonarr API headers
     :return: True if successful, False otherwise
     """
     try:
-        episodes_response = requests.get(
-            f"{SONARR_URL}/api/v3/episode?seriesId={series_id}",
-            headers=headers
-        )
+        episodes_response = sonarr.get(f"/api/v3/episode?seriesId={series_id}")
         
         if not episodes_response.ok:
             logger.error(f"Failed to get episodes. Status: {episodes_response.status_code}")
@@ -538,9 +456,8 @@ def monitor_specific_episodes(series_id, season_number, episode_numbers, headers
             return False
         
         monitor_episode_ids = [ep['id'] for ep in target_episodes]
-        monitor_response = requests.put(
-            f"{SONARR_URL}/api/v3/episode/monitor",
-            headers=headers,
+        monitor_response = sonarr.put(
+            "/api/v3/episode/monitor",
             json={"episodeIds": monitor_episode_ids, "monitored": True}
         )
         
@@ -549,19 +466,20 @@ def monitor_specific_episodes(series_id, season_number, episode_numbers, headers
             return False
         else:
             logger.info(f"Monitoring episodes {episode_numbers} in season {season_number}")
+            library_mirror.set_monitored(monitor_episode_ids, True)
+            episode_cache.set_monitored(monitor_episode_ids, True)
             return True
     
     except Exception as e:
         logger.error(f"Error monitoring specific episodes: {str(e)}", exc_info=True)
         return False
 
-def search_episodes(series_id, episode_ids, headers):
+def search_episodes(series_id, episode_ids):
     """
     Trigger a search for specific episodes in Sonarr.
     
     :param series_id: Sonarr series ID
     :param episode_ids: List of episode IDs to search for
-    :param headers: Sonarr API headers
     :return: True if successful, False otherwise
     """
     try:
@@ -570,44 +488,27 @@ def search_episodes(series_id, episode_ids, headers):
             return False
             
         logger.info(f"Searching for episodes: {episode_ids}")
-            
-        search_payload = {
-            "name": "EpisodeSearch",
-            "episodeIds": episode_ids
-        }
         
-        search_response = requests.post(
-            f"{SONARR_URL}/api/v3/command",
-            headers=headers,
-            json=search_payload
-        )
-        
-        if search_response.ok:
-            logger.info(f"Triggered search for episodes {episode_ids}")
-            return True
-        else:
-            logger.error(f"Failed to trigger search. Status: {search_response.status_code}")
-            logger.error(f"Response content: {search_response.text}")
-            return False
+        # Merged with other searches in the same window and rate limited
+        return search_coalescer.request_search(episode_ids, series_id)
             
     except Exception as e:
         logger.error(f"Error searching for episodes: {str(e)}", exc_info=True)
         return False
 
-def get_series_episodes(series_id, season_number, headers):
+def get_series_episodes(series_id, season_number):
     """
     Get all episodes for a specific series and season.
     
     :param series_id: Sonarr series ID
     :param season_number: Season number
-    :param headers: Sonarr API headers
     :return: List of episodes or empty list on failure
     """
+    episodes = library_mirror.get_series_episodes(series_id, season_number)
+    if episodes is not None:
+        return episodes
     try:
-        episodes_response = requests.get(
-            f"{SONARR_URL}/api/v3/episode?seriesId={series_id}&seasonNumber={season_number}",
-            headers=headers
-        )
+        episodes_response = sonarr.get(f"/api/v3/episode?seriesId={series_id}&seasonNumber={season_number}")
         
         if not episodes_response.ok:
             logger.error(f"Failed to get episodes. Status: {episodes_response.status_code}")
@@ -619,14 +520,6 @@ def get_series_episodes(series_id, season_number, headers):
         logger.error(f"Error getting series episodes: {str(e)}", exc_info=True)
         return []
 
-def get_overseerr_headers():
-    """Get headers for Overseerr API requests."""
-    return {
-        'X-Api-Key': os.getenv('OVERSEERR_API_KEY'),
-        'Content-Type': 'application/json',
-        'Accept': 'application/json'
-    }
-
 def delete_overseerr_request(request_id):
     """
     Delete a specific request in Overseerr.
@@ -635,16 +528,10 @@ def delete_overseerr_request(request_id):
     :return: True if successful, False otherwise
     """
     try:
-        overseerr_url = os.getenv('OVERSEERR_URL')
-        headers = get_overseerr_headers()
-        
         # Log the deletion attempt
         logger.info(f"Attempting to delete Jellyseerr request {request_id}")
         
-        delete_response = requests.delete(
-            f"{overseerr_url}/api/v1/request/{request_id}",
-            headers=headers
-        )
+        delete_response = overseerr.delete(f"/api/v1/request/{request_id}")
         
         # Log full response for debugging
         logger.debug(f"Delete Request Response Status: {delete_response.status_code}")
@@ -1139,18 +1026,15 @@ def handle_multi_episode_request(message, match):
         )
         
         # Search for the show in Sonarr
-        headers = get_sonarr_headers()
-        response = requests.get(f"{SONARR_URL}/api/v3/series", headers=headers)
+        series_list = series_catalog.get_all_series()
         
-        if not response.ok:
+        if series_list is None:
             bot.edit_message_text(
-                f"❌ Error: Failed to connect to Sonarr. Status: {response.status_code}",
+                "❌ Error: Failed to connect to Sonarr.",
                 reply.chat.id,
                 reply.message_id
             )
             return
-            
-        series_list = response.json()
         
         # Look for the show by title (fuzzy match)
         matching_series = find_matching_series(show_title, series_list)
@@ -1188,7 +1072,7 @@ def handle_multi_episode_request(message, match):
             # No need to unmonitor the season or cancel downloads for direct requests
             
             # Get episodes for the season
-            episodes = get_series_episodes(series_id, season, headers)
+            episodes = get_series_episodes(series_id, season)
             
             if not episodes:
                 results.append(f"❌ Season {season}: No episodes found")
@@ -1208,8 +1092,7 @@ def handle_multi_episode_request(message, match):
             monitor_success = monitor_specific_episodes(
                 series_id,
                 season,
-                valid_episode_numbers,
-                headers
+                valid_episode_numbers
             )
             
             if not monitor_success:
@@ -1223,7 +1106,7 @@ def handle_multi_episode_request(message, match):
             ]
             
             # Trigger search for the episodes
-            search_success = search_episodes(series_id, episode_ids, headers)
+            search_success = search_episodes(series_id, episode_ids)
             
             if search_success:
                 results.append(f"✅ Season {season}: Episodes {', '.join(str(e) for e in sorted(valid_episode_numbers))} processed")
@@ -1271,18 +1154,15 @@ def handle_direct_request(message, match):
         )
         
         # Search for the show in Sonarr
-        headers = get_sonarr_headers()
-        response = requests.get(f"{SONARR_URL}/api/v3/series", headers=headers)
+        series_list = series_catalog.get_all_series()
         
-        if not response.ok:
+        if series_list is None:
             bot.edit_message_text(
-                f"❌ Error: Failed to connect to Sonarr. Status: {response.status_code}",
+                "❌ Error: Failed to connect to Sonarr.",
                 reply.chat.id,
                 reply.message_id
             )
             return
-            
-        series_list = response.json()
         
         # Look for the show by title (fuzzy match)
         matching_series = find_matching_series(show_title, series_list)
@@ -1313,7 +1193,7 @@ def handle_direct_request(message, match):
         # No need to unmonitor the season or cancel downloads for direct requests
         
         # Get episodes for the season
-        episodes = get_series_episodes(series_id, season_number, headers)
+        episodes = get_series_episodes(series_id, season_number)
         
         if not episodes:
             bot.edit_message_text(
@@ -1343,8 +1223,7 @@ def handle_direct_request(message, match):
         monitor_success = monitor_specific_episodes(
             series_id,
             season_number,
-            valid_episode_numbers,
-            headers
+            valid_episode_numbers
         )
         
         if not monitor_success:
@@ -1363,7 +1242,7 @@ def handle_direct_request(message, match):
         ]
         
         # Trigger search for the episodes
-        search_success = search_episodes(series_id, episode_ids, headers)
+        search_success = search_episodes(series_id, episode_ids)
         
         if search_success:
             # Final success message
@@ -1395,25 +1274,9 @@ def find_matching_series(title, series_list):
     :param series_list: List of series from Sonarr
     :return: Best matching series or None
     """
-    # First try exact match
-    for series in series_list:
-        if series['title'].lower() == title.lower():
-            return series
-            
-    # Try case-insensitive contains
-    contains_matches = [s for s in series_list if title.lower() in s['title'].lower()]
-    if contains_matches:
-        return contains_matches[0]
-        
-    # Try checking if all words in the query are in the title
-    query_words = set(title.lower().split())
-    for series in series_list:
-        series_words = set(series['title'].lower().split())
-        if query_words.issubset(series_words):
-            return series
-            
-    # No match found
-    return None
+    # Ranked lookup over titles and alternate titles; the index is reused
+    # until the series list changes
+    return title_index.best_match(title, series_list=series_list)
 
 def process_episode_selection(series_id, episode_numbers):
     """
@@ -1424,13 +1287,9 @@ def process_episode_selection(series_id, episode_numbers):
     """
     try:
         series_id = int(series_id)
-        headers = get_sonarr_headers()
         
         # Get series info
-        series_response = requests.get(
-            f"{SONARR_URL}/api/v3/series/{series_id}",
-            headers=headers
-        )
+        series_response = sonarr.get(f"/api/v3/series/{series_id}")
         
         if not series_response.ok:
             logger.error(f"Failed to get series. Status: {series_response.status_code}")
@@ -1442,7 +1301,7 @@ def process_episode_selection(series_id, episode_numbers):
         logger.info(f"Processing episode selection for {series['title']} Season {season_number}: {episode_numbers}")
         
         # Get episode IDs for searching
-        episodes = get_series_episodes(series_id, season_number, headers)
+        episodes = get_series_episodes(series_id, season_number)
         
         if not episodes:
             logger.error(f"No episodes found for series {series_id} season {season_number}")
@@ -1466,8 +1325,7 @@ def process_episode_selection(series_id, episode_numbers):
         monitor_success = monitor_specific_episodes(
             series_id, 
             season_number, 
-            valid_episode_numbers, 
-            headers
+            valid_episode_numbers
         )
         
         if not monitor_success:
@@ -1490,7 +1348,7 @@ def process_episode_selection(series_id, episode_numbers):
         logger.info(f"Episode IDs for search: {episode_ids}")
         
         # Trigger search for the episodes
-        search_success = search_episodes(series_id, episode_ids, headers)
+        search_success = search_episodes(series_id, episode_ids)
         
         if search_success:
             logger.info(f"Successfully set up monitoring and search for {len(valid_episode_numbers)} episodes")
@@ -1514,19 +1372,17 @@ def process_episode_selection(series_id, episode_numbers):
         return False
     
 def process_series(tvdb_id, season_number, request_id=None):
-    headers = get_sonarr_headers()
     
     for attempt in range(12):  # Max 12 attempts
         try:
             logger.info(f"Checking for series (attempt {attempt + 1}/12)")
-            response = requests.get(f"{SONARR_URL}/api/v3/series", headers=headers)
+            # Retries must see series added since the last check
+            series_list = series_catalog.get_all_series(force_refresh=attempt > 0)
             
-            if not response.ok:
-                logger.error(f"Failed to get series list. Status: {response.status_code}")
+            if series_list is None:
+                logger.error("Failed to get series list")
                 time.sleep(5)
                 continue
-
-            series_list = response.json()
             matching_series = [s for s in series_list if str(s.get('tvdbId')) == str(tvdb_id)]
             
             if not matching_series:
@@ -1539,13 +1395,13 @@ def process_series(tvdb_id, season_number, request_id=None):
             logger.info(f"Found series: {series['title']} (ID: {series_id})")
             
             # 1. Unmonitor episodes only for the requested season
-            unmonitor_success = unmonitor_season(series_id, season_number, headers)
+            unmonitor_success = unmonitor_season(series_id, season_number)
             
             
             # Send episode selection to Telegram if configured
             if bot and TELEGRAM_CHAT_ID:
                 # Get episodes for the season (we already verified season_number exists)
-                episodes = get_series_episodes(series_id, season_number, headers)
+                episodes = get_series_episodes(series_id, season_number)
                 
                 if episodes:
                     # Sort episodes by episode number
@@ -1569,6 +1425,9 @@ def process_series(tvdb_id, season_number, request_id=None):
             
             return True
             
+        except DeadlineExceeded as e:
+            logger.error(f"Gave up waiting for series with TVDB ID {tvdb_id}: {str(e)}")
+            return False
         except Exception as e:
             logger.error(f"Error during processing: {str(e)}", exc_info=True)
             
@@ -0,0 +1,158 @@
+import os
+import json
+import time
+import logging
+import threading
+from collections import OrderedDict
+from api_client import sonarr
+import library_mirror
+import event_bus
+
+# Per-series episode lists, evicted least-recently-used once the cached
+# payloads exceed EPISODE_CACHE_MAX_MB. Entries are dropped by Sonarr
+# episode/file events; the TTL only covers events we never received.
+EPISODE_CACHE_MAX_MB = float(os.getenv('EPISODE_CACHE_MAX_MB', 32))
+EPISODE_CACHE_TTL = float(os.getenv('EPISODE_CACHE_TTL', 600))
+
+logger = logging.getLogger(__name__)
+
+_entries = OrderedDict()   # series_id -> (episodes, size_bytes, cached_at)
+_episode_series = {}       # episode_id -> series_id, for event and write lookups
+_total_bytes = 0
+_hits = 0
+_misses = 0
+_lock = threading.Lock()
+
+
+def get(series_id):
+    """
+    Cached episodes for a series, or None.
+
+    The list is shared with other callers and must not be modified.
+    """
+    global _hits, _misses
+    series_id = int(series_id)
+    with _lock:
+        entry = _entries.get(series_id)
+        if entry is None or time.monotonic() - entry[2] > EPISODE_CACHE_TTL:
+            if entry is not None:
+                _drop(series_id)
+            _misses += 1
+            return None
+        _entries.move_to_end(series_id)
+        _hits += 1
+        return entry[0]
+
+
+def load(series_id):
+    """
+    Episodes for a series from the cache, else the library mirror, else Sonarr.
+
+    Whatever is loaded is cached. Returns None if Sonarr could not be reached.
+    """
+    episodes = get(series_id)
+    if episodes is not None:
+        return episodes
+    episodes = library_mirror.get_series_episodes(series_id)
+    if episodes is None:
+        response = sonarr.get("/api/v3/episode", params={'seriesId': series_id})
+        if not response.ok:
+            logger.error(f"Failed to fetch episodes for series {series_id}. Status: {response.status_code}")
+            return None
+        episodes = response.json()
+    put(series_id, episodes)
+    return episodes
+
+
+def put(series_id, episodes):
+    """Cache the full episode list for a series, evicting old entries to stay in bounds."""
+    global _total_bytes
+    series_id = int(series_id)
+    size = len(json.dumps(episodes))
+    max_bytes = EPISODE_CACHE_MAX_MB * 1024 * 1024
+    with _lock:
+        _drop(series_id)
+        if size > max_bytes:
+            return
+        _entries[series_id] = (episodes, size, time.monotonic())
+        _total_bytes += size
+        for ep in episodes:
+            _episode_series[ep['id']] = series_id
+        while _total_bytes > max_bytes:
+            evicted, _ = next(iter(_entries.items()))
+            _drop(evicted)
+            logger.debug(f"Evicted episodes for series {evicted} from cache")
+
+
+def invalidate(series_id=None):
+    """Drop one series, or everything when series_id is None."""
+    global _total_bytes
+    with _lock:
+        if series_id is None:
+            _entries.clear()
+            _episode_series.clear()
+            _total_bytes = 0
+        else:
+            _drop(int(series_id))
+
+
+def _drop(series_id):
+    # Caller holds _lock
+    global _total_bytes
+    entry = _entries.pop(series_id, None)
+    if entry is None:
+        return
+    _total_bytes -= entry[1]
+    for ep in entry[0]:
+        if _episode_series.get(ep['id']) == series_id:
+            del _episode_series[ep['id']]
+
+
+def _update(match, changes):
+    # Caller holds _lock; edits cached episodes in place to mirror a write we made
+    for episodes, _, _ in _entries.values():
+        for ep in episodes:
+            if match(ep):
+                ep.update(changes)
+
+
+def set_monitored(episode_ids, monitored):
+    """Record a monitor/unmonitor we just made in Sonarr."""
+    ids = set(episode_ids or [])
+    if not ids:
+        return
+    with _lock:
+        _update(lambda ep: ep['id'] in ids, {'monitored': bool(monitored)})
+
+
+def mark_files_deleted(episode_file_ids):
+    """Record episode files we just deleted in Sonarr."""
+    ids = set(episode_file_ids or [])
+    if not ids:
+        return
+    with _lock:
+        _update(lambda ep: ep.get('episodeFileId') in ids, {'hasFile': False, 'episodeFileId': 0})
+
+
+def stats():
+    with _lock:
+        return {
+            'series': len(_entries),
+            'bytes': _total_bytes,
+            'hits': _hits,
+            'misses': _misses
+        }
+
+
+def _on_sonarr_event(event):
+    series_id = event['series_id']
+    if event['name'] == 'episode' and not series_id:
+        with _lock:
+            series_id = _episode_series.get(event['resource'].get('id'))
+    if series_id:
+        invalidate(series_id)
+
+
+event_bus.subscribe('series', _on_sonarr_event)
+event_bus.subscribe('episode', _on_sonarr_event)
+event_bus.subscribe('episodefile', _on_sonarr_event)
@@ -0,0 +1,71 @@
+import threading
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+
+# Indexes built for recently seen episode lists; the cache hands out the same
+# list object until the series changes, so the index is reused across calls
+INDEX_CACHE_SIZE = 64
+
+_indexes = OrderedDict()   # id(episodes) -> (episodes, EpisodeIndex)
+_lock = threading.Lock()
+
+
+class EpisodeIndex:
+    """A series' episodes in (season, episode) order with O(1) lookups by ID and number."""
+
+    def __init__(self, episodes):
+        self.episodes = sorted(episodes, key=lambda ep: (ep['seasonNumber'], ep['episodeNumber']))
+        self.keys = [(ep['seasonNumber'], ep['episodeNumber']) for ep in self.episodes]
+        self.position_by_id = {ep['id']: i for i, ep in enumerate(self.episodes)}
+        self.position_by_number = {key: i for i, key in enumerate(self.keys)}
+
+    def __len__(self):
+        return len(self.episodes)
+
+    def find(self, season_number, episode_number):
+        """The episode with these numbers, or None."""
+        position = self.position_by_number.get((season_number, episode_number))
+        return None if position is None else self.episodes[position]
+
+    def get(self, episode_id):
+        position = self.position_by_id.get(episode_id)
+        return None if position is None else self.episodes[position]
+
+    def season(self, season_number):
+        """Episodes of one season, in order."""
+        return self.episodes[bisect_left(self.keys, (season_number,)):bisect_left(self.keys, (season_number + 1,))]
+
+    def after(self, season_number, episode_number, count=None):
+        """Episodes after the given numbers (which need not exist), in order."""
+        start = bisect_right(self.keys, (season_number, episode_number))
+        return self.episodes[start:] if count is None else self.episodes[start:start + count]
+
+    def from_season(self, season_number):
+        """Every episode from the start of a season onwards."""
+        return self.episodes[bisect_left(self.keys, (season_number,)):]
+
+    def before_season(self, season_number):
+        """Every episode in earlier seasons."""
+        return self.episodes[:bisect_left(self.keys, (season_number,))]
+
+    def window_ending_at(self, episode_id, size):
+        """The `size` episodes up to and including episode_id."""
+        position = self.position_by_id[episode_id]
+        return self.episodes[max(0, position - size + 1):position + 1]
+
+
+def get_index(episodes):
+    """The EpisodeIndex for an episode list, built once per list object."""
+    key = id(episodes)
+    with _lock:
+        cached = _indexes.get(key)
+        # Holding the list keeps its id from being reused while cached
+        if cached is not None and cached[0] is episodes:
+            _indexes.move_to_end(key)
+            return cached[1]
+    index = EpisodeIndex(episodes)
+    with _lock:
+        _indexes[key] = (episodes, index)
+        while len(_indexes) > INDEX_CACHE_SIZE:
+            _indexes.popitem(last=False)
+    return index
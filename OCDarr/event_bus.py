@@ -0,0 +1,58 @@
+import logging
+import threading
+from collections import defaultdict
+
+logger = logging.getLogger(__name__)
+
+# In-process publish/subscribe for Sonarr change events.
+#
+# Events are dicts with:
+#   name       - resource name: 'series', 'episode', 'episodefile', 'queue', 'command', ...
+#   action     - 'added', 'updated', 'deleted', 'sync', ...
+#   resource   - the Sonarr resource body (may be empty)
+#   series_id  - Sonarr series ID when known, else None
+#   source     - 'push' (real-time stream) or 'webhook'
+#   event_type - the Sonarr webhook eventType for webhook events
+# Handlers subscribe to a name, or to '*' for everything.
+
+_subscribers = defaultdict(list)
+_lock = threading.Lock()
+
+
+def subscribe(name, handler):
+    """Register handler(event) for events with the given name ('*' for all)."""
+    with _lock:
+        if handler not in _subscribers[name]:
+            _subscribers[name].append(handler)
+
+
+def unsubscribe(name, handler):
+    with _lock:
+        if handler in _subscribers[name]:
+            _subscribers[name].remove(handler)
+
+
+def publish(event):
+    """Deliver an event to its subscribers. A failing handler does not stop the others."""
+    with _lock:
+        handlers = list(_subscribers[event['name']]) + list(_subscribers['*'])
+    for handler in handlers:
+        try:
+            handler(event)
+        except Exception as e:
+            logger.error(f"Event handler {getattr(handler, '__name__', handler)} failed for "
+                         f"{event['name']}/{event.get('action')}: {str(e)}", exc_info=True)
+
+
+def make_event(name, action, resource=None, series_id=None, source='push', event_type=None):
+    resource = resource or {}
+    if series_id is None:
+        series_id = resource.get('seriesId') if name != 'series' else resource.get('id')
+    return {
+        'name': name,
+        'action': action,
+        'resource': resource,
+        'series_id': series_id,
+        'source': source,
+        'event_type': event_type
+    }
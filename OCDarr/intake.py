@@ -0,0 +1,344 @@
+import os
+import json
+import time
+import heapq
+import random
+import sqlite3
+import logging
+import threading
+from concurrent.futures import Future, CancelledError
+from dataclasses import dataclass
+
+# Webhooks are written here before the listener answers 202, and background
+# consumers apply them. Delivery is at-least-once: an event stays queued until
+# its handler succeeds, and is retried with backoff across restarts and
+# Sonarr outages before it's moved to the dead-letter table.
+INTAKE_QUEUE_PATH = os.getenv('INTAKE_QUEUE_PATH', '/app/config/intake.db')
+INTAKE_MAX_ATTEMPTS = int(os.getenv('INTAKE_MAX_ATTEMPTS', 8))
+INTAKE_RETRY_BASE_SECONDS = float(os.getenv('INTAKE_RETRY_BASE_SECONDS', 30))
+INTAKE_RETRY_MAX_SECONDS = float(os.getenv('INTAKE_RETRY_MAX_SECONDS', 3600))
+# Events handed to handlers and not yet finished
+INTAKE_MAX_IN_FLIGHT = int(os.getenv('INTAKE_MAX_IN_FLIGHT', 16))
+INTAKE_POLL_INTERVAL = float(os.getenv('INTAKE_POLL_INTERVAL', 5))
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS intake_events (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    received_at REAL NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL DEFAULT 0,
+    last_error TEXT,
+    event_key TEXT
+);
+CREATE TABLE IF NOT EXISTS intake_latest (
+    kind TEXT NOT NULL,
+    event_key TEXT NOT NULL,
+    last_id INTEGER NOT NULL,
+    PRIMARY KEY (kind, event_key)
+);
+CREATE TABLE IF NOT EXISTS dead_letters (
+    id INTEGER PRIMARY KEY,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    received_at REAL NOT NULL,
+    failed_at REAL NOT NULL,
+    attempts INTEGER NOT NULL,
+    last_error TEXT
+);
+"""
+
+
+@dataclass
+class Registration:
+    """How events of one kind are handled and retried."""
+    handler: object
+    # Retries of an event are dropped once a newer event with the same key arrived
+    supersede: bool = False
+    # Seconds after receipt past which the event is no longer retried (None: INTAKE_MAX_ATTEMPTS only)
+    retry_window: float = None
+
+
+_local = threading.local()
+_write_lock = threading.Lock()
+_wakeup = threading.Event()
+_handlers = {}
+_in_flight = set()
+_state_lock = threading.Lock()
+_consumer = None
+_consumer_lock = threading.Lock()
+_stats = {'received': 0, 'processed': 0, 'retried': 0, 'superseded': 0, 'dead_lettered': 0}
+_depth = None   # events in intake_events, counted once then tracked
+_waiting = []   # heap of (next_attempt_at, id) for events in retry backoff, tracked alongside _depth
+
+
+def _connect():
+    """Per-thread connection to the intake database."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        os.makedirs(os.path.dirname(INTAKE_QUEUE_PATH) or '.', exist_ok=True)
+        conn = sqlite3.connect(INTAKE_QUEUE_PATH, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(SCHEMA)
+        # Queues created before events had keys
+        columns = {row[1] for row in conn.execute("PRAGMA table_info(intake_events)")}
+        if 'event_key' not in columns:
+            conn.execute("ALTER TABLE intake_events ADD COLUMN event_key TEXT")
+        _local.conn = conn
+    return conn
+
+
+def register(kind, handler, supersede=False, retry_window=None):
+    """
+    Set the handler for an event kind.
+
+    handler(payload) applies the event. It may return a Future, in which case the
+    event is finished when the Future is; raising (or a failed Future) retries it.
+
+    :param supersede: Drop a failed event instead of retrying it once a newer event
+        with the same key has been submitted
+    :param retry_window: Stop retrying this many seconds after the event was received
+    """
+    _handlers[kind] = Registration(handler, supersede, retry_window)
+
+
+def submit(kind, payload, key=None):
+    """
+    Durably queue an event for its handler.
+
+    :param kind: Event kind passed to register()
+    :param payload: JSON-serializable event data
+    :param key: What the event is about (e.g. a series); newer events with the same
+        key supersede retries of older ones for kinds registered with supersede
+    :return: The event's queue ID, or None if the queue was unavailable and the
+        event was handed to its handler directly (without retries)
+    """
+    try:
+        with _write_lock:
+            conn = _connect()
+            with conn:
+                event_id = conn.execute(
+                    "INSERT INTO intake_events (kind, payload, received_at, event_key) VALUES (?, ?, ?, ?)",
+                    (kind, json.dumps(payload), time.time(), key)
+                ).lastrowid
+                if key is not None:
+                    conn.execute(
+                        "INSERT INTO intake_latest (kind, event_key, last_id) VALUES (?, ?, ?) "
+                        "ON CONFLICT (kind, event_key) DO UPDATE SET last_id = MAX(last_id, excluded.last_id)",
+                        (kind, key, event_id)
+                    )
+    except sqlite3.Error as e:
+        logger.error(f"Intake queue unavailable, handling {kind} event without retries: {str(e)}")
+        threading.Thread(target=_dispatch, args=(None, kind, payload, 0, None, None), daemon=True).start()
+        return None
+    global _depth
+    with _state_lock:
+        _stats['received'] += 1
+        if _depth is not None:
+            _depth += 1
+    start()
+    _wakeup.set()
+    return event_id
+
+
+def depth():
+    """Events queued or being handled, without a database query once known."""
+    global _depth
+    with _state_lock:
+        if _depth is not None:
+            return _depth
+    try:
+        conn = _connect()
+        count = conn.execute("SELECT COUNT(*) FROM intake_events").fetchone()[0]
+        waiting = conn.execute(
+            "SELECT next_attempt_at, id FROM intake_events WHERE next_attempt_at > ?", (time.time(),)
+        ).fetchall()
+    except sqlite3.Error:
+        return 0
+    with _state_lock:
+        if _depth is None:
+            _depth = count
+            _waiting[:] = waiting
+            heapq.heapify(_waiting)
+        return _depth
+
+
+def ready_depth():
+    """Events due or being handled; those waiting out a retry backoff don't count."""
+    total = depth()
+    now = time.time()
+    with _state_lock:
+        while _waiting and _waiting[0][0] <= now:
+            heapq.heappop(_waiting)
+        return max(0, total - len(_waiting))
+
+
+def stats():
+    try:
+        conn = _connect()
+        pending = conn.execute("SELECT COUNT(*) FROM intake_events").fetchone()[0]
+        dead = conn.execute("SELECT COUNT(*) FROM dead_letters").fetchone()[0]
+    except sqlite3.Error:
+        pending, dead = None, None
+    with _state_lock:
+        return dict(_stats, pending=pending, in_flight=len(_in_flight), dead_letters=dead)
+
+
+def _claim(limit):
+    """Due events not already being handled, oldest first."""
+    with _state_lock:
+        busy = list(_in_flight)
+    placeholders = ','.join('?' * len(busy))
+    exclude = f"AND id NOT IN ({placeholders})" if busy else ""
+    rows = _connect().execute(
+        f"SELECT id, kind, payload, attempts, received_at, event_key FROM intake_events "
+        f"WHERE next_attempt_at <= ? {exclude} ORDER BY id LIMIT ?", (time.time(), *busy, limit)
+    ).fetchall()
+    with _state_lock:
+        _in_flight.update(row[0] for row in rows)
+    return rows
+
+
+def _dispatch_due():
+    while True:
+        with _state_lock:
+            room = INTAKE_MAX_IN_FLIGHT - len(_in_flight)
+        if room <= 0:
+            return
+        rows = _claim(room)
+        if not rows:
+            return
+        for event_id, kind, payload, attempts, received_at, key in rows:
+            registration = _handlers.get(kind)
+            # A retry may have been overtaken while it waited for its backoff
+            if attempts and registration and registration.supersede and _superseded(kind, key, event_id):
+                _finish(event_id, kind, attempts - 1, None, received_at, key, superseded=True)
+                continue
+            _dispatch(event_id, kind, json.loads(payload), attempts, received_at, key)
+
+
+def _superseded(kind, key, event_id, conn=None):
+    """Whether a newer event with the same key has been submitted."""
+    if key is None:
+        return False
+    row = (conn or _connect()).execute(
+        "SELECT last_id FROM intake_latest WHERE kind = ? AND event_key = ?", (kind, key)
+    ).fetchone()
+    return row is not None and row[0] > event_id
+
+
+def _dispatch(event_id, kind, payload, attempts, received_at, key):
+    registration = _handlers.get(kind)
+    try:
+        if registration is None:
+            raise LookupError(f"No handler registered for {kind} events")
+        result = registration.handler(payload)
+    except Exception as e:
+        _finish(event_id, kind, attempts, e, received_at, key)
+        return
+    if isinstance(result, Future):
+        result.add_done_callback(
+            lambda future: _finish(event_id, kind, attempts, _future_error(future), received_at, key)
+        )
+    else:
+        _finish(event_id, kind, attempts, None, received_at, key)
+
+
+def _future_error(future):
+    try:
+        return future.exception()
+    except CancelledError as e:
+        return e
+
+
+def _finish(event_id, kind, attempts, error, received_at, key, superseded=False):
+    """Remove a handled event, or schedule its retry / move it to the dead-letter table."""
+    if event_id is None:
+        if error is not None:
+            logger.error(f"Failed to handle {kind} event: {str(error)}")
+        return
+    global _depth
+    registration = _handlers.get(kind)
+    now = time.time()
+    attempts += 1
+    # Exponential backoff with jitter, so retries after an outage don't arrive together
+    delay = min(INTAKE_RETRY_MAX_SECONDS, INTAKE_RETRY_BASE_SECONDS * 2 ** (attempts - 1)) * random.uniform(0.8, 1.2)
+    outcome = 'processed'
+    retry_at = None
+    try:
+        with _write_lock:
+            conn = _connect()
+            with conn:
+                if error is not None:
+                    if registration and registration.supersede and _superseded(kind, key, event_id, conn):
+                        outcome = 'superseded'
+                    elif attempts >= INTAKE_MAX_ATTEMPTS:
+                        outcome = 'dead_lettered'
+                    elif registration and registration.retry_window is not None \
+                            and now + delay - received_at > registration.retry_window:
+                        outcome = 'dead_lettered'
+                        error = f"{error} (retry window of {registration.retry_window:g}s passed)"
+                    else:
+                        outcome = 'retried'
+                elif superseded:
+                    outcome = 'superseded'
+
+                if outcome == 'retried':
+                    conn.execute(
+                        "UPDATE intake_events SET attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                        (attempts, now + delay, str(error), event_id)
+                    )
+                    retry_at = now + delay
+                else:
+                    if outcome == 'dead_lettered':
+                        conn.execute(
+                            "INSERT OR REPLACE INTO dead_letters (id, kind, payload, received_at, failed_at, attempts, last_error) "
+                            "SELECT id, kind, payload, received_at, ?, ?, ? FROM intake_events WHERE id = ?",
+                            (now, attempts, str(error), event_id)
+                        )
+                    conn.execute("DELETE FROM intake_events WHERE id = ?", (event_id,))
+    except sqlite3.Error as e:
+        # The event stays queued and is handled again: at-least-once
+        logger.error(f"Failed to record outcome of {kind} event {event_id}: {str(e)}")
+        outcome = 'retried'
+        retry_at = None
+    finally:
+        with _state_lock:
+            _in_flight.discard(event_id)
+            _stats[outcome] += 1
+            if _depth is not None and outcome != 'retried':
+                _depth = max(0, _depth - 1)
+            elif _depth is not None and retry_at is not None:
+                heapq.heappush(_waiting, (retry_at, event_id))
+        _wakeup.set()
+
+    if outcome == 'dead_lettered':
+        logger.error(f"Moved {kind} event {event_id} to dead letters after {attempts} attempts: {str(error)}")
+    elif outcome == 'retried':
+        logger.warning(f"{kind} event {event_id} failed (attempt {attempts}), will retry: {str(error)}")
+    elif outcome == 'superseded':
+        logger.info(f"Dropped {kind} event {event_id}: a newer event for {key} replaced it")
+
+
+def _run():
+    while True:
+        _wakeup.clear()
+        try:
+            _dispatch_due()
+        except Exception as e:
+            logger.error(f"Intake dispatch failed: {str(e)}", exc_info=True)
+        _wakeup.wait(INTAKE_POLL_INTERVAL)
+
+
+def start():
+    """Start the consumer thread; events left from a previous run are picked up again."""
+    global _consumer
+    with _consumer_lock:
+        if _consumer is None or not _consumer.is_alive():
+            _consumer = threading.Thread(target=_run, name='webhook-intake', daemon=True)
+            _consumer.start()
+            logger.info(f"Webhook intake queue at {INTAKE_QUEUE_PATH}")
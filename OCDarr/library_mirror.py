@@ -0,0 +1,401 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from api_client import sonarr
+import series_catalog
+import event_bus
+
+# Optional local mirror of Sonarr's series, episodes and episode files.
+# Disabled unless LIBRARY_MIRROR_PATH points at a database file.
+LIBRARY_MIRROR_PATH = os.getenv('LIBRARY_MIRROR_PATH')
+LIBRARY_MIRROR_SYNC_INTERVAL = int(os.getenv('LIBRARY_MIRROR_SYNC_INTERVAL', 900))
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS series (
+    id INTEGER PRIMARY KEY,
+    title TEXT,
+    tvdb_id INTEGER,
+    fingerprint TEXT,
+    synced_at REAL,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS episodes (
+    id INTEGER PRIMARY KEY,
+    series_id INTEGER NOT NULL,
+    season_number INTEGER NOT NULL,
+    episode_number INTEGER NOT NULL,
+    tvdb_id INTEGER,
+    episode_file_id INTEGER,
+    has_file INTEGER NOT NULL DEFAULT 0,
+    monitored INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_episodes_series ON episodes (series_id, season_number, episode_number);
+CREATE INDEX IF NOT EXISTS idx_episodes_file ON episodes (episode_file_id);
+CREATE INDEX IF NOT EXISTS idx_episodes_tvdb ON episodes (tvdb_id);
+CREATE TABLE IF NOT EXISTS episode_files (
+    id INTEGER PRIMARY KEY,
+    series_id INTEGER NOT NULL,
+    season_number INTEGER,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_episode_files_series ON episode_files (series_id);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+_local = threading.local()
+_write_lock = threading.Lock()
+_sync_thread = None
+_ready = False
+
+
+def is_enabled():
+    return bool(LIBRARY_MIRROR_PATH)
+
+
+def _connect():
+    """Per-thread connection to the mirror database."""
+    conn = getattr(_local, 'conn', None)
+    if conn is None:
+        os.makedirs(os.path.dirname(LIBRARY_MIRROR_PATH) or '.', exist_ok=True)
+        conn = sqlite3.connect(LIBRARY_MIRROR_PATH, timeout=30)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        conn.executescript(SCHEMA)
+        _local.conn = conn
+    return conn
+
+
+def is_ready():
+    """True once the mirror has completed a full sync."""
+    global _ready
+    if not is_enabled():
+        return False
+    if _ready:
+        return True
+    try:
+        row = _connect().execute("SELECT value FROM meta WHERE key = 'full_sync_at'").fetchone()
+        _ready = row is not None
+        return _ready
+    except sqlite3.Error as e:
+        logger.error(f"Library mirror unavailable: {str(e)}")
+        return False
+
+
+def _series_fingerprint(series):
+    """Summary of a series that changes whenever its episodes or files do."""
+    stats = series.get('statistics', {})
+    return json.dumps([
+        stats.get('episodeCount'),
+        stats.get('episodeFileCount'),
+        stats.get('totalEpisodeCount'),
+        stats.get('sizeOnDisk'),
+        series.get('lastInfoSync'),
+        series.get('previousAiring'),
+        series.get('monitored'),
+        [s.get('monitored') for s in series.get('seasons', [])]
+    ])
+
+
+# --- Reads -----------------------------------------------------------------
+
+def _series_synced(conn, series_id):
+    return conn.execute("SELECT 1 FROM series WHERE id = ?", (series_id,)).fetchone() is not None
+
+
+def get_series_episodes(series_id, season_number=None):
+    """
+    Episodes for a series (optionally one season) as Sonarr would return them.
+
+    Returns None when the mirror is not ready or does not know the series,
+    so callers can fall back to the Sonarr API.
+    """
+    if not is_ready():
+        return None
+    try:
+        conn = _connect()
+        series_id = int(series_id)
+        if not _series_synced(conn, series_id):
+            return None
+        if season_number is None:
+            rows = conn.execute(
+                "SELECT data FROM episodes WHERE series_id = ? ORDER BY season_number, episode_number",
+                (series_id,)
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                "SELECT data FROM episodes WHERE series_id = ? AND season_number = ? ORDER BY episode_number",
+                (series_id, int(season_number))
+            ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+    except sqlite3.Error as e:
+        logger.error(f"Library mirror read failed: {str(e)}")
+        return None
+
+
+def get_episode_file(episode_file_id):
+    """An episode file record, or None if it is not mirrored."""
+    if not is_ready():
+        return None
+    try:
+        row = _connect().execute("SELECT data FROM episode_files WHERE id = ?", (int(episode_file_id),)).fetchone()
+        return json.loads(row[0]) if row else None
+    except sqlite3.Error as e:
+        logger.error(f"Library mirror read failed: {str(e)}")
+        return None
+
+
+def find_episode_by_tvdb(tvdb_id):
+    """A mirrored episode by its TVDB episode ID, or None."""
+    if not is_ready():
+        return None
+    try:
+        row = _connect().execute("SELECT data FROM episodes WHERE tvdb_id = ?", (int(tvdb_id),)).fetchone()
+        return json.loads(row[0]) if row else None
+    except (sqlite3.Error, TypeError, ValueError) as e:
+        logger.error(f"Library mirror read failed: {str(e)}")
+        return None
+
+
+# --- Writes ----------------------------------------------------------------
+
+def _store_series(conn, series, episodes, episode_files):
+    series_id = series['id']
+    conn.execute("DELETE FROM episodes WHERE series_id = ?", (series_id,))
+    conn.execute("DELETE FROM episode_files WHERE series_id = ?", (series_id,))
+    conn.executemany(
+        "INSERT OR REPLACE INTO episodes (id, series_id, season_number, episode_number, tvdb_id, "
+        "episode_file_id, has_file, monitored, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+        [(ep['id'], series_id, ep['seasonNumber'], ep['episodeNumber'], ep.get('tvdbId'),
+          ep.get('episodeFileId') or None, int(bool(ep.get('hasFile'))), int(bool(ep.get('monitored'))),
+          json.dumps(ep)) for ep in episodes]
+    )
+    conn.executemany(
+        "INSERT OR REPLACE INTO episode_files (id, series_id, season_number, data) VALUES (?, ?, ?, ?)",
+        [(f['id'], series_id, f.get('seasonNumber'), json.dumps(f)) for f in episode_files]
+    )
+    conn.execute(
+        "INSERT OR REPLACE INTO series (id, title, tvdb_id, fingerprint, synced_at, data) VALUES (?, ?, ?, ?, ?, ?)",
+        (series_id, series.get('title'), series.get('tvdbId'), _series_fingerprint(series), time.time(), json.dumps(series))
+    )
+
+
+def sync_series(series_id, series=None):
+    """Re-mirror one series, its episodes and its episode files from Sonarr."""
+    series_id = int(series_id)
+    try:
+        if series is None:
+            response = sonarr.get(f"/api/v3/series/{series_id}")
+            if response.status_code == 404:
+                remove_series(series_id)
+                return True
+            if not response.ok:
+                logger.error(f"Mirror: failed to fetch series {series_id}. Status: {response.status_code}")
+                return False
+            series = response.json()
+        episodes_response = sonarr.get("/api/v3/episode", params={'seriesId': series_id})
+        files_response = sonarr.get("/api/v3/episodefile", params={'seriesId': series_id})
+        if not episodes_response.ok or not files_response.ok:
+            logger.error(f"Mirror: failed to fetch episodes or files for series {series_id}")
+            return False
+        episodes = episodes_response.json()
+        episode_files = files_response.json()
+    except Exception as e:
+        logger.error(f"Mirror: error syncing series {series_id}: {str(e)}")
+        return False
+
+    with _write_lock:
+        conn = _connect()
+        with conn:
+            _store_series(conn, series, episodes, episode_files)
+    _invalidate_cached(series_id)
+    logger.debug(f"Mirror: synced series {series_id} ({len(episodes)} episodes, {len(episode_files)} files)")
+    return True
+
+
+def remove_series(series_id):
+    with _write_lock:
+        conn = _connect()
+        with conn:
+            conn.execute("DELETE FROM episodes WHERE series_id = ?", (int(series_id),))
+            conn.execute("DELETE FROM episode_files WHERE series_id = ?", (int(series_id),))
+            conn.execute("DELETE FROM series WHERE id = ?", (int(series_id),))
+    _invalidate_cached(series_id)
+    logger.info(f"Mirror: removed series {series_id}")
+
+
+def _invalidate_cached(series_id):
+    # The episode cache is dropped when a change event arrives, but background
+    # syncs land later; drop it again so it can't keep rows read in between
+    import episode_cache
+    episode_cache.invalidate(series_id)
+
+
+def _update_episodes(conn, where, params, changes):
+    """Apply field changes to matching episodes, keeping the JSON copy in step."""
+    rows = conn.execute(f"SELECT id, data FROM episodes WHERE {where}", params).fetchall()
+    for episode_id, data in rows:
+        episode = json.loads(data)
+        episode.update(changes)
+        conn.execute(
+            "UPDATE episodes SET episode_file_id = ?, has_file = ?, monitored = ?, data = ? WHERE id = ?",
+            (episode.get('episodeFileId') or None, int(bool(episode.get('hasFile'))),
+             int(bool(episode.get('monitored'))), json.dumps(episode), episode_id)
+        )
+
+
+def set_monitored(episode_ids, monitored):
+    """Record a monitor/unmonitor we just made in Sonarr."""
+    if not is_ready() or not episode_ids:
+        return
+    placeholders = ','.join('?' * len(episode_ids))
+    with _write_lock:
+        conn = _connect()
+        with conn:
+            _update_episodes(conn, f"id IN ({placeholders})", list(episode_ids), {'monitored': bool(monitored)})
+
+
+def mark_files_deleted(episode_file_ids):
+    """Record episode files that no longer exist in Sonarr."""
+    if not is_ready() or not episode_file_ids:
+        return
+    ids = [int(i) for i in episode_file_ids]
+    placeholders = ','.join('?' * len(ids))
+    with _write_lock:
+        conn = _connect()
+        with conn:
+            _update_episodes(conn, f"episode_file_id IN ({placeholders})", ids, {'hasFile': False, 'episodeFileId': 0})
+            conn.execute(f"DELETE FROM episode_files WHERE id IN ({placeholders})", ids)
+
+
+# --- Sync ------------------------------------------------------------------
+
+def full_sync():
+    """Mirror every series in Sonarr."""
+    series_list = series_catalog.get_all_series(force_refresh=True)
+    if series_list is None:
+        logger.error("Mirror: full sync skipped, series list unavailable")
+        return False
+    started = time.time()
+    failures = sum(1 for series in series_list if not sync_series(series['id'], series))
+    _prune(series_list)
+    if failures:
+        logger.error(f"Mirror: full sync finished with {failures} failed series")
+        return False
+    with _write_lock:
+        conn = _connect()
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('full_sync_at', ?)", (str(time.time()),))
+    logger.info(f"Mirror: full sync of {len(series_list)} series took {time.time() - started:.1f}s")
+    return True
+
+
+def delta_sync():
+    """Re-mirror only series whose Sonarr statistics changed since the last sync."""
+    series_list = series_catalog.get_all_series(force_refresh=True)
+    if series_list is None:
+        logger.error("Mirror: delta sync skipped, series list unavailable")
+        return 0
+    conn = _connect()
+    known = dict(conn.execute("SELECT id, fingerprint FROM series").fetchall())
+    changed = [s for s in series_list if known.get(s['id']) != _series_fingerprint(s)]
+    for series in changed:
+        sync_series(series['id'], series)
+    _prune(series_list)
+    if changed:
+        logger.info(f"Mirror: delta sync refreshed {len(changed)} series")
+    return len(changed)
+
+
+def _prune(series_list):
+    """Drop series that are no longer in Sonarr."""
+    current = {s['id'] for s in series_list}
+    stale = [row[0] for row in _connect().execute("SELECT id FROM series").fetchall() if row[0] not in current]
+    for series_id in stale:
+        remove_series(series_id)
+
+
+def _store_episode(episode):
+    """Replace one mirrored episode with the copy Sonarr pushed."""
+    with _write_lock:
+        conn = _connect()
+        if not _series_synced(conn, episode['seriesId']):
+            return
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO episodes (id, series_id, season_number, episode_number, tvdb_id, "
+                "episode_file_id, has_file, monitored, data) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (episode['id'], episode['seriesId'], episode['seasonNumber'], episode['episodeNumber'],
+                 episode.get('tvdbId'), episode.get('episodeFileId') or None, int(bool(episode.get('hasFile'))),
+                 int(bool(episode.get('monitored'))), json.dumps(episode))
+            )
+
+
+def _sync_in_background(series_id):
+    # Sync off the caller's thread; one series is a couple of calls
+    threading.Thread(target=sync_series, args=(series_id,), daemon=True).start()
+
+
+def _on_sonarr_event(event):
+    """Keep the mirror in step with Sonarr change events from the event bus."""
+    if not is_ready():
+        return
+    name, action, resource, series_id = event['name'], event['action'], event['resource'], event['series_id']
+    if not series_id:
+        return
+    try:
+        if name == 'series':
+            if action == 'deleted':
+                remove_series(series_id)
+            elif action == 'added' or event['source'] == 'webhook':
+                # Pushed series updates fire on every refresh; the delta sync covers those
+                _sync_in_background(series_id)
+        elif name == 'episode' and action == 'updated' and resource.get('id'):
+            _store_episode(resource)
+        elif name == 'episodefile':
+            if action == 'deleted' and resource.get('id'):
+                mark_files_deleted([resource['id']])
+            elif action != 'deleted':
+                _sync_in_background(series_id)
+    except Exception as e:
+        logger.error(f"Mirror: failed to apply {name}/{action} for series {series_id}: {str(e)}")
+
+
+event_bus.subscribe('series', _on_sonarr_event)
+event_bus.subscribe('episode', _on_sonarr_event)
+event_bus.subscribe('episodefile', _on_sonarr_event)
+
+
+def _run():
+    try:
+        if not is_ready():
+            full_sync()
+    except Exception as e:
+        logger.error(f"Mirror: initial sync failed: {str(e)}", exc_info=True)
+    while True:
+        time.sleep(LIBRARY_MIRROR_SYNC_INTERVAL)
+        try:
+            if is_ready():
+                delta_sync()
+            else:
+                full_sync()
+        except Exception as e:
+            logger.error(f"Mirror: periodic sync failed: {str(e)}", exc_info=True)
+
+
+def start():
+    """Start the background full/delta sync thread if the mirror is enabled."""
+    global _sync_thread
+    if not is_enabled() or (_sync_thread and _sync_thread.is_alive()):
+        return
+    _sync_thread = threading.Thread(target=_run, name='library-mirror-sync', daemon=True)
+    _sync_thread.start()
+    logger.info(f"Library mirror enabled at {LIBRARY_MIRROR_PATH}")
@@ -0,0 +1,186 @@
+import os
+import re
+import time
+import logging
+import threading
+from dataclasses import dataclass
+import deletion_queue
+
+# Jellyfin reports progress every few seconds. A rule runs once per episode per
+# playback session, when progress first crosses JELLYFIN_TRIGGER_PERCENT.
+JELLYFIN_TRIGGER_PERCENT = float(os.getenv('JELLYFIN_TRIGGER_PERCENT', 45))
+# A session's first tick (e.g. after a restart) still counts if it lands this close past the threshold
+JELLYFIN_TRIGGER_GRACE_PERCENT = float(os.getenv('JELLYFIN_TRIGGER_GRACE_PERCENT', 10))
+# Sessions without ticks for this long are forgotten
+JELLYFIN_SESSION_IDLE_SECONDS = float(os.getenv('JELLYFIN_SESSION_IDLE_SECONDS', 3600))
+
+# Payload keys identifying the playback session, in order of preference
+SESSION_KEYS = ('PlaySessionId', 'SessionId', 'DeviceId')
+EXPIRE_INTERVAL = 60
+
+# Outcomes of screen()
+IGNORE = 'ignore'
+TRIGGER = 'trigger'
+
+# Top-level fields the fast path reads straight from the request body: a
+# quoted string without escapes, or a bare integer
+_FIELDS = ('NotificationType', 'ItemType', 'UserId', 'ItemId', 'PlaybackPositionTicks', 'RunTimeTicks') + SESSION_KEYS
+_FIELD_PATTERNS = {
+    name: re.compile(rb'"' + name.encode() + rb'"\s*:\s*(?:"([^"\\]*)"|(-?\d+))') for name in _FIELDS
+}
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class Session:
+    percent: float = None
+    triggered: bool = False
+    last_seen: float = 0.0
+
+
+class SessionTracker:
+    """Per user/item/session playback progress, firing once when the threshold is crossed."""
+
+    def __init__(self, threshold=JELLYFIN_TRIGGER_PERCENT, grace=JELLYFIN_TRIGGER_GRACE_PERCENT,
+                 idle_seconds=JELLYFIN_SESSION_IDLE_SECONDS):
+        self.threshold = threshold
+        self.grace = grace
+        self.idle_seconds = idle_seconds
+        self.sessions = {}
+        self.lock = threading.Lock()
+        self.last_expired = time.monotonic()
+        self.stats = {'ticks': 0, 'triggered': 0, 'expired': 0}
+
+    def started(self, key, percent):
+        """Record where a session starts, so a resume past the threshold isn't a crossing."""
+        with self.lock:
+            session = self.sessions.setdefault(key, Session())
+            session.percent = percent
+            session.last_seen = time.monotonic()
+
+    def progress(self, key, percent):
+        """
+        Record a progress tick.
+
+        :return: True exactly once per session, on the tick that crosses the threshold
+        """
+        now = time.monotonic()
+        with self.lock:
+            self.stats['ticks'] += 1
+            self._expire(now)
+            session = self.sessions.setdefault(key, Session())
+            previous, session.percent, session.last_seen = session.percent, percent, now
+            if session.triggered or percent < self.threshold:
+                return False
+            if previous is None:
+                # No earlier tick: only a tick just past the threshold counts, not a resume near the end
+                crossed = percent < self.threshold + self.grace
+            else:
+                # A seek can jump straight over the threshold
+                crossed = previous < self.threshold
+            if crossed:
+                session.triggered = True
+                self.stats['triggered'] += 1
+            return crossed
+
+    def _expire(self, now):
+        # Caller holds lock
+        if now - self.last_expired < EXPIRE_INTERVAL:
+            return
+        self.last_expired = now
+        idle = [key for key, session in self.sessions.items() if now - session.last_seen > self.idle_seconds]
+        for key in idle:
+            del self.sessions[key]
+        self.stats['expired'] += len(idle)
+
+    def get_stats(self):
+        with self.lock:
+            return dict(self.stats, sessions=len(self.sessions), threshold=self.threshold)
+
+
+_tracker = SessionTracker()
+
+
+def session_key(data):
+    """(user, item, session) for a Jellyfin webhook payload."""
+    session = next((data[name] for name in SESSION_KEYS if data.get(name)), None)
+    return (data.get('UserId') or data.get('NotificationUsername'), data.get('ItemId'), session)
+
+
+def progress_percent(data):
+    """Playback position as a percentage, or None if the payload has no runtime."""
+    try:
+        position_ticks = int(data.get('PlaybackPositionTicks') or 0)
+        total_ticks = int(data.get('RunTimeTicks') or 0)
+    except (TypeError, ValueError):
+        return None
+    if total_ticks <= 0:
+        return None
+    return position_ticks / total_ticks * 100
+
+
+def playback_started(data):
+    percent = progress_percent(data)
+    if percent is not None:
+        _tracker.started(session_key(data), percent)
+
+
+def should_trigger(data):
+    """Whether this progress tick is the one that crosses the threshold for its session."""
+    percent = progress_percent(data)
+    if percent is None:
+        return False
+    return _tracker.progress(session_key(data), percent)
+
+
+def _raw_field(raw, name):
+    match = _FIELD_PATTERNS[name].search(raw)
+    if match is None:
+        return None
+    value = match.group(1) if match.group(1) is not None else match.group(2)
+    return value.decode('utf-8', 'replace') or None
+
+
+def screen(raw):
+    """
+    Decide on a Jellyfin webhook from its raw body, without decoding the JSON.
+
+    Progress ticks still update their session, so a crossing is detected either way.
+
+    :param raw: Request body bytes
+    :return: IGNORE if nothing more needs doing, TRIGGER if this tick crosses the
+        threshold (the session is already marked), None if the body needs a full decode
+    """
+    notification_type = _raw_field(raw, 'NotificationType')
+    if notification_type is None:
+        return None
+    if notification_type not in ('PlaybackProgress', 'PlaybackStart'):
+        return IGNORE
+    if notification_type == 'PlaybackProgress':
+        # Deferred deletions wait until progress ticks stop arriving, whatever is playing
+        deletion_queue.note_playback()
+    item_type = _raw_field(raw, 'ItemType')
+    if item_type is not None and item_type != 'Episode':
+        return IGNORE
+
+    user = _raw_field(raw, 'UserId')
+    item = _raw_field(raw, 'ItemId')
+    session = next((value for value in (_raw_field(raw, name) for name in SESSION_KEYS) if value), None)
+    try:
+        position_ticks = int(_raw_field(raw, 'PlaybackPositionTicks') or 0)
+        total_ticks = int(_raw_field(raw, 'RunTimeTicks') or 0)
+    except ValueError:
+        return None
+    if not user or not item or total_ticks <= 0:
+        return None
+    percent = position_ticks / total_ticks * 100
+
+    if notification_type == 'PlaybackStart':
+        _tracker.started((user, item, session), percent)
+        return IGNORE
+    return TRIGGER if _tracker.progress((user, item, session), percent) else IGNORE
+
+
+def stats():
+    return _tracker.get_stats()
@@ -0,0 +1,186 @@
+import os
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field, asdict
+from api_client import deadline
+import deletion_queue
+import title_index
+
+# Events for the same series are applied one at a time, in arrival order;
+# different series are processed concurrently on this many threads
+PLAYBACK_WORKERS = int(os.getenv('PLAYBACK_WORKERS', 4))
+
+logger = logging.getLogger(__name__)
+
+# Payload keys that may carry provider IDs, per source. Series IDs resolve
+# the show directly; an episode TVDB ID also pins down the exact episode.
+# README.md lists the webhook template changes that send them.
+JELLYFIN_ID_KEYS = {
+    'tvdb': ('SeriesTvdbId', 'Series_Provider_tvdb'),
+    'tmdb': ('SeriesTmdbId', 'Series_Provider_tmdb'),
+    'imdb': ('SeriesImdbId', 'Series_Provider_imdb'),
+    'episode_tvdb': ('Provider_tvdb',),
+}
+SERVER_ID_KEYS = {
+    'tvdb': ('server_tvdb_id', 'plex_tvdb_id'),
+    'tmdb': ('server_tmdb_id', 'plex_tmdb_id'),
+    'imdb': ('server_imdb_id', 'plex_imdb_id'),
+    'episode_tvdb': ('server_episode_tvdb_id', 'plex_episode_tvdb_id'),
+}
+
+
+@dataclass
+class PlaybackEvent:
+    """A watched episode reported by a media server, normalized across sources."""
+    series_title: str
+    season_number: int
+    episode_number: int
+    source: str = 'server'
+    provider_ids: dict = field(default_factory=dict)
+
+    def describe(self):
+        return f"{self.series_title} S{self.season_number}E{self.episode_number}"
+
+    def to_dict(self):
+        return asdict(self)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**data)
+
+
+def event_from_jellyfin(data):
+    """Build a PlaybackEvent from a Jellyfin webhook payload, or None if incomplete."""
+    return _build_event(data.get('SeriesName'), data.get('SeasonNumber'), data.get('EpisodeNumber'), 'jellyfin',
+                        _provider_ids(data, JELLYFIN_ID_KEYS))
+
+
+def event_from_server(data):
+    """Build a PlaybackEvent from a Tautulli/server webhook payload, or None if incomplete."""
+    # Try Jellyfin-style keys first, then Plex/Tautulli keys
+    series_title = data.get('server_title')
+    season_number = data.get('server_season_num')
+    episode_number = data.get('server_ep_num')
+    if not all([series_title, season_number, episode_number]):
+        series_title = data.get('plex_title')
+        season_number = data.get('plex_season_num')
+        episode_number = data.get('plex_ep_num')
+    return _build_event(series_title, season_number, episode_number, 'server', _provider_ids(data, SERVER_ID_KEYS))
+
+
+def _provider_ids(data, keys):
+    ids = {}
+    for provider, names in keys.items():
+        value = next((data[name] for name in names if data.get(name)), None)
+        if value:
+            ids[provider] = value
+    return ids
+
+
+def _build_event(series_title, season_number, episode_number, source, provider_ids=None):
+    if not all([series_title, season_number is not None, episode_number is not None]):
+        return None
+    try:
+        return PlaybackEvent(series_title, int(season_number), int(episode_number), source, provider_ids or {})
+    except (TypeError, ValueError):
+        return None
+
+
+class KeyedExecutor:
+    """Runs tasks with the same key serially in submission order, different keys in parallel."""
+
+    def __init__(self, workers, name):
+        self.pool = ThreadPoolExecutor(max_workers=max(1, workers), thread_name_prefix=name)
+        self.queues = {}   # key -> deque of (fn, args, future); present while the key has work
+        self.lock = threading.Lock()
+
+    def submit(self, key, fn, *args):
+        future = Future()
+        with self.lock:
+            tasks = self.queues.get(key)
+            if tasks is not None:
+                tasks.append((fn, args, future))
+                return future
+            self.queues[key] = deque([(fn, args, future)])
+        self.pool.submit(self._drain, key)
+        return future
+
+    def _drain(self, key):
+        # Only one drain runs per key, so its tasks never overlap
+        while True:
+            with self.lock:
+                tasks = self.queues[key]
+                if not tasks:
+                    del self.queues[key]
+                    return
+                fn, args, future = tasks.popleft()
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args))
+            except Exception as e:
+                future.set_exception(e)
+
+    def pending(self):
+        with self.lock:
+            return sum(len(tasks) for tasks in self.queues.values())
+
+    def active_keys(self):
+        with self.lock:
+            return len(self.queues)
+
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def start():
+    """Create the worker pool if it does not exist yet."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = KeyedExecutor(PLAYBACK_WORKERS, 'playback-worker')
+            logger.info(f"Playback worker started with {PLAYBACK_WORKERS} threads")
+    return _executor
+
+
+def series_key(event):
+    """Events are ordered per series title; the rule run also locks the resolved series ID."""
+    return title_index.normalize(event.series_title)
+
+
+def submit(event):
+    """Queue a playback event for processing and return a Future for its result."""
+    executor = start()
+    deletion_queue.note_playback()
+    return executor.submit(series_key(event), _process, event)
+
+
+def queue_depth():
+    return _executor.pending() if _executor is not None else 0
+
+
+def active_series():
+    """Series with events queued or being processed."""
+    return _executor.active_keys() if _executor is not None else 0
+
+
+def _process(event):
+    try:
+        return process_event(event)
+    except Exception as e:
+        logger.error(f"Failed to process playback event {event.describe()}: {str(e)}", exc_info=True)
+        raise
+
+
+def process_event(event):
+    """Apply the rule for a playback event within the per-event deadline."""
+    # Imported lazily: servertosonarr reads config and sets up logging on import
+    import servertosonarr
+
+    logger.info(f"Processing {event.describe()} from {event.source}")
+    with deadline():
+        return servertosonarr.process_playback(event.series_title, event.season_number, event.episode_number,
+                                               event.provider_ids)
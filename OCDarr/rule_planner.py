@@ -0,0 +1,103 @@
+from dataclasses import dataclass, field, asdict
+import episode_index
+import rules
+
+
+@dataclass
+class MutationPlan:
+    """The Sonarr changes one rule run wants to make, deduplicated."""
+    series_id: int
+    last_watched_id: int
+    monitor: list = field(default_factory=list)
+    unmonitor: list = field(default_factory=list)
+    search: list = field(default_factory=list)
+    delete_files: list = field(default_factory=list)
+    keep_files: list = field(default_factory=list)
+
+    def is_empty(self):
+        return not (self.monitor or self.unmonitor or self.search or self.delete_files)
+
+    def to_dict(self):
+        return asdict(self)
+
+
+def next_episode_ids(all_episodes, season_number, episode_number, get_option):
+    """
+    Episode IDs a rule wants available after the watched episode.
+
+    :param get_option: "all" (everything from the watched season on), "season" (rest
+        of the watched season) or a number of following episodes, across seasons
+    """
+    get_option = rules.parse_option(get_option)
+    index = episode_index.get_index(all_episodes)
+    if get_option == "all":
+        return [ep['id'] for ep in index.from_season(season_number)]
+    if get_option == "season":
+        return [ep['id'] for ep in index.season(season_number) if ep['episodeNumber'] > episode_number]
+    if not isinstance(get_option, int):
+        raise ValueError(f"Invalid get_option value: {get_option}")
+    # Stops at the end of the series even if fewer than count episodes are left
+    return [ep['id'] for ep in index.after(season_number, episode_number, get_option)]
+
+
+def watched_files_to_delete(all_episodes, keep_watched, last_watched_id):
+    """Files of watched episodes outside the keep_watched window."""
+    if keep_watched == "all":
+        return []
+    index = episode_index.get_index(all_episodes)
+    if keep_watched == "season":
+        last_watched_season = index.get(last_watched_id)['seasonNumber']
+        episodes = [ep for ep in index.before_season(last_watched_season) if ep['hasFile']]
+    elif isinstance(keep_watched, int):
+        # Keep the keep_watched episodes up to and including the last watched one
+        keep_ids = {ep['id'] for ep in index.window_ending_at(last_watched_id, keep_watched)}
+        episodes = [ep for ep in all_episodes if ep['id'] not in keep_ids and ep['hasFile']]
+    else:
+        return []
+    return [ep['episodeFileId'] for ep in episodes if 'episodeFileId' in ep]
+
+
+def old_files_to_delete(all_episodes, keep_episode_ids, keep_watched):
+    """Files of episodes that are neither the last watched nor coming up next."""
+    if keep_watched == "all":
+        return []
+    episodes_with_files = [ep for ep in all_episodes if ep['hasFile']]
+    if keep_watched == "season":
+        last_watched_season = max(ep['seasonNumber'] for ep in all_episodes if ep['id'] in keep_episode_ids)
+        return [ep['episodeFileId'] for ep in episodes_with_files
+                if ep['seasonNumber'] < last_watched_season and ep['id'] not in keep_episode_ids]
+    return [ep['episodeFileId'] for ep in episodes_with_files if ep['id'] not in keep_episode_ids]
+
+
+def build_plan(series_id, all_episodes, last_watched_id, next_episode_ids, rule):
+    """
+    Work out what a rule run should change, without touching Sonarr.
+
+    :param series_id: Sonarr series ID
+    :param all_episodes: Current episodes of the series
+    :param last_watched_id: Episode ID that was just watched
+    :param next_episode_ids: Episode IDs the rule wants available next
+    :param rule: Compiled rules.Rule
+    :return: MutationPlan
+    """
+    index = episode_index.get_index(all_episodes)
+    plan = MutationPlan(series_id, last_watched_id)
+
+    # Always sent: cached monitored flags can be stale, and each is one idempotent bulk call
+    plan.monitor = list(next_episode_ids)
+    if not rule.monitor_watched and last_watched_id not in next_episode_ids:
+        plan.unmonitor = [last_watched_id]
+    if rule.action_option == "search":
+        plan.search = list(next_episode_ids)
+
+    # Both deletion passes, merged; kept episodes never lose their files
+    keep_watched = rule.keep_watched
+    keep_episode_ids = set(next_episode_ids) | {last_watched_id}
+    kept_files = {index.get(ep_id).get('episodeFileId') for ep_id in keep_episode_ids if index.get(ep_id)}
+    plan.keep_files = sorted(file_id for file_id in kept_files if file_id)
+    delete_files = watched_files_to_delete(all_episodes, keep_watched, last_watched_id)
+    if keep_watched != "all":
+        delete_files += old_files_to_delete(all_episodes, keep_episode_ids, keep_watched)
+        delete_files = [file_id for file_id in delete_files if file_id not in kept_files]
+    plan.delete_files = sorted({file_id for file_id in delete_files if file_id})
+    return plan
@@ -0,0 +1,98 @@
+from dataclasses import dataclass
+
+# Rule options that aren't episode counts
+OPTION_KEYWORDS = ('all', 'season')
+
+
+def parse_option(value):
+    """A get_option/keep_watched value as 'all', 'season' or an int; anything else is returned as is."""
+    if isinstance(value, int) and not isinstance(value, bool):
+        return value
+    text = str(value).strip().lower()
+    if text in OPTION_KEYWORDS:
+        return text
+    if text.lstrip('-').isdigit():
+        return int(text)
+    return value
+
+
+@dataclass(frozen=True)
+class Rule:
+    """A rule from config.json with its options parsed once."""
+    name: str
+    get_option: object
+    action_option: str
+    keep_watched: object
+    monitor_watched: bool
+
+    @classmethod
+    def compile(cls, name, details):
+        return cls(
+            name=name,
+            get_option=parse_option(details.get('get_option', '1')),
+            action_option=details.get('action_option', 'monitor'),
+            keep_watched=parse_option(details.get('keep_watched', 'all')),
+            monitor_watched=bool(details.get('monitor_watched', False))
+        )
+
+
+class RuleSet:
+    """
+    Compiled rules with a series ID -> rule index.
+
+    Series IDs are kept as strings, as config.json stores them. A series listed
+    under several rules belongs to the first one, which is the rule that was
+    always applied to it; writing assignments back drops the other entries.
+    """
+
+    def __init__(self, config):
+        self.default_rule = config.get('default_rule', '1n1')
+        self.rules = {}
+        self.rule_of_series = {}
+        self.series_of_rule = {}   # rule name -> {series_id: None}, an ordered set
+        for name, details in config.get('rules', {}).items():
+            self.rules[name] = Rule.compile(name, details)
+            members = self.series_of_rule[name] = {}
+            for series_id in details.get('series', []):
+                series_id = str(series_id)
+                if series_id not in self.rule_of_series:
+                    self.rule_of_series[series_id] = name
+                    members[series_id] = None
+
+    def assigned_rule(self, series_id):
+        """Name of the rule a series is assigned to, else the default rule's."""
+        return self.rule_of_series.get(str(series_id), self.default_rule)
+
+    def rule_for(self, series_id):
+        """The Rule applied to a series: its assigned rule, else the default rule."""
+        name = self.rule_of_series.get(str(series_id))
+        if name is None:
+            return self.rules.get(self.default_rule)
+        return self.rules[name]
+
+    def series(self, rule_name):
+        return list(self.series_of_rule.get(rule_name, {}))
+
+    def assign(self, rule_name, series_ids):
+        """Move series to a rule; an unknown rule name (e.g. 'None') just unassigns them."""
+        for series_id in map(str, series_ids):
+            current = self.rule_of_series.pop(series_id, None)
+            if current is not None:
+                del self.series_of_rule[current][series_id]
+            if rule_name in self.rules:
+                self.rule_of_series[series_id] = rule_name
+                self.series_of_rule[rule_name][series_id] = None
+
+    def unassign(self, rule_name, series_ids):
+        """Remove series from a rule, leaving series assigned elsewhere alone."""
+        members = self.series_of_rule.get(rule_name, {})
+        for series_id in map(str, series_ids):
+            if series_id in members:
+                del members[series_id]
+                del self.rule_of_series[series_id]
+
+    def write_assignments(self, config):
+        """Store the series lists back into a loaded config."""
+        for name, details in config.get('rules', {}).items():
+            details['series'] = self.series(name)
+        return config
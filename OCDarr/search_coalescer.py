@@ -0,0 +1,208 @@
+import os
+import time
+import logging
+import threading
+from api_client import sonarr, deadline
+import episode_cache
+import search_policy
+
+# Episode searches requested within SEARCH_COALESCE_WINDOW seconds are sent
+# as one command; commands are paced by a token bucket so binges and bulk
+# selections don't hammer the indexers.
+SEARCH_COALESCE_WINDOW = float(os.getenv('SEARCH_COALESCE_WINDOW', 2))
+SEARCH_BUCKET_CAPACITY = int(os.getenv('SEARCH_BUCKET_CAPACITY', 5))
+SEARCH_BUCKET_REFILL_SECONDS = float(os.getenv('SEARCH_BUCKET_REFILL_SECONDS', 12))
+SEARCH_MAX_ATTEMPTS = int(os.getenv('SEARCH_MAX_ATTEMPTS', 3))
+
+ACTIVE_COMMAND_STATUSES = ('queued', 'started')
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Allows bursts of `capacity`, refilling one token every `refill_seconds`."""
+
+    def __init__(self, capacity, refill_seconds):
+        self.capacity = max(1, capacity)
+        self.refill_seconds = refill_seconds
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.refill_seconds > 0:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) / self.refill_seconds)
+        else:
+            self.tokens = self.capacity
+        self.updated = now
+
+    def wait_time(self):
+        """Seconds until a token is available."""
+        with self.lock:
+            self._refill()
+            return 0 if self.tokens >= 1 else (1 - self.tokens) * self.refill_seconds
+
+    def take(self):
+        with self.lock:
+            self._refill()
+            self.tokens -= 1
+
+
+_bucket = TokenBucket(SEARCH_BUCKET_CAPACITY, SEARCH_BUCKET_REFILL_SECONDS)
+_pending = {}      # episode_id -> (series_id or None, attempts)
+_first_pending_at = None
+_condition = threading.Condition()
+_flusher = None
+_stats = {'requested': 0, 'sent_commands': 0, 'sent_episodes': 0, 'skipped_active': 0, 'dropped': 0}
+
+
+def request_search(episode_ids, series_id=None):
+    """
+    Queue episodes to be searched for.
+
+    :param episode_ids: Episode IDs to search for
+    :param series_id: Sonarr series ID, if all episodes belong to one series
+    :return: True if anything was queued
+    """
+    if not episode_ids:
+        return False
+    global _first_pending_at
+    with _condition:
+        for episode_id in episode_ids:
+            if episode_id not in _pending:
+                _pending[episode_id] = (series_id, 0)
+        _stats['requested'] += len(episode_ids)
+        if _first_pending_at is None:
+            _first_pending_at = time.monotonic()
+        _condition.notify()
+    _start()
+    logger.info(f"Queued search for episodes {list(episode_ids)}")
+    return True
+
+
+def drain():
+    """Send everything pending now, ignoring the window and rate limit (used before exiting)."""
+    with _condition:
+        batch = _take_pending()
+    if batch:
+        _send(batch)
+
+
+def pending_count():
+    with _condition:
+        return len(_pending)
+
+
+def stats():
+    with _condition:
+        return dict(_stats, pending=len(_pending), tokens=round(_bucket.tokens, 2))
+
+
+def _take_pending():
+    # Caller holds _condition
+    global _first_pending_at
+    batch = dict(_pending)
+    _pending.clear()
+    _first_pending_at = None
+    return batch
+
+
+def active_searches():
+    """
+    Searches Sonarr has queued or is running.
+
+    :return: (episode IDs, (series ID, season) pairs, series IDs) being searched
+    """
+    episode_ids, seasons, series_ids = set(), set(), set()
+    response = sonarr.get("/api/v3/command")
+    if not response.ok:
+        logger.warning(f"Could not read Sonarr's command queue. Status: {response.status_code}")
+        return episode_ids, seasons, series_ids
+    for command in response.json():
+        if command.get('status') not in ACTIVE_COMMAND_STATUSES:
+            continue
+        body = command.get('body', {})
+        if command.get('name') == 'EpisodeSearch':
+            episode_ids.update(body.get('episodeIds', []))
+        elif command.get('name') == 'SeasonSearch':
+            seasons.add((body.get('seriesId'), body.get('seasonNumber')))
+        elif command.get('name') == 'SeriesSearch':
+            series_ids.add(body.get('seriesId'))
+    return episode_ids, seasons, series_ids
+
+
+def _send(batch):
+    """Send the fewest search commands covering a batch; requeue it on failure."""
+    try:
+        with deadline():
+            episodes_by_series = {}
+            for series_id in {series_id for series_id, _ in batch.values() if series_id}:
+                episodes = episode_cache.load(series_id)
+                if episodes is not None:
+                    episodes_by_series[series_id] = episodes
+            season_of = {ep['id']: (series_id, ep['seasonNumber'])
+                         for series_id, episodes in episodes_by_series.items() for ep in episodes}
+
+            active_episodes, active_seasons, active_series = active_searches()
+            episode_ids = [episode_id for episode_id in batch
+                           if episode_id not in active_episodes
+                           and season_of.get(episode_id) not in active_seasons
+                           and season_of.get(episode_id, (None,))[0] not in active_series]
+            skipped = len(batch) - len(episode_ids)
+            if skipped:
+                logger.info(f"Skipping {skipped} episodes already being searched")
+            commands = search_policy.plan_search_commands(episode_ids, episodes_by_series) if episode_ids else []
+            for command in commands:
+                response = sonarr.post("/api/v3/command", json=command)
+                if not response.ok:
+                    raise RuntimeError(f"Status: {response.status_code}, Response: {response.text}")
+                logger.info(f"Search command sent to Sonarr: {command}")
+        with _condition:
+            _stats['skipped_active'] += skipped
+            _stats['sent_commands'] += len(commands)
+            _stats['sent_episodes'] += len(episode_ids)
+        return True
+    except Exception as e:
+        logger.error(f"Failed to send episode search command: {str(e)}")
+        _requeue(batch)
+        return False
+
+
+def _requeue(batch):
+    global _first_pending_at
+    dropped = []
+    with _condition:
+        for episode_id, (series_id, attempts) in batch.items():
+            if attempts + 1 >= SEARCH_MAX_ATTEMPTS:
+                dropped.append(episode_id)
+            elif episode_id not in _pending:
+                _pending[episode_id] = (series_id, attempts + 1)
+        _stats['dropped'] += len(dropped)
+        if _pending and _first_pending_at is None:
+            _first_pending_at = time.monotonic()
+    if dropped:
+        logger.error(f"Giving up searching for episodes {dropped} after {SEARCH_MAX_ATTEMPTS} attempts")
+
+
+def _run():
+    while True:
+        with _condition:
+            while not _pending:
+                _condition.wait()
+            # Let the window fill, then wait for a token; requests keep merging meanwhile
+            wait = max(SEARCH_COALESCE_WINDOW - (time.monotonic() - _first_pending_at), _bucket.wait_time())
+            if wait > 0:
+                _condition.wait(wait)
+                continue
+            batch = _take_pending()
+        _bucket.take()
+        _send(batch)
+
+
+def _start():
+    global _flusher
+    with _condition:
+        if _flusher is None or not _flusher.is_alive():
+            _flusher = threading.Thread(target=_run, name='search-coalescer', daemon=True)
+            _flusher.start()
@@ -0,0 +1,76 @@
+import os
+import logging
+from collections import defaultdict
+from datetime import datetime, timezone
+
+# A selection covering at least this share of a season's aired episodes is
+# searched as a season (one indexer query, season packs allowed) instead of
+# episode by episode. Several such seasons of one series become a series search.
+SEASON_SEARCH_THRESHOLD = float(os.getenv('SEASON_SEARCH_THRESHOLD', 0.75))
+SEASON_SEARCH_MIN_EPISODES = int(os.getenv('SEASON_SEARCH_MIN_EPISODES', 3))
+
+logger = logging.getLogger(__name__)
+
+
+def _has_aired(episode, now):
+    air_date = episode.get('airDateUtc')
+    if not air_date:
+        return False
+    try:
+        return datetime.fromisoformat(air_date.replace('Z', '+00:00')) <= now
+    except ValueError:
+        return True
+
+
+def plan_search_commands(episode_ids, episodes_by_series):
+    """
+    Turn a set of episodes to search for into the fewest search commands.
+
+    :param episode_ids: Episode IDs to search for
+    :param episodes_by_series: {series_id: all episodes of that series} for the
+        series the IDs are known to belong to; other IDs stay episode searches
+    :return: List of Sonarr command bodies (EpisodeSearch, SeasonSearch, SeriesSearch)
+    """
+    requested = set(episode_ids)
+    now = datetime.now(timezone.utc)
+    commands = []
+    covered = set()
+
+    for series_id, episodes in episodes_by_series.items():
+        aired_by_season = defaultdict(set)
+        requested_by_season = defaultdict(set)
+        for ep in episodes:
+            # Specials are never promoted
+            if ep['seasonNumber'] == 0:
+                continue
+            if _has_aired(ep, now):
+                aired_by_season[ep['seasonNumber']].add(ep['id'])
+            if ep['id'] in requested:
+                requested_by_season[ep['seasonNumber']].add(ep['id'])
+
+        promoted = []
+        for season_number, season_requested in requested_by_season.items():
+            aired = aired_by_season.get(season_number, set())
+            if len(aired) < SEASON_SEARCH_MIN_EPISODES:
+                continue
+            if len(season_requested & aired) / len(aired) >= SEASON_SEARCH_THRESHOLD:
+                promoted.append(season_number)
+        if not promoted:
+            continue
+
+        all_aired = set().union(*aired_by_season.values())
+        promoted_requested = set().union(*(requested_by_season[s] for s in promoted))
+        if len(promoted) > 1 and len(promoted_requested & all_aired) / len(all_aired) >= SEASON_SEARCH_THRESHOLD:
+            commands.append({'name': 'SeriesSearch', 'seriesId': series_id})
+            covered |= set().union(*requested_by_season.values())
+            logger.info(f"Promoted search for series {series_id} to a series search")
+            continue
+        for season_number in sorted(promoted):
+            commands.append({'name': 'SeasonSearch', 'seriesId': series_id, 'seasonNumber': season_number})
+            covered |= requested_by_season[season_number]
+        logger.info(f"Promoted search for series {series_id} to season searches for seasons {sorted(promoted)}")
+
+    remaining = sorted(requested - covered)
+    if remaining:
+        commands.append({'name': 'EpisodeSearch', 'episodeIds': remaining})
+    return commands
@@ -0,0 +1,193 @@
+import os
+import time
+import logging
+import threading
+from api_client import sonarr
+import event_bus
+
+# How long the series list is served without refreshing, and how long a
+# stale copy may still be served while a background refresh runs
+SERIES_CACHE_TTL = float(os.getenv('SERIES_CACHE_TTL', 300))
+SERIES_CACHE_STALE_TTL = float(os.getenv('SERIES_CACHE_STALE_TTL', 3600))
+# How long a title or provider ID that matched no series is remembered
+UNMATCHED_CACHE_TTL = float(os.getenv('UNMATCHED_CACHE_TTL', 3600))
+
+logger = logging.getLogger(__name__)
+
+_series = None
+_by_id = {}
+_by_provider = {}   # ('tvdb' | 'tmdb' | 'imdb', id) -> series
+_fetched_at = 0.0
+_invalidated = False
+_generation = 0
+_fetch_count = 0
+_refreshing = False
+_unmatched = {}   # key -> time it was found not to match
+_lock = threading.Lock()
+_fetch_lock = threading.Lock()
+
+
+def get_all_series(force_refresh=False):
+    """
+    Return the Sonarr series list from the shared in-memory catalog.
+
+    Fresh data is returned directly. Data older than SERIES_CACHE_TTL is still
+    returned, but a background refresh is started. If there is no usable copy,
+    or the catalog was invalidated, the list is fetched synchronously.
+    Returns None if Sonarr could not be reached and nothing is cached.
+    """
+    with _lock:
+        series, age, invalidated = _series, time.monotonic() - _fetched_at, _invalidated
+
+    if series is not None and not force_refresh and not invalidated:
+        if age < SERIES_CACHE_TTL:
+            return series
+        if age < SERIES_CACHE_STALE_TTL:
+            _refresh_in_background()
+            return series
+
+    refreshed = _refresh()
+    return refreshed if refreshed is not None else series
+
+
+def get_series(series_id):
+    """Return a single series by Sonarr ID, or None."""
+    if get_all_series() is None:
+        return None
+    with _lock:
+        return _by_id.get(int(series_id))
+
+
+def find_by_provider_ids(tvdb_id=None, tmdb_id=None, imdb_id=None):
+    """Return the series matching any of the given provider IDs, or None."""
+    keys = [key for key in (_provider_key('tvdb', tvdb_id), _provider_key('tmdb', tmdb_id),
+                            _provider_key('imdb', imdb_id)) if key]
+    if not keys or get_all_series() is None:
+        return None
+    with _lock:
+        for key in keys:
+            if key in _by_provider:
+                return _by_provider[key]
+    return None
+
+
+def _provider_key(provider, value):
+    """Normalize a provider ID; TVDB/TMDB IDs are integers, IMDb IDs look like 'tt0944947'."""
+    if value in (None, '', 0, '0'):
+        return None
+    if provider == 'imdb':
+        value = str(value).strip().lower()
+        return (provider, value) if value.startswith('tt') else None
+    try:
+        return (provider, int(value))
+    except (TypeError, ValueError):
+        return None
+
+
+def _index_providers(series_list):
+    index = {}
+    for series in series_list:
+        for provider, field in (('tvdb', 'tvdbId'), ('tmdb', 'tmdbId'), ('imdb', 'imdbId')):
+            key = _provider_key(provider, series.get(field))
+            if key:
+                index.setdefault(key, series)
+    return index
+
+
+def invalidate(reason=None):
+    """Force the next read to fetch the series list from Sonarr."""
+    global _invalidated, _generation
+    with _lock:
+        _invalidated = True
+        _generation += 1
+    logger.info(f"Series catalog invalidated{f' ({reason})' if reason else ''}")
+
+
+def is_unmatched(keys):
+    """True if any of the lookup keys recently failed to match a series."""
+    now = time.monotonic()
+    with _lock:
+        for key in keys:
+            missed_at = _unmatched.get(key)
+            if missed_at is not None:
+                if now - missed_at < UNMATCHED_CACHE_TTL:
+                    return True
+                del _unmatched[key]
+    return False
+
+
+def record_unmatched(keys):
+    """Remember lookup keys (normalized titles, provider IDs) that matched no series."""
+    now = time.monotonic()
+    with _lock:
+        for key in keys:
+            _unmatched[key] = now
+
+
+def clear_unmatched():
+    with _lock:
+        _unmatched.clear()
+
+
+def _refresh():
+    """Fetch the series list from Sonarr and replace the cached copy."""
+    global _series, _by_id, _by_provider, _fetched_at, _invalidated, _fetch_count
+    with _lock:
+        seen = _fetch_count
+    with _fetch_lock:
+        # Another thread may have refreshed while we waited for the lock
+        with _lock:
+            if _fetch_count != seen and not _invalidated:
+                return _series
+            generation = _generation
+        try:
+            response = sonarr.get("/api/v3/series")
+            if not response.ok:
+                logger.error(f"Failed to fetch series list. Status: {response.status_code}")
+                return None
+            series_list = response.json()
+        except Exception as e:
+            logger.error(f"Failed to fetch series list: {str(e)}")
+            return None
+
+        with _lock:
+            _series = series_list
+            _by_id = {s['id']: s for s in series_list}
+            _by_provider = _index_providers(series_list)
+            _fetched_at = time.monotonic()
+            _fetch_count += 1
+            # An invalidation that arrived mid-fetch still forces another refresh
+            _invalidated = generation != _generation
+        logger.debug(f"Series catalog refreshed with {len(series_list)} series")
+        return series_list
+
+
+def _refresh_in_background():
+    global _refreshing
+    with _lock:
+        if _refreshing:
+            return
+        _refreshing = True
+
+    def run():
+        global _refreshing
+        try:
+            _refresh()
+        finally:
+            with _lock:
+                _refreshing = False
+
+    threading.Thread(target=run, name='series-catalog-refresh', daemon=True).start()
+
+
+def _on_series_event(event):
+    # Pushed series updates also fire for routine metadata refreshes; only
+    # membership changes and edits made through the UI/webhook need a refetch
+    if event['action'] in ('added', 'deleted') or event['source'] == 'webhook':
+        invalidate(f"series {event['action']}")
+    # A new or edited series may be the one an earlier lookup missed
+    if event['action'] == 'added' or event['source'] == 'webhook':
+        clear_unmatched()
+
+
+event_bus.subscribe('series', _on_series_event)
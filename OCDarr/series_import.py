@@ -0,0 +1,78 @@
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+
+# SeriesAdd webhooks are collected for NEW_SERIES_BATCH_WINDOW seconds and
+# handled together, so a list import of dozens of shows shares its Sonarr
+# calls instead of running the default rule once per webhook.
+NEW_SERIES_BATCH_WINDOW = float(os.getenv('NEW_SERIES_BATCH_WINDOW', 3))
+NEW_SERIES_BATCH_MAX = int(os.getenv('NEW_SERIES_BATCH_MAX', 100))
+
+logger = logging.getLogger(__name__)
+
+_added = queue.Queue()
+_handler = None
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def start(handler):
+    """
+    Start the batching thread; handler(series_ids) processes each batch.
+
+    The handler returns {series_id: error} for series that failed (their Futures
+    fail) and sets its own deadlines; raising fails the whole batch.
+    """
+    global _handler, _worker
+    with _worker_lock:
+        _handler = handler
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_run, name='series-import', daemon=True)
+            _worker.start()
+
+
+def submit(series_id):
+    """Queue a newly added series for the next batch and return a Future for the batch's outcome."""
+    future = Future()
+    _added.put((int(series_id), future))
+    return future
+
+
+def pending_count():
+    return _added.qsize()
+
+
+def _next_batch():
+    """Block for the first series, then collect whatever arrives within the window."""
+    batch = [_added.get()]
+    closes_at = time.monotonic() + NEW_SERIES_BATCH_WINDOW
+    while len(batch) < NEW_SERIES_BATCH_MAX:
+        remaining = closes_at - time.monotonic()
+        if remaining <= 0:
+            break
+        try:
+            batch.append(_added.get(timeout=remaining))
+        except queue.Empty:
+            break
+    return batch
+
+
+def _run():
+    while True:
+        batch = _next_batch()
+        # Sonarr can send the same SeriesAdd twice; keep arrival order
+        series_ids = list(dict.fromkeys(series_id for series_id, _ in batch))
+        logger.info(f"Processing {len(series_ids)} newly added series: {series_ids}")
+        try:
+            failed = _handler(series_ids) or {}
+        except Exception as e:
+            logger.error(f"Error processing new series {series_ids}: {str(e)}", exc_info=True)
+            failed = dict.fromkeys(series_ids, e)
+        for series_id, future in batch:
+            if series_id in failed:
+                future.set_exception(failed[series_id])
+            else:
+                future.set_result(True)
@@ -1,19 +1,29 @@
 import os
+import time
+import threading
 import requests
 import logging
 import json
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from dotenv import load_dotenv
 from logging.handlers import RotatingFileHandler
-
-# Load settings from a JSON configuration file
+from api_client import sonarr, deadline, remaining_time, CONNECT_TIMEOUT, READ_TIMEOUT
+import series_catalog
+import library_mirror
+import episode_cache
+import title_index
+import rule_planner
+import config_store
+import episode_index
+import search_coalescer
+import deletion_queue
+
+CONFIG_PATH = os.getenv('CONFIG_PATH', '/app/config/config.json')
+
+# Load settings from the JSON configuration file; re-read only when it changes
 def load_config():
-    config_path = os.getenv('CONFIG_PATH', '/app/config/config.json')
-    with open(config_path, 'r') as file:
-        config = json.load(file)
-    # Ensure required keys are present with default values
-    if 'rules' not in config:
-        config['rules'] = {}
-    return config
+    return config_store.get_store(CONFIG_PATH).get()
 
 config = load_config()
 
@@ -25,6 +35,22 @@ SONARR_URL = os.getenv('SONARR_URL')
 SONARR_API_KEY = os.getenv('SONARR_API_KEY')
 LOG_PATH = os.getenv('LOG_PATH', '/app/logs/app.log')
 MISSING_LOG_PATH = os.getenv('MISSING_LOG_PATH', '/app/logs/missing.log')
+# Independent parts of a rule run (unmonitor, monitor+search, deletes) run in parallel
+RULE_EXECUTOR_WORKERS = int(os.getenv('RULE_EXECUTOR_WORKERS', 3))
+# Sonarr pages the download queue (10 records by default)
+QUEUE_PAGE_SIZE = int(os.getenv('QUEUE_PAGE_SIZE', 1000))
+
+# Single episode file deletes in flight at once, when Sonarr has no bulk delete
+DELETE_CONCURRENCY = int(os.getenv('DELETE_CONCURRENCY', 4))
+
+_rule_executor = ThreadPoolExecutor(max_workers=RULE_EXECUTOR_WORKERS, thread_name_prefix='rule-exec')
+_delete_executor = ThreadPoolExecutor(max_workers=DELETE_CONCURRENCY, thread_name_prefix='file-delete')
+_bulk_delete_supported = None   # unknown until the first bulk delete
+
+# One rule run at a time per series, so monitor/unmonitor/delete calls of
+# events for the same show never interleave
+_series_locks = {}
+_series_locks_guard = threading.Lock()
 
 
 # Setup logging
@@ -50,7 +76,7 @@ def send_webhook():
     """Send a webhook request."""
     url = "http://192.168.254.64:8123/api/webhook/wakeoffice"
     try:
-        response = requests.post(url)
+        response = requests.post(url, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
         if response.status_code == 200:
             logging.info("Webhook request sent successfully.")
         else:
@@ -88,13 +114,15 @@ def get_server_activity():
 def get_series_id(series_name):
     """Fetch series ID by name from Sonarr with flexible matching."""
     logger.info(f"Searching for series: {series_name}")
-    url = f"{SONARR_URL}/api/v3/series"
-    headers = {'X-Api-Key': SONARR_API_KEY}
-    response = requests.get(url, headers=headers)
-    if response.ok:
-        series_list = response.json()
-        logger.info(f"Found {len(series_list)} series in Sonarr")
-        logger.info(f"Available series: {[s['title'] for s in series_list]}")
+    series_list = series_catalog.get_all_series()
+    if series_list is not None:
+        logger.debug(f"Found {len(series_list)} series in Sonarr")
+        # Exact match ignoring accents, punctuation and the year, including Sonarr's
+        # alternate titles ('Shogun' -> 'Shōgun (2024)'); no fuzzy guesses, rules delete files
+        series = title_index.best_match(series_name, title_index.EXACT_MATCH_MIN_SCORE, series_list)
+        if series:
+            logger.info(f"Found match: {series['title']}")
+            return series['id']
         search_name = series_name.lower().replace('the ', '').replace(' ', '')
         
         # Try exact match first
@@ -123,312 +151,406 @@ def get_series_id(series_name):
                     return series['id']
         
         missing_logger.info(f"Series not found in Sonarr: {series_name}")
-        # Log all available series for debugging
-        logger.debug(f"Available series in Sonarr: {[s['title'] for s in series_list]}")
     else:
         logger.error("Failed to fetch series from Sonarr.")
     return 
 
-def has_tag(series_id, tag_name):
-    """Check if a series has a specific tag."""
-    try:
-        # First get the tag ID for the tag name
-        tag_url = f"{SONARR_URL}/api/v3/tag"
-        headers = {'X-Api-Key': SONARR_API_KEY}
-        
-        tag_response = requests.get(tag_url, headers=headers)
-        if not tag_response.ok:
-            logger.error(f"Failed to fetch tags: {tag_response.status_code}")
-            return False
-            
-        tags = tag_response.json()
-        tag_id = next((tag['id'] for tag in tags if tag['label'].lower() == tag_name.lower()), None)
-        
-        if tag_id is None:
-            logger.warning(f"Tag '{tag_name}' not found in Sonarr")
-            return False
-        
-        # Now check if the series has this tag
-        series_url = f"{SONARR_URL}/api/v3/series/{series_id}"
-        series_response = requests.get(series_url, headers=headers)
-        
-        if not series_response.ok:
-            logger.error(f"Failed to fetch series {series_id}: {series_response.status_code}")
-            return False
-            
-        series = series_response.json()
-        return tag_id in series.get('tags', [])
-        
-    except Exception as e:
-        logger.error(f"Error checking if series has tag: {str(e)}")
-        return False
-    
-def get_episode_details(series_id, season_number):
-    """Fetch details of episodes for a specific series and season from Sonarr."""
-    url = f"{SONARR_URL}/api/v3/episode?seriesId={series_id}&seasonNumber={season_number}"
-    headers = {'X-Api-Key': SONARR_API_KEY}
-    response = requests.get(url, headers=headers)
-    if response.ok:
-        return response.json()
-    logger.error("Failed to fetch episode details.")
-    return []
-
-def monitor_or_search_episodes(episode_ids, action_option):
-    """Either monitor or trigger a search for episodes in Sonarr based on the action_option."""
-    monitor_episodes(episode_ids, True)
-    if action_option == "search":
-        trigger_episode_search_in_sonarr(episode_ids)
+def get_tag_id(tag_name):
+    """Look up a Sonarr tag ID by label, or None."""
+    tag_response = sonarr.get("/api/v3/tag")
+    if not tag_response.ok:
+        logger.error(f"Failed to fetch tags: {tag_response.status_code}")
+        return None
+    tag_id = next((tag['id'] for tag in tag_response.json() if tag['label'].lower() == tag_name.lower()), None)
+    if tag_id is None:
+        logger.warning(f"Tag '{tag_name}' not found in Sonarr")
+    return tag_id
+
+def series_with_tag(series_ids, tag_name):
+    """
+    The subset of series_ids that carry a tag, with one tag lookup for all of them.
+
+    Raises if a series can't be read, rather than treating it as untagged.
+    """
+    tag_id = get_tag_id(tag_name)
+    if tag_id is None:
+        return set()
+    tagged = set()
+    for series_id in series_ids:
+        series = series_catalog.get_series(series_id)
+        if series is None:
+            response = sonarr.get(f"/api/v3/series/{series_id}")
+            if not response.ok:
+                raise RuntimeError(f"Failed to read series {series_id}. Status: {response.status_code}")
+            series = response.json()
+        if tag_id in series.get('tags', []):
+            tagged.add(series_id)
+    return tagged
 
 def monitor_episodes(episode_ids, monitor=True):
-    """Set episodes to monitored or unmonitored in Sonarr."""
-    url = f"{SONARR_URL}/api/v3/episode/monitor"
-    headers = {'X-Api-Key': SONARR_API_KEY, 'Content-Type': 'application/json'}
+    """Set episodes to monitored or unmonitored in Sonarr. Returns True on success."""
     data = {"episodeIds": episode_ids, "monitored": monitor}
-    response = requests.put(url, json=data, headers=headers)
+    response = sonarr.put("/api/v3/episode/monitor", json=data)
+    action = "monitored" if monitor else "unmonitored"
     if response.ok:
-        action = "monitored" if monitor else "unmonitored"
         logger.info(f"Episodes {episode_ids} successfully {action}.")
+        library_mirror.set_monitored(episode_ids, monitor)
+        episode_cache.set_monitored(episode_ids, monitor)
     else:
         logger.error(f"Failed to set episodes {action}. Response: {response.text}")
+    return response.ok
 
-def trigger_episode_search_in_sonarr(episode_ids):
-    """Trigger a search for specified episodes in Sonarr."""
-    url = f"{SONARR_URL}/api/v3/command"
-    headers = {'X-Api-Key': SONARR_API_KEY, 'Content-Type': 'application/json'}
-    data = {"name": "EpisodeSearch", "episodeIds": episode_ids}
-    response = requests.post(url, json=data, headers=headers)
-    if response.ok:
-        logger.info("Episode search command sent to Sonarr successfully.")
-    else:
-        logger.error(f"Failed to send episode search command. Response: {response.text}")
+def trigger_episode_search_in_sonarr(episode_ids, series_id=None):
+    """Queue a search for specified episodes; searches are merged and paced by the coalescer."""
+    search_coalescer.request_search(episode_ids, series_id)
 
 def unmonitor_episodes(episode_ids):
     """Unmonitor specified episodes in Sonarr."""
     monitor_episodes(episode_ids, False)
 
-def find_episodes_to_delete(all_episodes, keep_watched, last_watched_id):
-    """Find episodes to delete, ensuring they're not in the keep list and have files."""
-    episodes_to_delete = []
-    if keep_watched == "all":
-        return episodes_to_delete  # Skip deletion logic entirely if "all" is specified.
-    elif keep_watched == "season":
-        last_watched_season = next(ep['seasonNumber'] for ep in all_episodes if ep['id'] == last_watched_id)
-        episodes_to_delete = [ep for ep in all_episodes if ep['seasonNumber'] < last_watched_season and ep['hasFile']]
-    elif isinstance(keep_watched, int):
-        # Sort episodes by date, keeping only the specified count, including and prior to the last watched.
-        sorted_episodes = sorted(all_episodes, key=lambda ep: (ep['seasonNumber'], ep['episodeNumber']), reverse=True)
-        last_watched_index = next((i for i, ep in enumerate(sorted_episodes) if ep['id'] == last_watched_id), None)
-        keep_range = sorted_episodes[max(0, last_watched_index - keep_watched + 1):last_watched_index + 1]
-        keep_ids = {ep['id'] for ep in keep_range}
-        episodes_to_delete = [ep for ep in all_episodes if ep['id'] not in keep_ids and ep['hasFile']]
-
-    return [ep['episodeFileId'] for ep in episodes_to_delete if 'episodeFileId' in ep]
+@dataclass
+class DeletionResult:
+    """Outcome of deleting episode files: what went, what didn't and why."""
+    deleted: list = field(default_factory=list)
+    failed: dict = field(default_factory=dict)   # episode file ID -> reason
+    method: str = 'none'
+
+    @property
+    def ok(self):
+        return not self.failed
 
 def delete_episodes_in_sonarr(episode_file_ids):
-    """Delete specified episodes in Sonarr."""
+    """
+    Delete specified episode files in Sonarr.
+
+    Uses Sonarr's bulk endpoint when it has one, otherwise single deletes with
+    bounded concurrency. Returns a DeletionResult.
+    """
+    global _bulk_delete_supported
+    episode_file_ids = list(dict.fromkeys(episode_file_ids or []))
     if not episode_file_ids:
         logger.info("No episodes to delete.")
-        return
+        return DeletionResult()
 
-    failed_deletes = []
-    for episode_file_id in episode_file_ids:
+    result = None
+    if _bulk_delete_supported is not False:
         try:
-            url = f"{SONARR_URL}/api/v3/episodeFile/{episode_file_id}"
-            headers = {'X-Api-Key': SONARR_API_KEY}
-            response = requests.delete(url, headers=headers)
-            response.raise_for_status()  # Raise an HTTPError for bad responses
-            logger.info(f"Successfully deleted episode file with ID: {episode_file_id}")
-        except requests.exceptions.HTTPError as http_err:
-            logger.error(f"HTTP error occurred: {http_err} - Response: {response.text}")
-            failed_deletes.append(episode_file_id)
-        except Exception as err:
-            logger.error(f"Other error occurred: {err}")
-            failed_deletes.append(episode_file_id)
-
-    if failed_deletes:
-        logger.error(f"Failed to delete the following episode files: {failed_deletes}")
-
-def fetch_next_episodes(series_id, season_number, episode_number, get_option):
-    """Fetch the next num_episodes episodes starting from the given season and episode."""
-    next_episode_ids = []
+            response = sonarr.delete("/api/v3/episodefile/bulk", json={"episodeFileIds": episode_file_ids})
+            if response.ok:
+                _bulk_delete_supported = True
+                result = DeletionResult(deleted=episode_file_ids, method='bulk')
+            elif response.status_code in (404, 405):
+                logger.info("Sonarr has no bulk episode file delete, using single deletes")
+                _bulk_delete_supported = False
+            else:
+                logger.warning(f"Bulk delete failed ({response.status_code}), retrying files one by one")
+        except Exception as e:
+            logger.warning(f"Bulk delete failed ({str(e)}), retrying files one by one")
+
+    if result is None:
+        result = DeletionResult(method='single')
+        outcomes = list(_delete_executor.map(_carry_deadline(_delete_episode_file), episode_file_ids))
+        for episode_file_id, error in zip(episode_file_ids, outcomes):
+            if error is None:
+                result.deleted.append(episode_file_id)
+            else:
+                result.failed[episode_file_id] = error
+
+    if result.deleted:
+        logger.info(f"Deleted {len(result.deleted)} episode files ({result.method}): {result.deleted}")
+    library_mirror.mark_files_deleted(result.deleted)
+    episode_cache.mark_files_deleted(result.deleted)
+    if result.failed:
+        logger.error(f"Failed to delete the following episode files: {result.failed}")
+    return result
+
+def schedule_deletion(episode_file_ids, series_id=None):
+    """Queue episode files for deletion once playback is idle, or delete them now if deferral is off."""
+    if not episode_file_ids:
+        logger.info("No episodes to delete.")
+        return
+    if deletion_queue.is_enabled() and deletion_queue.enqueue(episode_file_ids, series_id):
+        return
+    delete_episodes_in_sonarr(episode_file_ids)
 
+def _delete_episode_file(episode_file_id):
+    """Delete one episode file; returns None on success or the failure reason."""
     try:
-        if get_option == "all":
-            # Fetch all episodes from Sonarr
-            all_episodes = fetch_all_episodes(series_id)
-            next_episode_ids.extend([ep['id'] for ep in all_episodes if ep['seasonNumber'] >= season_number])
-            return next_episode_ids
-        num_episodes = int(get_option)
-        # Get remaining episodes in the current season
-        current_season_episodes = get_episode_details(series_id, season_number)
-        next_episode_ids.extend([ep['id'] for ep in current_season_episodes if ep['episodeNumber'] > episode_number])
-
-        # Fetch episodes from the next season if needed
-        next_season_number = season_number + 1
-        while len(next_episode_ids) < num_episodes:
-            next_season_episodes = get_episode_details(series_id, next_season_number)
-            next_episode_ids.extend([ep['id'] for ep in next_season_episodes])
-            next_season_number += 1
-
-        return next_episode_ids[:num_episodes]
-    except ValueError:
-        if get_option == 'season':
-            # Fetch all remaining episodes in the current season
-            current_season_episodes = get_episode_details(series_id, season_number)
-            next_episode_ids.extend([ep['id'] for ep in current_season_episodes if ep['episodeNumber'] > episode_number])
-            return next_episode_ids
-        else:
-            raise ValueError(f"Invalid get_option value: {get_option}")
+        response = sonarr.delete(f"/api/v3/episodeFile/{episode_file_id}")
+        if response.status_code == 404:
+            # Already gone; the goal is met
+            return None
+        if not response.ok:
+            return f"HTTP {response.status_code}: {response.text[:200]}"
+        return None
+    except Exception as err:
+        return str(err)
+
+def fetch_next_episodes(series_id, season_number, episode_number, get_option, all_episodes=None):
+    """Fetch the next num_episodes episodes starting from the given season and episode."""
+    if all_episodes is None:
+        all_episodes = fetch_all_episodes(series_id)
+    return rule_planner.next_episode_ids(all_episodes, season_number, episode_number, get_option)
 
 def fetch_all_episodes(series_id):
-    """Fetch all episodes for a series from Sonarr."""
-    url = f"{SONARR_URL}/api/v3/episode?seriesId={series_id}"
-    headers = {'X-Api-Key': SONARR_API_KEY}
-    response = requests.get(url, headers=headers)
-    if response.ok:
-        return response.json()
-    logger.error("Failed to fetch all episodes.")
-    return []
-
-def delete_old_episodes(series_id, keep_episode_ids, rule):
-    """Delete old episodes that are not in the keep list."""
+    """Fetch all episodes for a series, from the episode cache or mirror when possible."""
+    episodes = episode_cache.load(series_id)
+    if episodes is None:
+        logger.error("Failed to fetch all episodes.")
+        return []
+    return episodes
+
+def plan_episodes_based_on_rules(series_id, season_number, episode_number, rule):
+    """Work out the monitor/search/delete changes a rule makes for a watched episode."""
     all_episodes = fetch_all_episodes(series_id)
-    episodes_with_files = [ep for ep in all_episodes if ep['hasFile']]
-
-    keep_watched = rule.get('keep_watched', 'all')
-
-    if keep_watched == "all":
-        logger.info("No episodes to delete as keep_watched is set to 'all'.")
+    last_watched = episode_index.get_index(all_episodes).find(season_number, episode_number)
+    if last_watched is None:
+        raise LookupError(f"Episode S{season_number}E{episode_number} not found for series {series_id}")
+    last_watched_id = last_watched['id']
+    next_episode_ids = fetch_next_episodes(series_id, season_number, episode_number, rule.get_option, all_episodes)
+    return rule_planner.build_plan(series_id, all_episodes, last_watched_id, next_episode_ids, rule)
+
+def execute_plan(plan):
+    """
+    Apply a MutationPlan to Sonarr with one bulk call per kind of change.
+
+    Unmonitoring, monitoring plus searching, and deleting don't depend on each
+    other, so they run concurrently; monitor still happens before search.
+    """
+    # Files this run keeps must not be removed by an earlier run's queued deletion
+    if deletion_queue.is_enabled():
+        deletion_queue.cancel(plan.keep_files)
+    if plan.is_empty():
+        logger.info(f"Nothing to change for series {plan.series_id}")
+        return
+    groups = []
+    if plan.unmonitor:
+        groups.append([lambda: unmonitor_episodes(plan.unmonitor)])
+    monitor_then_search = []
+    if plan.monitor:
+        monitor_then_search.append(lambda: monitor_episodes(plan.monitor, True))
+    if plan.search:
+        monitor_then_search.append(lambda: trigger_episode_search_in_sonarr(plan.search, plan.series_id))
+    if monitor_then_search:
+        groups.append(monitor_then_search)
+    if plan.delete_files:
+        groups.append([lambda: schedule_deletion(plan.delete_files, plan.series_id)])
+    _run_in_parallel(groups)
+
+def _carry_deadline(fn):
+    """Wrap fn so worker threads honour the calling thread's deadline (deadlines are per thread)."""
+    remaining = remaining_time()
+    expires = None if remaining is None else time.monotonic() + remaining
+
+    def wrapper(*args):
+        with deadline(None if expires is None else max(0, expires - time.monotonic())):
+            return fn(*args)
+    return wrapper
+
+def _run_in_parallel(groups):
+    """Run each group's steps in order, groups concurrently; re-raise the first failure."""
+    if len(groups) == 1:
+        for step in groups[0]:
+            step()
         return
 
-    if keep_watched == "season":
-        last_watched_season = max(ep['seasonNumber'] for ep in all_episodes if ep['id'] in keep_episode_ids)
-        episodes_to_delete = [ep['episodeFileId'] for ep in episodes_with_files if ep['seasonNumber'] < last_watched_season and ep['id'] not in keep_episode_ids]
-    else:
-        episodes_to_delete = [ep['episodeFileId'] for ep in episodes_with_files if ep['id'] not in keep_episode_ids]
-
-    delete_episodes_in_sonarr(episodes_to_delete)
-
-def process_episodes_based_on_rules(series_id, season_number, episode_number, rule):
-    """Fetch, monitor/search, and delete episodes based on defined rules."""
-    all_episodes = fetch_all_episodes(series_id)
-    last_watched_id = next(ep['id'] for ep in all_episodes if ep['seasonNumber'] == season_number and ep['episodeNumber'] == episode_number)
-
-    if not rule['monitor_watched']:
-        unmonitor_episodes([last_watched_id])
-
-    next_episode_ids = fetch_next_episodes(series_id, season_number, episode_number, rule['get_option'])
-    monitor_or_search_episodes(next_episode_ids, rule['action_option'])
-
-    episodes_to_delete = find_episodes_to_delete(all_episodes, rule['keep_watched'], last_watched_id)
-    delete_episodes_in_sonarr(episodes_to_delete)
-
-    if rule['keep_watched'] != "all":
-        keep_episode_ids = next_episode_ids + [last_watched_id]
-        delete_old_episodes(series_id, keep_episode_ids, rule)
+    def run(steps):
+        for step in steps:
+            step()
+
+    run = _carry_deadline(run)
+    futures = [_rule_executor.submit(run, steps) for steps in groups]
+    errors = [future.exception() for future in futures]
+    for error in errors:
+        if error is not None:
+            raise error
+
+def process_episodes_based_on_rules(series_id, season_number, episode_number, rule, dry_run=False):
+    """Fetch, monitor/search, and delete episodes based on defined rules. Returns the plan."""
+    plan = plan_episodes_based_on_rules(series_id, season_number, episode_number, rule)
+    logger.info(f"Rule plan for series {series_id}: {plan.to_dict()}")
+    if not dry_run:
+        execute_plan(plan)
+    return plan
         
-def apply_default_rule_to_new_series(series_id):
-    """Apply default 1n1 rule to a newly added series, handling monitored season(s)."""
-    url = f"{SONARR_URL}/api/v3/episode?seriesId={series_id}"
-    headers = {'X-Api-Key': SONARR_API_KEY}
-    
-    try:
-        response = requests.get(url, headers=headers)
-        if response.ok:
-            episodes = response.json()
-            
-            # Group monitored episodes by season
-            monitored_seasons = {}
-            for ep in episodes:
-                if ep['monitored']:
-                    season = ep['seasonNumber']
-                    if season not in monitored_seasons:
-                        monitored_seasons[season] = []
-                    monitored_seasons[season].append(ep)
-            
-            if not monitored_seasons:
-                logger.info(f"No monitored seasons found for series {series_id}")
-                return
-                
-            logger.info(f"Found monitored seasons: {list(monitored_seasons.keys())}")
-            
-            # Process each monitored season
-            for season_number, season_episodes in monitored_seasons.items():
-                if season_number == 0:  # Skip specials
-                    continue
-                    
-                # Sort episodes by number
-                season_episodes.sort(key=lambda x: x['episodeNumber'])
-                
-                logger.info(f"Processing season {season_number}")
-                
-                # Monitor only episode 1
-                for ep in season_episodes:
-                    if ep['episodeNumber'] == 1:
-                        monitor_episodes([ep['id']], True)
-                        logger.info(f"Monitoring S{season_number}E1")
-                    else:
-                        monitor_episodes([ep['id']], False)
-                        logger.info(f"Unmonitoring S{season_number}E{ep['episodeNumber']}")
-                
-                # Cancel any active downloads except episode 1
-                cancel_downloads_after_episode(series_id, season_number, 1)
-                
-    except Exception as e:
-        logger.error(f"Error applying rule to new series: {str(e)}")
-
-def cancel_downloads_after_episode(series_id, season_number, cutoff_episode):
-    """Cancel any active downloads for episodes after the specified episode in the season."""
-    url = f"{SONARR_URL}/api/v3/queue"
-    headers = {'X-Api-Key': SONARR_API_KEY}
-    
+def apply_default_rule_to_series(series_ids):
+    """
+    Apply the default 1n1 rule to newly added series in bulk.
+
+    For every monitored season (specials excluded) episode 1 stays monitored and the
+    rest are unmonitored. All series share two monitor calls and one queue lookup.
+    Each series' episode fetch and each shared call gets its own deadline.
+
+    :return: {series_id: error} for the series the rule could not be applied to
+    """
+    failed = {}
+    monitor_ids, unmonitor_ids, cutoffs = {}, {}, {}
+    for series_id in series_ids:
+        try:
+            with deadline():
+                episodes = episode_cache.load(series_id)
+            if episodes is None:
+                raise RuntimeError(f"Failed to fetch episodes for series {series_id}")
+        except Exception as e:
+            logger.error(f"Error applying rule to new series {series_id}: {str(e)}")
+            failed[series_id] = e
+            continue
+        monitored_seasons = sorted({ep['seasonNumber'] for ep in episodes if ep['monitored'] and ep['seasonNumber'] != 0})
+        if not monitored_seasons:
+            logger.info(f"No monitored seasons found for series {series_id}")
+            continue
+        logger.info(f"Found monitored seasons for series {series_id}: {monitored_seasons}")
+        episodes = [ep for ep in episodes if ep['seasonNumber'] in monitored_seasons]
+        monitor_ids[series_id] = [ep['id'] for ep in episodes if ep['episodeNumber'] == 1]
+        unmonitor_ids[series_id] = [ep['id'] for ep in episodes if ep['episodeNumber'] != 1 and ep['monitored']]
+        for season_number in monitored_seasons:
+            cutoffs[(series_id, season_number)] = 1
+
+    for monitored, ids_by_series in ((True, monitor_ids), (False, unmonitor_ids)):
+        pending = {series_id: ids for series_id, ids in ids_by_series.items() if ids and series_id not in failed}
+        if not pending:
+            continue
+        try:
+            with deadline():
+                if not monitor_episodes([ep_id for ids in pending.values() for ep_id in ids], monitored):
+                    raise RuntimeError("Sonarr rejected the monitor update")
+        except Exception as e:
+            logger.error(f"Error applying rule to new series {sorted(pending)}: {str(e)}")
+            failed.update((series_id, e) for series_id in pending)
+
+    # Cancel any active downloads except episode 1
+    cutoffs = {key: cutoff for key, cutoff in cutoffs.items() if key[0] not in failed}
+    if cutoffs:
+        with deadline():
+            cancel_downloads_after_episodes(cutoffs)
+    return failed
+
+def cancel_downloads_after_episodes(cutoffs):
+    """
+    Cancel active downloads past a cutoff episode, reading the queue once.
+
+    :param cutoffs: {(series_id, season_number): last episode number to keep}
+    """
     try:
-        response = requests.get(url, headers=headers)
+        response = sonarr.get("/api/v3/queue", params={'pageSize': QUEUE_PAGE_SIZE, 'includeEpisode': 'true'})
         if response.ok:
             queue = response.json()
             for item in queue['records']:
-                if (item['seriesId'] == series_id and 
-                    item['episode']['seasonNumber'] == season_number and 
-                    item['episode']['episodeNumber'] > cutoff_episode):
-                    
-                    # Cancel the download
-                    cancel_url = f"{SONARR_URL}/api/v3/queue/{item['id']}"
-                    cancel_response = requests.delete(cancel_url, headers=headers, 
-                                                    params={'removeFromClient': 'true'})
+                episode = item.get('episode') or {}
+                cutoff_episode = cutoffs.get((item.get('seriesId'), episode.get('seasonNumber')))
+                if cutoff_episode is None or episode.get('episodeNumber', 0) <= cutoff_episode:
+                    continue
                     
-                    if cancel_response.ok:
-                        logger.info(f"Cancelled download for S{season_number}E{item['episode']['episodeNumber']}")
-                    else:
-                        logger.error(f"Failed to cancel download for S{season_number}E{item['episode']['episodeNumber']}")
+                # Cancel the download
+                cancel_response = sonarr.delete(f"/api/v3/queue/{item['id']}",
+                                                params={'removeFromClient': 'true'})
+                
+                if cancel_response.ok:
+                    logger.info(f"Cancelled download for series {item['seriesId']} S{episode['seasonNumber']}E{episode['episodeNumber']}")
+                else:
+                    logger.error(f"Failed to cancel download for series {item['seriesId']} S{episode['seasonNumber']}E{episode['episodeNumber']}")
     except Exception as e:
         logger.error(f"Error cancelling downloads: {str(e)}")
 
 def main():
-    series_name, season_number, episode_number = get_server_activity()
-    
-    # Load configuration
-    config = load_config()
-    default_rule = config.get('default_rule', '1n1')
-
-    if series_name:
-        series_id = get_series_id(series_name)
-        if series_id:
-            # Find the specific rule for the series, else apply the default rule '1n1'
-            rule = next((details for key, details in config['rules'].items() if str(series_id) in details.get('series', [])), None)
-            
-            # Apply the default rule if no specific rule is found
-            if not rule:
-                rule = config['rules'].get(default_rule)
-                logger.info(f"Applying default rule '{default_rule}': {rule}")
-            else:
-                logger.info(f"Applying specific rule: {rule}")
-                
-            process_episodes_based_on_rules(series_id, season_number, episode_number, rule)
+    with deadline():
+        series_name, season_number, episode_number = get_server_activity()
+        if series_name:
+            process_playback(series_name, season_number, episode_number)
+            # Run as a script, the process exits before the coalescer would flush
+            search_coalescer.drain()
         else:
-            logger.error(f"Series ID not found for series: {series_name}")
+            logger.error("No server activity found.")
+            send_webhook()  # Trigger webhook if no server activity is found
+
+def resolve_series_id(series_name, provider_ids=None):
+    """
+    Resolve a Sonarr series ID, preferring provider IDs over the title.
+
+    provider_ids may hold 'tvdb', 'tmdb' and 'imdb' series IDs and an
+    'episode_tvdb' episode ID; title matching is only the fallback. A miss is
+    logged once; repeats within the unmatched TTL only log at debug.
+    """
+    provider_ids = provider_ids or {}
+    series = series_catalog.find_by_provider_ids(provider_ids.get('tvdb'), provider_ids.get('tmdb'),
+                                                 provider_ids.get('imdb'))
+    if series:
+        logger.info(f"Matched {series_name} to {series['title']} by provider ID")
+        return series['id']
+    if provider_ids.get('episode_tvdb'):
+        episode = library_mirror.find_episode_by_tvdb(provider_ids['episode_tvdb'])
+        if episode:
+            logger.info(f"Matched {series_name} to series {episode['seriesId']} by episode TVDB ID")
+            return episode['seriesId']
+
+    # Shows Sonarr doesn't have (Plex-only libraries, misrouted movies) are
+    # remembered so repeated progress events skip the title lookup and logging.
+    # Provider IDs are always tried first, so an earlier title miss can't hide them
+    lookup_keys = [f"title:{title_index.normalize(series_name)}"]
+    lookup_keys += [f"{provider}:{value}".lower() for provider, value in provider_ids.items() if value]
+    if series_catalog.is_unmatched(lookup_keys):
+        logger.debug(f"Skipping lookup for recently unmatched series: {series_name}")
+        return None
+    series_id = get_series_id(series_name)
+    if not series_id:
+        logger.error(f"Series ID not found for series: {series_name}")
+        if series_catalog.get_all_series() is not None:
+            series_catalog.record_unmatched(lookup_keys)
+    return series_id
+
+def resolve_episode_numbers(series_id, season_number, episode_number, provider_ids=None):
+    """Use Sonarr's numbering for the episode when its TVDB ID is known (e.g. absolute-numbered shows)."""
+    tvdb_id = (provider_ids or {}).get('episode_tvdb')
+    if tvdb_id:
+        try:
+            tvdb_id = int(tvdb_id)
+        except (TypeError, ValueError):
+            return season_number, episode_number
+        for ep in fetch_all_episodes(series_id):
+            if ep.get('tvdbId') == tvdb_id:
+                return ep['seasonNumber'], ep['episodeNumber']
+    return season_number, episode_number
+
+def get_rule_set():
+    """Compiled rules for the current config.json, recompiled when the file changes."""
+    return config_store.get_store(CONFIG_PATH).rule_set()
+
+def get_rule_for_series(series_id):
+    """The rule assigned to a series in config.json, else the default rule."""
+    rule_set = get_rule_set()
+    rule = rule_set.rule_for(series_id)
+    if str(series_id) in rule_set.rule_of_series:
+        logger.info(f"Applying specific rule: {rule}")
     else:
-        logger.error("No server activity found.")
-        send_webhook()  # Trigger webhook if no server activity is found
+        logger.info(f"Applying default rule '{rule_set.default_rule}': {rule}")
+    return rule
+
+def series_lock(series_id):
+    """The lock serializing rule runs for a series."""
+    with _series_locks_guard:
+        lock = _series_locks.get(series_id)
+        if lock is None:
+            lock = _series_locks[series_id] = threading.Lock()
+        return lock
+
+def process_playback(series_name, season_number, episode_number, provider_ids=None, dry_run=False):
+    """
+    Apply the matching rule for a watched episode. Returns True if a rule was applied.
+
+    With dry_run, nothing is changed and the MutationPlan is returned instead (None if
+    the series is unknown).
+    """
+    series_id = resolve_series_id(series_name, provider_ids)
+    if not series_id:
+        return None if dry_run else False
+
+    season_number, episode_number = resolve_episode_numbers(series_id, season_number, episode_number, provider_ids)
+    rule = get_rule_for_series(series_id)
+    if dry_run:
+        return process_episodes_based_on_rules(series_id, season_number, episode_number, rule, dry_run=True)
+    with series_lock(series_id):
+        process_episodes_based_on_rules(series_id, season_number, episode_number, rule)
+    return True
 
 
 if __name__ == "__main__":
@@ -0,0 +1,191 @@
+import os
+import json
+import time
+import random
+import asyncio
+import logging
+import threading
+from urllib.parse import urlsplit, urlunsplit
+from api_client import SONARR_URL, SONARR_API_KEY
+import event_bus
+
+try:
+    import websockets
+except ImportError:
+    websockets = None
+
+# Sonarr pushes change notifications over SignalR at /signalr/messages
+SIGNALR_PATH = '/signalr/messages'
+# Older releases defaulted SONARR_WS_URL to this path; Sonarr has no push endpoint there
+LEGACY_WS_PATH = '/api/v3/notification'
+
+
+def _default_ws_url():
+    parts = urlsplit(SONARR_URL)
+    scheme = 'wss' if parts.scheme == 'https' else 'ws'
+    return urlunsplit((scheme, parts.netloc, parts.path.rstrip('/') + SIGNALR_PATH, '', ''))
+
+
+def _migrate_ws_url(url):
+    """Point a SONARR_WS_URL set for the old /api/v3/notification endpoint at SignalR on the same host."""
+    parts = urlsplit(url)
+    path = parts.path.rstrip('/')
+    if not path.endswith(LEGACY_WS_PATH):
+        return url
+    return urlunsplit((parts.scheme, parts.netloc, path[:-len(LEGACY_WS_PATH)] + SIGNALR_PATH, '', ''))
+
+
+CONFIGURED_WS_URL = os.getenv('SONARR_WS_URL')
+SONARR_WS_URL = _migrate_ws_url(CONFIGURED_WS_URL) if CONFIGURED_WS_URL else _default_ws_url()
+SONARR_PUSH_EVENTS = os.getenv('SONARR_PUSH_EVENTS', 'true').lower() == 'true'
+PUSH_RECONNECT_MIN = float(os.getenv('SONARR_PUSH_RECONNECT_MIN', 1))
+PUSH_RECONNECT_MAX = float(os.getenv('SONARR_PUSH_RECONNECT_MAX', 60))
+PUSH_PING_INTERVAL = float(os.getenv('SONARR_PUSH_PING_INTERVAL', 15))
+
+logger = logging.getLogger(__name__)
+
+# SignalR JSON hub protocol
+RECORD_SEPARATOR = '\x1e'
+HANDSHAKE = json.dumps({'protocol': 'json', 'version': 1}) + RECORD_SEPARATOR
+MESSAGE_INVOCATION = 1
+MESSAGE_PING = 6
+MESSAGE_CLOSE = 7
+
+# Webhook eventType -> (resource name, action)
+WEBHOOK_EVENTS = {
+    'SeriesAdd': ('series', 'added'),
+    'SeriesEdit': ('series', 'updated'),
+    'SeriesDelete': ('series', 'deleted'),
+    'Download': ('episodefile', 'updated'),
+    'Rename': ('episodefile', 'updated'),
+    'EpisodeFileDelete': ('episodefile', 'deleted'),
+    'Grab': ('queue', 'updated'),
+}
+
+_thread = None
+_connected = False
+_last_message_at = None
+
+
+def decode_messages(raw):
+    """
+    Split a SignalR frame into bus events.
+
+    :param raw: Text frame, possibly holding several records
+    :return: List of events for receiveMessage invocations
+    """
+    events = []
+    for record in raw.split(RECORD_SEPARATOR):
+        if not record.strip():
+            continue
+        try:
+            message = json.loads(record)
+        except ValueError:
+            logger.warning(f"Ignoring undecodable push message: {record[:200]}")
+            continue
+        if message.get('type') == MESSAGE_CLOSE:
+            raise ConnectionError(f"Sonarr closed the push connection: {message.get('error') or 'no reason'}")
+        if message.get('type') != MESSAGE_INVOCATION or message.get('target') != 'receiveMessage':
+            continue
+        for argument in message.get('arguments', []):
+            name = argument.get('name')
+            body = argument.get('body') or {}
+            if not name:
+                continue
+            events.append(event_bus.make_event(name, body.get('action', 'updated'), body.get('resource')))
+    return events
+
+
+def publish_webhook(data):
+    """Publish a Sonarr webhook payload on the event bus. Returns the event, or None if it maps to nothing."""
+    mapping = WEBHOOK_EVENTS.get(data.get('eventType'))
+    if not mapping:
+        return None
+    name, action = mapping
+    series = data.get('series') or {}
+    if name == 'series':
+        resource = series
+    elif name == 'episodefile':
+        resource = dict(data.get('episodeFile') or {}, seriesId=series.get('id'))
+    else:
+        resource = {'seriesId': series.get('id'), 'episodes': data.get('episodes', [])}
+    event = event_bus.make_event(name, action, resource, series_id=series.get('id'),
+                                 source='webhook', event_type=data.get('eventType'))
+    event_bus.publish(event)
+    return event
+
+
+async def _keepalive(ws):
+    # SignalR drops clients that stay silent for longer than its client timeout
+    while True:
+        await asyncio.sleep(PUSH_PING_INTERVAL)
+        await ws.send(json.dumps({'type': MESSAGE_PING}) + RECORD_SEPARATOR)
+
+
+async def _listen():
+    global _connected, _last_message_at
+    url = f"{SONARR_WS_URL}?access_token={SONARR_API_KEY}"
+    async with websockets.connect(url, ping_interval=None, close_timeout=5) as ws:
+        await ws.send(HANDSHAKE)
+        reply = await asyncio.wait_for(ws.recv(), timeout=10)
+        handshake = json.loads(reply.split(RECORD_SEPARATOR)[0] or '{}')
+        if handshake.get('error'):
+            raise ConnectionError(f"Push handshake rejected: {handshake['error']}")
+
+        _connected = True
+        logger.info(f"Connected to Sonarr push events at {SONARR_WS_URL}")
+        keepalive = asyncio.ensure_future(_keepalive(ws))
+        try:
+            async for raw in ws:
+                _last_message_at = time.time()
+                if isinstance(raw, bytes):
+                    raw = raw.decode('utf-8', errors='replace')
+                for event in decode_messages(raw):
+                    event_bus.publish(event)
+        finally:
+            _connected = False
+            keepalive.cancel()
+
+
+async def consume():
+    """Consume Sonarr push events forever, reconnecting with jittered backoff."""
+    if websockets is None:
+        logger.warning("websockets is not installed; Sonarr push events disabled")
+        return
+    delay = PUSH_RECONNECT_MIN
+    while True:
+        started = time.monotonic()
+        try:
+            await _listen()
+            logger.warning("Sonarr push connection closed")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.warning(f"Sonarr push connection failed: {str(e)}")
+        # A connection that stayed up for a while resets the backoff
+        if time.monotonic() - started > PUSH_RECONNECT_MAX:
+            delay = PUSH_RECONNECT_MIN
+        wait = random.uniform(delay / 2, delay)
+        logger.info(f"Reconnecting to Sonarr push events in {wait:.1f}s")
+        await asyncio.sleep(wait)
+        delay = min(delay * 2, PUSH_RECONNECT_MAX)
+
+
+def start():
+    """Run the push consumer on its own thread and event loop."""
+    global _thread
+    if not SONARR_PUSH_EVENTS or (_thread and _thread.is_alive()):
+        return
+    if CONFIGURED_WS_URL and CONFIGURED_WS_URL != SONARR_WS_URL:
+        logger.warning(f"SONARR_WS_URL points at the old {LEGACY_WS_PATH} endpoint; using {SONARR_WS_URL} instead. "
+                       f"Update SONARR_WS_URL, or unset it to derive it from SONARR_URL.")
+    _thread = threading.Thread(target=lambda: asyncio.run(consume()), name='sonarr-push-events', daemon=True)
+    _thread.start()
+
+
+def get_status():
+    return {
+        'enabled': SONARR_PUSH_EVENTS and websockets is not None,
+        'connected': _connected,
+        'last_message_at': _last_message_at
+    }
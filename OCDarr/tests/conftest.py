@@ -0,0 +1,11 @@
+import os
+import sys
+import tempfile
+
+# The modules live flat in OCDarr/ and read their settings from the environment
+# on import, so queue databases and logs are pointed at a scratch directory first
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+_workdir = tempfile.mkdtemp(prefix='ocdarr-tests-')
+for name, filename in (('INTAKE_QUEUE_PATH', 'intake.db'), ('DELETION_QUEUE_PATH', 'deletion_queue.db'),
+                       ('LOG_PATH', 'app.log'), ('MISSING_LOG_PATH', 'missing.log')):
+    os.environ.setdefault(name, os.path.join(_workdir, filename))
@@ -0,0 +1,147 @@
+import sys
+import time
+import types
+import threading
+from dataclasses import dataclass, field
+import pytest
+import deletion_queue
+
+
+@dataclass
+class DeletionResult:
+    deleted: list = field(default_factory=list)
+    failed: dict = field(default_factory=dict)
+
+
+class FakeSonarr:
+    """Stands in for servertosonarr's delete call, which drain_once imports lazily."""
+
+    def __init__(self):
+        self.calls = []
+        self.fail = {}
+        self.during = None
+
+    def delete_episodes_in_sonarr(self, episode_file_ids):
+        self.calls.append(list(episode_file_ids))
+        if self.during:
+            self.during()
+        return DeletionResult(deleted=[i for i in episode_file_ids if i not in self.fail],
+                              failed={i: self.fail[i] for i in episode_file_ids if i in self.fail})
+
+
+@pytest.fixture
+def sonarr(monkeypatch):
+    fake = FakeSonarr()
+    module = types.ModuleType('servertosonarr')
+    module.delete_episodes_in_sonarr = fake.delete_episodes_in_sonarr
+    module.DeletionResult = DeletionResult
+    monkeypatch.setitem(sys.modules, 'servertosonarr', module)
+    return fake
+
+
+@pytest.fixture(autouse=True)
+def fresh_queue(tmp_path, monkeypatch):
+    monkeypatch.setattr(deletion_queue, 'DELETION_QUEUE_PATH', str(tmp_path / 'deletion_queue.db'))
+    monkeypatch.setattr(deletion_queue, '_local', threading.local())
+    monkeypatch.setattr(deletion_queue, '_in_flight', {})
+    monkeypatch.setattr(deletion_queue, 'start', lambda: None)
+    monkeypatch.setattr(deletion_queue, 'PLAYBACK_IDLE_SECONDS', 300)
+    monkeypatch.setattr(deletion_queue, 'DELETION_FILES_PER_MINUTE', 0)
+    monkeypatch.setattr(deletion_queue, 'DELETION_BYTES_PER_MINUTE', 0)
+    monkeypatch.setattr(deletion_queue.library_mirror, 'get_episode_file', lambda episode_file_id: None)
+    # Nothing has played yet
+    monkeypatch.setattr(deletion_queue, '_last_playback_at', float('-inf'))
+
+
+def queued():
+    return [row[0] for row in deletion_queue._connect().execute(
+        "SELECT episode_file_id FROM pending_deletions ORDER BY episode_file_id")]
+
+
+def test_drains_everything_once_playback_is_idle(sonarr):
+    deletion_queue.enqueue([11, 12, 13], series_id=1)
+    assert deletion_queue.drain_once() == 3
+    assert sonarr.calls == [[11, 12, 13]]
+    assert queued() == []
+
+
+def test_waits_while_something_is_playing(sonarr):
+    deletion_queue.enqueue([11, 12], series_id=1)
+    deletion_queue.note_playback()
+    assert deletion_queue.drain_once() == 0
+    assert sonarr.calls == []
+    assert queued() == [11, 12]
+
+
+def test_rate_limit_while_playing(sonarr, monkeypatch):
+    monkeypatch.setattr(deletion_queue, 'DELETION_FILES_PER_MINUTE', 1)
+    monkeypatch.setattr(deletion_queue, '_budget', {'files': 1.0, 'bytes': 0.0, 'updated': time.monotonic()})
+    deletion_queue.enqueue([11, 12, 13], series_id=1)
+    deletion_queue.note_playback()
+    assert deletion_queue.drain_once() == 1
+    assert queued() == [12, 13]
+
+
+def test_byte_rate_limit_uses_file_sizes(sonarr, monkeypatch):
+    sizes = {11: 400, 12: 400, 13: 400}
+    monkeypatch.setattr(deletion_queue.library_mirror, 'get_episode_file',
+                        lambda episode_file_id: {'id': episode_file_id, 'size': sizes[episode_file_id]})
+    monkeypatch.setattr(deletion_queue, 'DELETION_BYTES_PER_MINUTE', 1000)
+    monkeypatch.setattr(deletion_queue, '_budget', {'files': 0.0, 'bytes': 1000.0, 'updated': time.monotonic()})
+    deletion_queue.enqueue([11, 12, 13], series_id=1)
+    deletion_queue.note_playback()
+    assert deletion_queue.drain_once() == 2
+    assert queued() == [13]
+
+
+def test_cancel_keeps_a_queued_file(sonarr):
+    deletion_queue.enqueue([11, 12], series_id=1)
+    deletion_queue.cancel([12])
+    deletion_queue.drain_once()
+    assert sonarr.calls == [[11]]
+
+
+def test_claimed_rows_are_out_of_the_queue_during_the_call(sonarr):
+    sonarr.during = lambda: sonarr.calls.append(queued())
+    deletion_queue.enqueue([11, 12], series_id=1)
+    deletion_queue.drain_once()
+    assert sonarr.calls == [[11, 12], []]
+
+
+def test_failed_deletion_is_retried_with_backoff(sonarr):
+    sonarr.fail = {12: 'HTTP 500'}
+    deletion_queue.enqueue([11, 12], series_id=1)
+    assert deletion_queue.drain_once() == 1
+    attempts, next_attempt_at, last_error = deletion_queue._connect().execute(
+        "SELECT attempts, next_attempt_at, last_error FROM pending_deletions WHERE episode_file_id = 12"
+    ).fetchone()
+    assert (attempts, last_error) == (1, 'HTTP 500')
+    assert next_attempt_at > time.time()
+    # Not due yet
+    assert deletion_queue.drain_once() == 0
+
+
+def test_cancel_during_a_failed_deletion_is_not_retried(sonarr):
+    sonarr.fail = {12: 'HTTP 500'}
+    sonarr.during = lambda: deletion_queue.cancel([12])
+    deletion_queue.enqueue([11, 12], series_id=1)
+    deletion_queue.drain_once()
+    assert queued() == []
+    assert deletion_queue._in_flight == {}
+
+
+def test_gives_up_after_max_attempts(sonarr, monkeypatch):
+    monkeypatch.setattr(deletion_queue, 'DELETION_MAX_ATTEMPTS', 1)
+    sonarr.fail = {11: 'HTTP 500'}
+    deletion_queue.enqueue([11], series_id=1)
+    deletion_queue.drain_once()
+    assert queued() == []
+
+
+def test_unexpected_error_requeues_the_batch(sonarr):
+    def boom():
+        raise RuntimeError('connection reset')
+    sonarr.during = boom
+    deletion_queue.enqueue([11, 12], series_id=1)
+    assert deletion_queue.drain_once() == 0
+    assert queued() == [11, 12]
@@ -0,0 +1,164 @@
+import threading
+from concurrent.futures import Future
+import pytest
+import intake
+
+
+@pytest.fixture(autouse=True)
+def fresh_queue(tmp_path, monkeypatch):
+    """An empty queue per test; the consumer thread is never started, tests dispatch by hand."""
+    monkeypatch.setattr(intake, 'INTAKE_QUEUE_PATH', str(tmp_path / 'intake.db'))
+    monkeypatch.setattr(intake, '_local', threading.local())
+    monkeypatch.setattr(intake, '_handlers', {})
+    monkeypatch.setattr(intake, '_in_flight', set())
+    monkeypatch.setattr(intake, '_stats', dict.fromkeys(intake._stats, 0))
+    monkeypatch.setattr(intake, '_depth', None)
+    monkeypatch.setattr(intake, '_waiting', [])
+    monkeypatch.setattr(intake, 'start', lambda: None)
+
+
+def make_due():
+    """Skip every pending backoff."""
+    with intake._connect() as conn:
+        conn.execute("UPDATE intake_events SET next_attempt_at = 0")
+
+
+def pending():
+    return intake._connect().execute("SELECT id, attempts FROM intake_events ORDER BY id").fetchall()
+
+
+def dead_letters():
+    return intake._connect().execute("SELECT id, attempts FROM dead_letters ORDER BY id").fetchall()
+
+
+def flaky(failures):
+    """A handler that fails the first `failures` calls, recording every payload it sees."""
+    seen = []
+
+    def handler(payload):
+        seen.append(payload)
+        if len(seen) <= failures:
+            raise RuntimeError('Sonarr unavailable')
+    return handler, seen
+
+
+def test_event_stays_queued_until_handler_succeeds():
+    handler, seen = flaky(1)
+    intake.register('sonarr', handler)
+    event_id = intake.submit('sonarr', {'eventType': 'Download'})
+
+    intake._dispatch_due()
+    assert pending() == [(event_id, 1)]
+    # Still in backoff, so not handed out again yet
+    intake._dispatch_due()
+    assert len(seen) == 1
+
+    make_due()
+    intake._dispatch_due()
+    assert seen == [{'eventType': 'Download'}] * 2
+    assert pending() == []
+    assert intake.depth() == 0
+    assert intake.stats()['processed'] == 1
+
+
+def test_events_survive_a_restart(monkeypatch):
+    intake.submit('sonarr', {'eventType': 'SeriesAdd'})
+    # A new process: fresh connections and counters, same database
+    monkeypatch.setattr(intake, '_local', threading.local())
+    monkeypatch.setattr(intake, '_depth', None)
+    handler, seen = flaky(0)
+    intake.register('sonarr', handler)
+
+    assert intake.depth() == 1
+    intake._dispatch_due()
+    assert seen == [{'eventType': 'SeriesAdd'}]
+    assert pending() == []
+
+
+def test_future_result_finishes_the_event():
+    future = Future()
+    intake.register('seerr', lambda payload: future)
+    event_id = intake.submit('seerr', {'tvdb_id': 1})
+
+    intake._dispatch_due()
+    assert pending() == [(event_id, 0)]
+    assert intake.stats()['in_flight'] == 1
+
+    future.set_exception(RuntimeError('series not in Sonarr yet'))
+    assert pending() == [(event_id, 1)]
+    assert intake.stats()['in_flight'] == 0
+
+
+def test_dead_letter_after_max_attempts(monkeypatch):
+    monkeypatch.setattr(intake, 'INTAKE_MAX_ATTEMPTS', 2)
+    handler, seen = flaky(10)
+    intake.register('sonarr', handler)
+    event_id = intake.submit('sonarr', {'eventType': 'Download'})
+
+    intake._dispatch_due()
+    make_due()
+    intake._dispatch_due()
+    assert len(seen) == 2
+    assert pending() == []
+    assert dead_letters() == [(event_id, 2)]
+    assert intake.stats()['dead_lettered'] == 1
+
+
+def test_retry_window_dead_letters_instead_of_retrying():
+    handler, seen = flaky(10)
+    intake.register('playback', handler, retry_window=0)
+    event_id = intake.submit('playback', {'series_title': 'Severance'})
+
+    intake._dispatch_due()
+    assert pending() == []
+    assert dead_letters() == [(event_id, 1)]
+
+
+def test_unknown_kind_is_retried_not_lost():
+    event_id = intake.submit('mystery', {})
+    intake._dispatch_due()
+    assert pending() == [(event_id, 1)]
+
+
+def test_newer_event_supersedes_a_failed_one():
+    handler, seen = flaky(1)
+    intake.register('playback', handler, supersede=True)
+    first = intake.submit('playback', {'episode': 1}, key='severance')
+    intake._dispatch_due()
+    assert pending() == [(first, 1)]
+
+    intake.submit('playback', {'episode': 2}, key='severance')
+    make_due()
+    intake._dispatch_due()
+    # The retry of episode 1 is dropped; only episode 2 is applied after it
+    assert seen == [{'episode': 1}, {'episode': 2}]
+    assert pending() == []
+    assert intake.stats()['superseded'] == 1
+
+
+def test_supersede_is_per_key():
+    handler, seen = flaky(1)
+    intake.register('playback', handler, supersede=True)
+    intake.submit('playback', {'series': 'severance'}, key='severance')
+    intake._dispatch_due()
+    intake.submit('playback', {'series': 'andor'}, key='andor')
+    make_due()
+    intake._dispatch_due()
+    assert seen == [{'series': 'severance'}, {'series': 'severance'}, {'series': 'andor'}]
+    assert pending() == []
+    assert intake.stats()['superseded'] == 0
+
+
+def test_ready_depth_ignores_events_in_backoff():
+    handler, seen = flaky(10)
+    intake.register('sonarr', handler)
+    for i in range(3):
+        intake.submit('sonarr', {'i': i})
+    assert intake.ready_depth() == 3
+
+    intake._dispatch_due()
+    assert intake.depth() == 3
+    assert intake.ready_depth() == 0
+
+    intake.submit('sonarr', {'i': 3})
+    assert intake.ready_depth() == 1
@@ -0,0 +1,96 @@
+import json
+import pytest
+import playback_sessions
+from playback_sessions import SessionTracker, IGNORE, TRIGGER
+
+RUNTIME_TICKS = 27000000000
+KEY = ('user', 'item', 'session')
+
+
+@pytest.fixture(autouse=True)
+def fresh_tracker(monkeypatch):
+    monkeypatch.setattr(playback_sessions, '_tracker', SessionTracker(threshold=45, grace=10, idle_seconds=3600))
+
+
+def ticks(tracker, percents, key=KEY):
+    return [tracker.progress(key, percent) for percent in percents]
+
+
+def test_fires_once_when_progress_crosses_the_threshold():
+    tracker = SessionTracker(threshold=45, grace=10)
+    assert ticks(tracker, [5, 20, 44.9, 45.1, 50, 90, 30, 60]) == [False] * 3 + [True] + [False] * 4
+
+
+def test_seek_over_the_threshold_counts_as_crossing():
+    tracker = SessionTracker(threshold=45, grace=10)
+    assert ticks(tracker, [10, 80]) == [False, True]
+
+
+def test_first_tick_counts_only_within_the_grace():
+    tracker = SessionTracker(threshold=45, grace=10)
+    assert ticks(tracker, [50], key=('u', 'a', 's')) == [True]
+    # A session first seen near the end (e.g. after a restart) was already handled
+    assert ticks(tracker, [90, 95], key=('u', 'b', 's')) == [False, False]
+
+
+def test_resume_past_the_threshold_does_not_fire():
+    tracker = SessionTracker(threshold=45, grace=10)
+    tracker.started(KEY, 50)
+    assert ticks(tracker, [51, 60]) == [False, False]
+
+
+def test_sessions_are_independent():
+    tracker = SessionTracker(threshold=45, grace=10)
+    assert ticks(tracker, [10], key=('u1', 'item', 's1')) == [False]
+    assert ticks(tracker, [10], key=('u2', 'item', 's2')) == [False]
+    assert ticks(tracker, [46], key=('u1', 'item', 's1')) == [True]
+    assert ticks(tracker, [46], key=('u2', 'item', 's2')) == [True]
+
+
+def test_idle_sessions_expire(monkeypatch):
+    tracker = SessionTracker(threshold=45, grace=10, idle_seconds=0)
+    tracker.progress(KEY, 10)
+    monkeypatch.setattr(playback_sessions, 'EXPIRE_INTERVAL', 0)
+    tracker.progress(('other', 'item', 'session'), 10)
+    assert tracker.get_stats()['expired'] == 1
+
+
+def payload(notification_type='PlaybackProgress', percent=50, **extra):
+    data = {
+        'NotificationType': notification_type,
+        'ItemType': 'Episode',
+        'UserId': 'user',
+        'ItemId': 'item',
+        'PlaySessionId': 'session',
+        'PlaybackPositionTicks': int(RUNTIME_TICKS * percent / 100),
+        'RunTimeTicks': RUNTIME_TICKS,
+    }
+    data.update(extra)
+    return json.dumps(data).encode()
+
+
+def test_screen_marks_the_crossing_tick():
+    assert playback_sessions.screen(payload(percent=20)) == IGNORE
+    assert playback_sessions.screen(payload(percent=46)) == TRIGGER
+    assert playback_sessions.screen(payload(percent=60)) == IGNORE
+
+
+def test_screen_agrees_with_the_decoded_path():
+    # The fast path and should_trigger share one tracker, so a crossing fires once across both
+    assert playback_sessions.screen(payload(percent=20)) == IGNORE
+    assert playback_sessions.should_trigger(json.loads(payload(percent=46))) is True
+    assert playback_sessions.screen(payload(percent=50)) == IGNORE
+
+
+def test_screen_ignores_what_never_triggers_a_rule():
+    assert playback_sessions.screen(payload(ItemType='Movie')) == IGNORE
+    assert playback_sessions.screen(payload('PlaybackStop')) == IGNORE
+    assert playback_sessions.screen(payload('PlaybackStart', percent=80)) == IGNORE
+    # Started past the threshold, so later ticks are a resume, not a crossing
+    assert playback_sessions.screen(payload(percent=81)) == IGNORE
+
+
+def test_screen_defers_bodies_it_cannot_read():
+    assert playback_sessions.screen(b'{"Name": "no notification type"}') is None
+    assert playback_sessions.screen(payload(UserId='')) is None
+    assert playback_sessions.screen(payload(RunTimeTicks=0)) is None
@@ -0,0 +1,140 @@
+import itertools
+import pytest
+import rule_planner
+import rules
+
+
+def make_episodes():
+    """Three seasons of five episodes; some already downloaded."""
+    episodes = []
+    for season, number in itertools.product((1, 2, 3), range(1, 6)):
+        ep_id = season * 100 + number
+        episode = {'id': ep_id, 'seasonNumber': season, 'episodeNumber': number,
+                   'monitored': False, 'hasFile': ep_id % 3 != 0}
+        if episode['hasFile']:
+            episode['episodeFileId'] = ep_id + 1000
+        episodes.append(episode)
+    return episodes
+
+
+# The rule engine as it was before plans, minus the HTTP calls, kept as the reference
+
+def old_fetch_next_episodes(all_episodes, season_number, episode_number, get_option):
+    def season(number):
+        return [ep for ep in all_episodes if ep['seasonNumber'] == number]
+
+    if get_option == "all":
+        return [ep['id'] for ep in all_episodes if ep['seasonNumber'] >= season_number]
+    if get_option == "season":
+        return [ep['id'] for ep in season(season_number) if ep['episodeNumber'] > episode_number]
+    num_episodes = int(get_option)
+    next_episode_ids = [ep['id'] for ep in season(season_number) if ep['episodeNumber'] > episode_number]
+    next_season_number = season_number + 1
+    last_season = max(ep['seasonNumber'] for ep in all_episodes)
+    # The old loop never ended past the last season; the cases below stay clear of that
+    while len(next_episode_ids) < num_episodes and next_season_number <= last_season:
+        next_episode_ids.extend(ep['id'] for ep in season(next_season_number))
+        next_season_number += 1
+    return next_episode_ids[:num_episodes]
+
+
+def old_find_episodes_to_delete(all_episodes, keep_watched, last_watched_id):
+    if keep_watched == "all":
+        return []
+    if keep_watched == "season":
+        last_watched_season = next(ep['seasonNumber'] for ep in all_episodes if ep['id'] == last_watched_id)
+        episodes_to_delete = [ep for ep in all_episodes if ep['seasonNumber'] < last_watched_season and ep['hasFile']]
+    elif isinstance(keep_watched, int):
+        sorted_episodes = sorted(all_episodes, key=lambda ep: (ep['seasonNumber'], ep['episodeNumber']), reverse=True)
+        last_watched_index = next(i for i, ep in enumerate(sorted_episodes) if ep['id'] == last_watched_id)
+        keep_range = sorted_episodes[max(0, last_watched_index - keep_watched + 1):last_watched_index + 1]
+        keep_ids = {ep['id'] for ep in keep_range}
+        episodes_to_delete = [ep for ep in all_episodes if ep['id'] not in keep_ids and ep['hasFile']]
+    else:
+        episodes_to_delete = []
+    return [ep['episodeFileId'] for ep in episodes_to_delete if 'episodeFileId' in ep]
+
+
+def old_delete_old_episodes(all_episodes, keep_episode_ids, keep_watched):
+    episodes_with_files = [ep for ep in all_episodes if ep['hasFile']]
+    if keep_watched == "all":
+        return []
+    if keep_watched == "season":
+        last_watched_season = max(ep['seasonNumber'] for ep in all_episodes if ep['id'] in keep_episode_ids)
+        return [ep['episodeFileId'] for ep in episodes_with_files
+                if ep['seasonNumber'] < last_watched_season and ep['id'] not in keep_episode_ids]
+    return [ep['episodeFileId'] for ep in episodes_with_files if ep['id'] not in keep_episode_ids]
+
+
+def old_process_episodes(all_episodes, season_number, episode_number, details):
+    """Monitored flags after the old engine ran, plus what it searched and deleted."""
+    monitored = {ep['id']: ep['monitored'] for ep in all_episodes}
+    searched, deleted = [], set()
+    last_watched_id = next(ep['id'] for ep in all_episodes
+                           if ep['seasonNumber'] == season_number and ep['episodeNumber'] == episode_number)
+    if not details['monitor_watched']:
+        monitored[last_watched_id] = False
+    next_episode_ids = old_fetch_next_episodes(all_episodes, season_number, episode_number, details['get_option'])
+    for ep_id in next_episode_ids:
+        monitored[ep_id] = True
+    if details['action_option'] == "search":
+        searched = next_episode_ids
+    deleted.update(old_find_episodes_to_delete(all_episodes, details['keep_watched'], last_watched_id))
+    if details['keep_watched'] != "all":
+        deleted.update(old_delete_old_episodes(all_episodes, next_episode_ids + [last_watched_id],
+                                               details['keep_watched']))
+    return monitored, searched, deleted
+
+
+def new_process_episodes(all_episodes, season_number, episode_number, details):
+    rule = rules.Rule.compile('test', details)
+    last_watched_id = next(ep['id'] for ep in all_episodes
+                           if ep['seasonNumber'] == season_number and ep['episodeNumber'] == episode_number)
+    next_ids = rule_planner.next_episode_ids(all_episodes, season_number, episode_number, rule.get_option)
+    plan = rule_planner.build_plan(1, all_episodes, last_watched_id, next_ids, rule)
+    monitored = {ep['id']: ep['monitored'] for ep in all_episodes}
+    for ep_id in plan.unmonitor:
+        monitored[ep_id] = False
+    for ep_id in plan.monitor:
+        monitored[ep_id] = True
+    return plan, monitored
+
+
+@pytest.mark.parametrize('get_option', ['1', '3', 'season', 'all'])
+@pytest.mark.parametrize('keep_watched', ['all', 'season', '1', '2'])
+@pytest.mark.parametrize('monitor_watched', [False, True])
+@pytest.mark.parametrize('action_option', ['monitor', 'search'])
+@pytest.mark.parametrize('watched', [(1, 2), (1, 5), (2, 3)])
+def test_plan_matches_the_old_rule_engine(get_option, keep_watched, monitor_watched, action_option, watched):
+    details = {'get_option': get_option, 'keep_watched': keep_watched,
+               'monitor_watched': monitor_watched, 'action_option': action_option}
+    episodes = make_episodes()
+    season_number, episode_number = watched
+
+    old_monitored, old_searched, old_deleted = old_process_episodes(episodes, season_number, episode_number, details)
+    plan, monitored = new_process_episodes(episodes, season_number, episode_number, details)
+
+    assert plan.monitor == old_fetch_next_episodes(episodes, season_number, episode_number, get_option)
+    assert monitored == old_monitored
+    assert plan.search == old_searched
+    # The old engine could delete what it had just monitored; a plan keeps those files
+    assert plan.delete_files == sorted(old_deleted - set(plan.keep_files))
+    assert not set(plan.delete_files) & set(plan.keep_files)
+
+
+def test_stale_monitored_flags_still_monitor():
+    episodes = make_episodes()
+    for ep in episodes:
+        ep['monitored'] = True
+    rule = rules.Rule.compile('test', {'get_option': '2', 'monitor_watched': False})
+    plan = rule_planner.build_plan(1, episodes, 101, [102, 103], rule)
+    assert plan.monitor == [102, 103]
+    assert plan.unmonitor == [101]
+
+
+def test_watched_episode_stays_monitored_when_it_comes_up_next():
+    episodes = make_episodes()
+    rule = rules.Rule.compile('test', {'get_option': 'all', 'monitor_watched': False})
+    next_ids = rule_planner.next_episode_ids(episodes, 2, 1, rule.get_option)
+    plan = rule_planner.build_plan(1, episodes, 201, next_ids, rule)
+    assert plan.unmonitor == []
@@ -0,0 +1,172 @@
+import re
+import logging
+import threading
+import unicodedata
+from collections import defaultdict
+import series_catalog
+
+logger = logging.getLogger(__name__)
+
+# Scores for the match kinds, best first; fuzzy matches scale below FUZZY_MAX
+SCORE_EXACT = 100
+SCORE_PREFIX = 80
+SCORE_CONTAINS = 70
+SCORE_ALL_WORDS = 60
+FUZZY_MAX = 50
+FUZZY_MIN_SIMILARITY = 0.35
+# Names other than the exact Sonarr title rank slightly lower
+ALTERNATE_PENALTY = 3
+NO_YEAR_PENALTY = 5
+# Lowest score best_match accepts: a close misspelling, not a loose one
+BEST_MATCH_MIN_SCORE = 30
+# Lowest score of an exact name match, counting alternate titles and titles without their year
+EXACT_MATCH_MIN_SCORE = SCORE_EXACT - ALTERNATE_PENALTY - NO_YEAR_PENALTY
+
+_YEAR = re.compile(r'\s*\((19|20)\d\d\)\s*$')
+_NON_WORD = re.compile(r'[^\w\s]')
+
+_index = None
+_lock = threading.Lock()
+
+
+def normalize(title):
+    """Lowercase, strip accents and punctuation: 'Shōgun (2024)' -> 'shogun 2024'."""
+    title = unicodedata.normalize('NFKD', title or '')
+    title = ''.join(c for c in title if not unicodedata.combining(c)).lower().replace('&', ' and ')
+    return ' '.join(_NON_WORD.sub(' ', title).split())
+
+
+def _trigrams(text):
+    compact = text.replace(' ', '')
+    if len(compact) < 3:
+        return {compact} if compact else set()
+    return {compact[i:i + 3] for i in range(len(compact) - 2)}
+
+
+class TitleIndex:
+    """Precomputed lookup over series titles and their Sonarr alternate titles."""
+
+    def __init__(self, series_list):
+        self.series_list = series_list
+        self.names = []                      # (series, normalized name, tokens, trigrams, penalty)
+        self.by_name = defaultdict(list)     # normalized name -> entry ids
+        self.by_token_prefix = defaultdict(set)
+        self.by_trigram = defaultdict(set)
+
+        for series in series_list:
+            titles = [(series.get('title'), False)]
+            titles += [(alt.get('title'), True) for alt in series.get('alternateTitles') or []]
+            seen = set()
+            for title, is_alternate in titles:
+                penalty = ALTERNATE_PENALTY if is_alternate else 0
+                variants = ((normalize(title), penalty), (normalize(_YEAR.sub('', title or '')), penalty + NO_YEAR_PENALTY))
+                for name, name_penalty in variants:
+                    if not name or name in seen:
+                        continue
+                    seen.add(name)
+                    self._add(series, name, name_penalty)
+
+    def _add(self, series, name, penalty):
+        entry_id = len(self.names)
+        tokens = name.split()
+        trigrams = _trigrams(name)
+        self.names.append((series, name, tokens, trigrams, penalty))
+        self.by_name[name].append(entry_id)
+        for token in tokens:
+            for end in range(1, len(token) + 1):
+                self.by_token_prefix[token[:end]].add(entry_id)
+        for gram in trigrams:
+            self.by_trigram[gram].add(entry_id)
+
+    def _word_candidates(self, tokens):
+        """Names where every query token starts some word."""
+        postings = sorted((self.by_token_prefix.get(token, set()) for token in tokens), key=len)
+        return set.intersection(*postings) if postings and postings[0] else set()
+
+    def _fuzzy_candidates(self, trigrams):
+        """Names sharing enough trigrams with the query to reach FUZZY_MIN_SIMILARITY."""
+        hits = defaultdict(int)
+        for gram in trigrams:
+            for entry_id in self.by_trigram.get(gram, ()):
+                hits[entry_id] += 1
+        needed = FUZZY_MIN_SIMILARITY * len(trigrams)
+        return {entry_id for entry_id, count in hits.items() if count >= needed}
+
+    def _score(self, query, tokens, trigrams, entry):
+        series, name, name_tokens, name_trigrams, penalty = entry
+        if name == query:
+            score = SCORE_EXACT
+        elif name.startswith(query):
+            score = SCORE_PREFIX
+        elif query in name:
+            score = SCORE_CONTAINS
+        elif all(any(t.startswith(q) for t in name_tokens) for q in tokens):
+            score = SCORE_ALL_WORDS
+        else:
+            union = len(trigrams | name_trigrams)
+            similarity = len(trigrams & name_trigrams) / union if union else 0
+            if similarity < FUZZY_MIN_SIMILARITY:
+                return 0
+            score = round(FUZZY_MAX * similarity)
+        return score - penalty
+
+    def search(self, query, limit=10, min_score=1):
+        """
+        Ranked matches for a query.
+
+        :param query: Title or partial title
+        :param limit: Maximum number of results
+        :param min_score: Drop matches scoring below this
+        :return: List of (score, series), best first, one entry per series
+        """
+        query = normalize(query)
+        if not query:
+            return []
+        tokens = query.split()
+        trigrams = _trigrams(query)
+        best = {}
+
+        def consider(entry_ids):
+            for entry_id in entry_ids:
+                entry = self.names[entry_id]
+                score = self._score(query, tokens, trigrams, entry)
+                series_id = entry[0]['id']
+                if score >= min_score and score > best.get(series_id, (0, None))[0]:
+                    best[series_id] = (score, entry[0])
+
+        consider(self._word_candidates(tokens))
+        # Only fall back to trigram matching when word matches don't fill the results
+        if len(best) < limit:
+            consider(self._fuzzy_candidates(trigrams))
+        ranked = sorted(best.values(), key=lambda match: (-match[0], len(match[1].get('title', ''))))
+        return ranked[:limit]
+
+
+def get_index(series_list=None):
+    """
+    The title index for a series list, rebuilt only when the list changes.
+
+    Defaults to the shared series catalog. Returns None if Sonarr is unreachable.
+    """
+    global _index
+    if series_list is None:
+        series_list = series_catalog.get_all_series()
+        if series_list is None:
+            return None
+    with _lock:
+        if _index is None or _index.series_list is not series_list:
+            _index = TitleIndex(series_list)
+            logger.debug(f"Title index rebuilt with {len(_index.names)} names")
+        return _index
+
+
+def search(query, limit=10, min_score=1, series_list=None):
+    """Ranked (score, series) matches for a query; [] if Sonarr is unreachable."""
+    index = get_index(series_list)
+    return index.search(query, limit, min_score) if index else []
+
+
+def best_match(query, min_score=BEST_MATCH_MIN_SCORE, series_list=None):
+    """The best matching series, or None if nothing scores at least min_score."""
+    matches = search(query, 1, min_score, series_list)
+    return matches[0][1] if matches else None
@@ -1,15 +1,28 @@
 from flask import Flask, render_template, request, redirect, url_for, jsonify
-import subprocess
+import io
 import os
-import time
 import logging
 import json
 import sonarr_utils
-import threading
-from datetime import datetime
+import playback_worker
+import playback_sessions
+import series_catalog
+import library_mirror
+import sonarr_events
+import episode_cache
+import title_index
+import search_coalescer
+import series_import
+import deletion_queue
+import intake
+import admission
+import rules
+import config_store
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
 import requests  # Add this import statement
 from logging.handlers import RotatingFileHandler
+from api_client import sonarr, deadline, get_status
 
 
 app = Flask(__name__)
@@ -21,6 +34,13 @@ load_dotenv()
 SONARR_URL = os.getenv('SONARR_URL')
 SONARR_API_KEY = os.getenv('SONARR_API_KEY')
 MISSING_LOG_PATH = os.getenv('MISSING_LOG_PATH', '/app/logs/missing.log')
+SEARCH_RESULT_LIMIT = int(os.getenv('SEARCH_RESULT_LIMIT', 25))
+# Jellyfin webhook bodies up to this size are screened before Flask parses the request
+JELLYFIN_FAST_PATH_MAX_BYTES = int(os.getenv('JELLYFIN_FAST_PATH_MAX_BYTES', 65536))
+# Jellyseerr/Overseerr setups poll Sonarr for the new series, so they get their own threads
+SEERR_SETUP_WORKERS = int(os.getenv('SEERR_SETUP_WORKERS', 2))
+# A failed playback event is only worth replaying shortly after it was watched
+PLAYBACK_RETRY_WINDOW = float(os.getenv('PLAYBACK_RETRY_WINDOW', 300))
 
 # Setup logging with rotation
 logging.basicConfig(
@@ -48,41 +68,20 @@ app.logger.addHandler(stream_handler)
 config_path = os.path.join(app.root_path, 'config', 'config.json')
 TIMESTAMP_FILE_PATH = '/app/backgrounds/fanart_timestamp.txt'
 
+def get_config_store():
+    return config_store.get_store(config_path)
+
 def load_config():
-    try:
-        with open(config_path, 'r') as file:
-            config = json.load(file)
-        if 'rules' not in config:
-            config['rules'] = {}
-        if 'services' not in config:
-            config['services'] = {}
-        
-        # Ensure default rule is '1n1' if not explicitly specified
-        if 'default_rule' not in config:
-            config['default_rule'] = '1n1'
-            
-        return config
-    except FileNotFoundError:
-        # Default configuration setup
-        return {
-            'services': {},
-            'rules': {
-                '1n1': {
-                    'get_option': '1',
-                    'action_option': 'search',
-                    'keep_watched': '1',
-                    'monitor_watched': False,
-                    'series': []
-                }
-            },
-            'default_rule': '1n1'
-        }
+    """The current configuration; shared, so change it through update_config()."""
+    return get_config_store().get()
 
+def update_config(change):
+    """Apply change(config) and save it atomically; concurrent updates are serialized."""
+    return get_config_store().update(change)
 
 # Save configuration function
 def save_config(config):
-    with open(config_path, 'w') as file:
-        json.dump(config, file, indent=4)
+    get_config_store().save(config)
 
 def get_missing_log_content():
     try:
@@ -134,13 +133,10 @@ def settings_page():
     preferences = sonarr_utils.load_preferences()
     all_series = sonarr_utils.get_series_list(preferences)
     
-    # Maintain the rules mapping logic
-    rules_mapping = {str(series_id): rule_name for rule_name, details in config['rules'].items() for series_id in details.get('series', [])}
-    
-    # Assign '1n1' as the default rule if no specific rule is found
-    default_rule = config.get('default_rule', '1n1')
+    # Series without a rule of their own get the default rule ('1n1' unless configured)
+    rule_set = get_config_store().rule_set()
     for series in all_series:
-        series['assigned_rule'] = rules_mapping.get(str(series['id']), default_rule)
+        series['assigned_rule'] = rule_set.assigned_rule(series['id'])
 
     rule = request.args.get('rule', '1n1')
     message = request.args.get('message')
@@ -160,8 +156,6 @@ def settings_page():
 
 @app.route('/update-settings', methods=['POST'])
 def update_settings():
-    config = load_config()
-    
     rule_name = request.form.get('rule_name')
     if rule_name == 'add_new':
         rule_name = request.form.get('new_rule_name')
@@ -171,114 +165,125 @@ def update_settings():
     get_option = request.form.get('get_option')
     keep_watched = request.form.get('keep_watched')
 
-    config['rules'][rule_name] = {
-        'get_option': get_option,
-        'action_option': request.form.get('action_option'),
-        'keep_watched': keep_watched,
-        'monitor_watched': request.form.get('monitor_watched', 'false').lower() == 'true',
-        'series': config['rules'].get(rule_name, {}).get('series', [])
-    }
-    
-    save_config(config)
+    def apply(config):
+        config['rules'][rule_name] = {
+            'get_option': get_option,
+            'action_option': request.form.get('action_option'),
+            'keep_watched': keep_watched,
+            'monitor_watched': request.form.get('monitor_watched', 'false').lower() == 'true',
+            'series': config['rules'].get(rule_name, {}).get('series', [])
+        }
+
+    update_config(apply)
     return redirect(url_for('settings_page', message="Settings updated successfully"))
 
 @app.route('/delete_rule', methods=['POST'])
 def delete_rule():
-    config = load_config()
     rule_name = request.form.get('rule_name')
-    if rule_name and rule_name in config['rules']:
-        del config['rules'][rule_name]
-        save_config(config)
+    if rule_name and rule_name in load_config()['rules']:
+        update_config(lambda config: config['rules'].pop(rule_name, None))
         return redirect(url_for('settings_page', message=f"Rule '{rule_name}' deleted successfully."))
     else:
         return redirect(url_for('settings_page', message=f"Rule '{rule_name}' not found."))
 
 @app.route('/assign_rules', methods=['POST'])
 def assign_rules():
-    config = load_config()
     rule_name = request.form.get('assign_rule_name')
-    submitted_series_ids = set(request.form.getlist('series_ids'))
+    submitted_series_ids = request.form.getlist('series_ids')
 
-    if rule_name == 'None':
-        # Remove series from any rule
-        for key, details in config['rules'].items():
-            details['series'] = [sid for sid in details.get('series', []) if sid not in submitted_series_ids]
-    else:
-        # Update the rule's series list to include only those submitted
-        if rule_name in config['rules']:
-            current_series = set(config['rules'][rule_name]['series'])
-            updated_series = current_series.union(submitted_series_ids)
-            config['rules'][rule_name]['series'] = list(updated_series)
-
-        # Update other rules to remove the series if it's no longer assigned there
-        for key, details in config['rules'].items():
-            if key != rule_name:
-                # Preserve series not submitted in other rules
-                details['series'] = [sid for sid in details.get('series', []) if sid not in submitted_series_ids]
-
-    save_config(config)
+    # Moves the series out of whatever rule they had; 'None' leaves them unassigned
+    def apply(config):
+        rule_set = rules.RuleSet(config)
+        rule_set.assign(rule_name, submitted_series_ids)
+        rule_set.write_assignments(config)
+
+    update_config(apply)
     return redirect(url_for('assign_rules_page', message="Rules updated successfully."))
 
 @app.route('/unassign_rules', methods=['POST'])
 def unassign_rules():
-    config = load_config()
     rule_name = request.form.get('assign_rule_name')
-    submitted_series_ids = set(request.form.getlist('series_ids'))
+    submitted_series_ids = request.form.getlist('series_ids')
 
     # Update the rule's series list to exclude those submitted
-    if rule_name in config['rules']:
-        current_series = set(config['rules'][rule_name]['series'])
-        updated_series = current_series.difference(submitted_series_ids)
-        config['rules'][rule_name]['series'] = list(updated_series)
+    def apply(config):
+        rule_set = rules.RuleSet(config)
+        rule_set.unassign(rule_name, submitted_series_ids)
+        rule_set.write_assignments(config)
 
-    save_config(config)
+    update_config(apply)
     return redirect(url_for('assign_rules_page', message="Rules updated successfully."))
 
-@app.route('/jellyfin-webhook', methods=['POST'])
+JELLYFIN_PATH = '/jellyfin-webhook'
+JELLYFIN_VERDICT_KEY = 'ocdarr.jellyfin_verdict'
+IGNORED_RESPONSE = b'{"status":"success"}\n'
+
+def jellyfin_fast_path(wsgi_app):
+    """
+    Answer Jellyfin webhooks that the raw-body screen settles before Flask builds a request.
+
+    Progress ticks arrive every few seconds per stream and almost all of them need
+    nothing done, so they skip routing, JSON decoding and logging.
+    """
+    def middleware(environ, start_response):
+        if environ.get('PATH_INFO') == JELLYFIN_PATH and environ.get('REQUEST_METHOD') == 'POST':
+            try:
+                length = int(environ.get('CONTENT_LENGTH') or 0)
+            except ValueError:
+                length = 0
+            if 0 < length <= JELLYFIN_FAST_PATH_MAX_BYTES:
+                raw = environ['wsgi.input'].read(length)
+                environ['wsgi.input'] = io.BytesIO(raw)
+                verdict = playback_sessions.screen(raw)
+                if verdict == playback_sessions.IGNORE:
+                    start_response('200 OK', [('Content-Type', 'application/json'),
+                                              ('Content-Length', str(len(IGNORED_RESPONSE)))])
+                    return [IGNORED_RESPONSE]
+                environ[JELLYFIN_VERDICT_KEY] = verdict
+        return wsgi_app(environ, start_response)
+    return middleware
+
+app.wsgi_app = admission.middleware(app.wsgi_app)
+# Outermost, so ignorable progress ticks get their cheap 200 even while events are being shed
+app.wsgi_app = jellyfin_fast_path(app.wsgi_app)
+
+@app.route(JELLYFIN_PATH, methods=['POST'])
 def handle_jellyfin_webhook():
+    # Already screened by jellyfin_fast_path unless the body was too large for it
+    if JELLYFIN_VERDICT_KEY in request.environ:
+        verdict = request.environ[JELLYFIN_VERDICT_KEY]
+    else:
+        verdict = playback_sessions.screen(request.get_data(cache=True))
+    if verdict == playback_sessions.IGNORE:
+        return jsonify({'status': 'success'}), 200
+
     app.logger.info("Received Jellyfin webhook")
     data = request.json
     if data:
         try:
+            # A session's starting position tells a resume apart from a crossing
+            if data.get('NotificationType') == 'PlaybackStart':
+                playback_sessions.playback_started(data)
+                return jsonify({'status': 'success'}), 200
+
             # Check if this is a progress event
             if data.get('NotificationType') != 'PlaybackProgress':
                 return jsonify({'status': 'success'}), 200
             
-            # Get playback position as percentage
-            position_ticks = int(data.get('PlaybackPositionTicks', 0))
-            total_ticks = int(data.get('RunTimeTicks', 0))
+            # Deferred deletions wait until progress ticks stop arriving
+            deletion_queue.note_playback()
             
-            if total_ticks > 0:
-                progress_percent = (position_ticks / total_ticks) * 100
+            # Only the tick that crosses the threshold triggers, once per episode per session
+            if verdict == playback_sessions.TRIGGER or playback_sessions.should_trigger(data):
+                app.logger.info(f"Progress crossed {playback_sessions.JELLYFIN_TRIGGER_PERCENT}%")
+                event = playback_worker.event_from_jellyfin(data)
+                if not event:
+                    app.logger.error(f"Incomplete episode data in Jellyfin webhook: {data}")
+                    return jsonify({'status': 'error', 'message': 'Incomplete episode data'}), 400
                 
-                # Only log when we're getting close to the threshold
-                if 40 <= progress_percent <= 60:
-                    app.logger.info(f"Progress: {progress_percent}%")
-                
-                # Only proceed if we're between 45-55%
-                if 45 <= progress_percent <= 55:
-                    app.logger.info(f"Processing {data.get('SeriesName')} S{data.get('SeasonNumber')}E{data.get('EpisodeNumber')}")
-                    
-                    episode_data = {
-                        "server_title": data.get('SeriesName'),
-                        "server_season_num": str(data.get('SeasonNumber')),
-                        "server_ep_num": str(data.get('EpisodeNumber'))
-                    }
-                    
-                    # Write the data and run the script
-                    temp_dir = '/app/temp'
-                    os.makedirs(temp_dir, exist_ok=True)
-                    with open(os.path.join(temp_dir, 'data_from_server.json'), 'w') as f:
-                        json.dump(episode_data, f)
-                    
-                    result = subprocess.run(["python3", "/app/servertosonarr.py"],
-                                       capture_output=True,
-                                       text=True)
-                    
-                    if result.stderr:
-                        app.logger.error(f"Script errors: {result.stderr}")
-                    
-                    app.logger.info("Successfully processed episode")
+                intake.submit('playback', event.to_dict(), key=playback_worker.series_key(event))
+                app.logger.info(f"Queued {event.describe()} for processing")
+                return jsonify({'status': 'queued'}), 202
             
             return jsonify({'status': 'success'}), 200
             
@@ -289,26 +294,28 @@ def handle_jellyfin_webhook():
         return jsonify({'status': 'error', 'message': 'No data received'}), 400
   
 
+# One thread sends the Home Assistant wake webhook, so a burst of empty Tautulli events queues up instead of piling threads
+_wake_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='wake-webhook')
+
 @app.route('/webhook', methods=['POST'])
 def handle_server_webhook():
     app.logger.info("Received POST request from Tautulli")
     data = request.json
     if data:
         app.logger.info(f"Webhook received with data: {data}")
+        event = playback_worker.event_from_server(data)
+        if not event:
+            app.logger.error("No server activity found.")
+            from servertosonarr import send_webhook
+            _wake_executor.submit(send_webhook)
+            return jsonify({'status': 'success', 'message': 'No episode data, webhook triggered'}), 200
         try:
-            temp_dir = '/app/temp'
-            os.makedirs(temp_dir, exist_ok=True)
-            with open(os.path.join(temp_dir, 'data_from_server.json'), 'w') as f:
-                json.dump(data, f)
-            app.logger.info("Data successfully written to data_from_server.json")
-            
-            result = subprocess.run(["python3", "/app/servertosonarr.py"], capture_output=True, text=True)
-            if result.stderr:
-                app.logger.error("Errors from servertosonarr.py: " + result.stderr)
+            intake.submit('playback', event.to_dict(), key=playback_worker.series_key(event))
+            app.logger.info(f"Queued {event.describe()} for processing")
         except Exception as e:
-            app.logger.error(f"Failed to handle data or run script: {e}")
+            app.logger.error(f"Failed to queue playback event: {e}")
             return jsonify({'status': 'error', 'message': str(e)}), 500
-        return jsonify({'status': 'success', 'message': 'Script triggered successfully'}), 200
+        return jsonify({'status': 'queued', 'message': 'Episode queued for processing'}), 202
     else:
         return jsonify({'status': 'error', 'message': 'No data received'}), 400
 
@@ -328,8 +335,7 @@ def episode_selection_form():
         preferences = sonarr_utils.load_preferences()
         
         # Get series info
-        headers = {'X-Api-Key': SONARR_API_KEY}
-        series_response = requests.get(f"{SONARR_URL}/api/v3/series/{series_id}", headers=headers)
+        series_response = sonarr.get(f"/api/v3/series/{series_id}")
         
         if not series_response.ok:
             return f"Error: Failed to get series info. Status: {series_response.status_code}"
@@ -388,14 +394,9 @@ def search_tvdb():
         query = request.args.get('query')
         if not query:
             return jsonify({'status': 'error', 'message': 'No query provided'}), 400
-            
-        headers = {'X-Api-Key': SONARR_API_KEY}
         
         # Use Sonarr's lookup endpoint to search TVDB
-        response = requests.get(
-            f"{SONARR_URL}/api/v3/series/lookup?term={query}",
-            headers=headers
-        )
+        response = sonarr.get("/api/v3/series/lookup", params={'term': query})
         
         if not response.ok:
             return jsonify({'status': 'error', 'message': 'Failed to search TVDB'}), 500
@@ -428,14 +429,9 @@ def add_series():
         
         if not tvdb_id:
             return jsonify({'status': 'error', 'message': 'No TVDB ID provided'}), 400
-            
-        headers = {'X-Api-Key': SONARR_API_KEY}
         
         # Get root folders
-        root_folders_response = requests.get(
-            f"{SONARR_URL}/api/v3/rootfolder",
-            headers=headers
-        )
+        root_folders_response = sonarr.get("/api/v3/rootfolder")
         
         if not root_folders_response.ok:
             return jsonify({'status': 'error', 'message': 'Failed to get root folders'}), 500
@@ -445,10 +441,7 @@ def add_series():
             return jsonify({'status': 'error', 'message': 'No root folders configured in Sonarr'}), 500
             
         # Get quality profiles
-        profiles_response = requests.get(
-            f"{SONARR_URL}/api/v3/qualityprofile",
-            headers=headers
-        )
+        profiles_response = sonarr.get("/api/v3/qualityprofile")
         
         if not profiles_response.ok:
             return jsonify({'status': 'error', 'message': 'Failed to get quality profiles'}), 500
@@ -458,10 +451,7 @@ def add_series():
             return jsonify({'status': 'error', 'message': 'No quality profiles configured in Sonarr'}), 500
             
         # Use lookup to get full series data
-        lookup_response = requests.get(
-            f"{SONARR_URL}/api/v3/series/lookup?term=tvdb:{tvdb_id}",
-            headers=headers
-        )
+        lookup_response = sonarr.get("/api/v3/series/lookup", params={'term': f"tvdb:{tvdb_id}"})
         
         if not lookup_response.ok:
             return jsonify({'status': 'error', 'message': 'Failed to lookup series'}), 500
@@ -477,10 +467,7 @@ def add_series():
             series_to_add['tags'] = []
             
         # Get tag ID for "episodes"
-        tag_response = requests.get(
-            f"{SONARR_URL}/api/v3/tag",
-            headers=headers
-        )
+        tag_response = sonarr.get("/api/v3/tag")
         
         if tag_response.ok:
             tags = tag_response.json()
@@ -490,11 +477,7 @@ def add_series():
                 series_to_add['tags'].append(episodes_tag['id'])
             else:
                 # Create the tag if it doesn't exist
-                tag_create_response = requests.post(
-                    f"{SONARR_URL}/api/v3/tag",
-                    headers=headers,
-                    json={"label": "episodes"}
-                )
+                tag_create_response = sonarr.post("/api/v3/tag", json={"label": "episodes"})
                 
                 if tag_create_response.ok:
                     new_tag = tag_create_response.json()
@@ -507,16 +490,13 @@ def add_series():
         series_to_add['monitored'] = True
         
         # Add the series
-        add_response = requests.post(
-            f"{SONARR_URL}/api/v3/series",
-            headers=headers,
-            json=series_to_add
-        )
+        add_response = sonarr.post("/api/v3/series", json=series_to_add)
         
         if not add_response.ok:
             return jsonify({'status': 'error', 'message': f'Failed to add series: {add_response.text}'}), 500
             
         added_series = add_response.json()
+        series_catalog.invalidate('series added')
         
         # Return success with the added series
         return jsonify({
@@ -540,11 +520,9 @@ def get_seasons():
         series_id = request.args.get('series_id')
         if not series_id:
             return jsonify({'status': 'error', 'message': 'No series ID provided'}), 400
-            
-        headers = {'X-Api-Key': SONARR_API_KEY}
         
         # Get series info for seasons
-        response = requests.get(f"{SONARR_URL}/api/v3/series/{series_id}", headers=headers)
+        response = sonarr.get(f"/api/v3/series/{series_id}")
         
         if not response.ok:
             return jsonify({'status': 'error', 'message': 'Failed to get series info'}), 500
@@ -647,37 +625,21 @@ def search_series():
         query = request.args.get('query')
         if not query:
             return jsonify({'status': 'error', 'message': 'No query provided'}), 400
-            
-        headers = {'X-Api-Key': SONARR_API_KEY}
         
-        # Get all series
-        response = requests.get(f"{SONARR_URL}/api/v3/series", headers=headers)
+        # Ranked matches from the shared title index
+        index = title_index.get_index()
         
-        if not response.ok:
+        if index is None:
             return jsonify({'status': 'error', 'message': 'Failed to get series list'}), 500
-            
-        series_list = response.json()
-        
-        # Search for matching series
-        query = query.lower()
-        matching_series = []
-        
-        # First try exact match
-        exact_matches = [s for s in series_list if s['title'].lower() == query]
-        if exact_matches:
-            matching_series.extend(exact_matches)
-        else:
-            # Then try contains
-            contains_matches = [s for s in series_list if query in s['title'].lower()]
-            matching_series.extend(contains_matches)
         
         # Prepare results
         results = []
-        for series in matching_series:
+        for score, series in index.search(query, limit=SEARCH_RESULT_LIMIT):
             results.append({
                 'id': series['id'],
                 'title': series['title'],
-                'tvdbId': series.get('tvdbId')
+                'tvdbId': series.get('tvdbId'),
+                'score': score
             })
             
         return jsonify({'status': 'success', 'series': results})
@@ -718,24 +680,9 @@ def handle_seerr_webhook():
             # Extract request ID
             request_id = payload.get('request', {}).get('id') or payload.get('request', {}).get('request_id')
             
-            # Call the process_series function from episeerr_utils
-            import episeerr_utils
-            success = episeerr_utils.process_series(tvdb_id, requested_season, request_id)
-            
-            # Always attempt to delete the request
-            if request_id:
-                try:
-                    delete_success = episeerr_utils.delete_overseerr_request(request_id)
-                    if not delete_success:
-                        app.logger.error(f"Failed to delete request {request_id}")
-                except Exception as delete_error:
-                    app.logger.error(f"Exception during request deletion: {str(delete_error)}")
-            
-            response = {
-                "status": "success" if success else "failed",
-                "message": "Set up series" if success else "Failed to process series"
-            }
-            return jsonify(response), 200 if success else 500
+            # Set up in the background; the request is retried if Sonarr isn't ready
+            intake.submit('seerr', {'tvdb_id': tvdb_id, 'season_number': requested_season, 'request_id': request_id})
+            return jsonify({"status": "queued", "message": "Series queued for setup"}), 202
             
         app.logger.info("Event ignored - not an approved TV request")
         return jsonify({"message": "Ignored event"}), 200
@@ -746,61 +693,153 @@ def handle_seerr_webhook():
 
 @app.route('/sonarr-webhook', methods=['POST'])
 def handle_sonarr_webhook():
-    """Handle webhooks from Sonarr for series additions."""
+    """Handle webhooks from Sonarr (series and episode file events)."""
     data = request.json
-    if data and data.get('eventType') == 'SeriesAdd':
+    if not data:
+        return jsonify({'status': 'success'}), 200
+    intake.submit('sonarr', data)
+    return jsonify({'status': 'queued', 'message': 'Event queued for processing'}), 202
+
+def handle_sonarr_event(data):
+    """Intake handler for Sonarr webhooks."""
+    # The catalog and mirror pick these up from the event bus
+    sonarr_events.publish_webhook(data)
+    if data.get('eventType') == 'SeriesAdd':
+        series_id = data.get('series', {}).get('id')
+        if series_id:
+            # Batched with other new series; a list import arrives as a burst of these
+            series_import.start(process_new_series)
+            return series_import.submit(series_id)
+    return None
+
+_seerr_executor = ThreadPoolExecutor(max_workers=SEERR_SETUP_WORKERS, thread_name_prefix='seerr-setup')
+
+def handle_seerr_request(payload):
+    """Intake handler for approved Jellyseerr/Overseerr TV requests; runs off the intake thread."""
+    return _seerr_executor.submit(setup_requested_series, payload)
+
+def setup_requested_series(payload):
+    """Set up a requested series, then remove the request from Jellyseerr/Overseerr."""
+    import episeerr_utils
+    request_id = payload.get('request_id')
+    with deadline():
+        success = episeerr_utils.process_series(payload['tvdb_id'], payload['season_number'], request_id)
+    if not success:
+        # Retried later; the request stays in Jellyseerr/Overseerr until the series is set up
+        raise RuntimeError(f"Failed to set up series with TVDB ID {payload['tvdb_id']}")
+
+    if request_id:
         try:
-            series_id = data.get('series', {}).get('id')
-            if series_id:
-                from servertosonarr import has_tag, apply_default_rule_to_new_series
-                
-                # Check if series has the 'episodes' tag
-                if has_tag(series_id, "episodes"):
-                    app.logger.info(f"Series {series_id} has 'episodes' tag, assigning 'none' rule")
-                    
-                    # Load the config
-                    config = load_config()
-                    
-                    # Convert to string for consistency
-                    series_id_str = str(series_id)
-                    
-                    # Remove this series from any existing rules
-                    for rule_name, rule_details in config['rules'].items():
-                        if 'series' in rule_details:
-                            rule_details['series'] = [sid for sid in rule_details['series'] if sid != series_id_str]
-                    
-                    # Add to the "none" rule
-                    if "none" not in config['rules']:
-                        config['rules']["none"] = {
-                            'get_option': "0",
-                            'action_option': "monitor",
-                            'keep_watched': "0",
-                            'monitor_watched': False,
-                            'series': []
-                        }
-                    
-                    if series_id_str not in config['rules']["none"]['series']:
-                        config['rules']["none"]['series'].append(series_id_str)
-                        
-                    save_config(config)
-                    app.logger.info(f"Assigned series {series_id} to 'none' rule")
-                else:
-                    # Apply the default 1n1 rule
-                    apply_default_rule_to_new_series(series_id)
-                    app.logger.info(f"Applied default 1n1 rule to series {series_id}")
-                    
-                return jsonify({'status': 'success', 'message': 'Processed new series'}), 200
-                
-        except Exception as e:
-            app.logger.error(f"Error processing new series: {str(e)}")
-            return jsonify({'status': 'error', 'message': str(e)}), 500
-            
-    return jsonify({'status': 'success'}), 200
+            with deadline():
+                delete_success = episeerr_utils.delete_overseerr_request(request_id)
+            if not delete_success:
+                app.logger.error(f"Failed to delete request {request_id}")
+        except Exception as delete_error:
+            app.logger.error(f"Exception during request deletion: {str(delete_error)}")
+
+def handle_playback_event(payload):
+    """Intake handler for watched episodes; finished when the playback worker has applied the rule."""
+    return playback_worker.submit(playback_worker.PlaybackEvent.from_dict(payload))
+
+# A newer event for the same series replaces a failed older one: replaying a stale
+# "watched S1E3" after S1E5 would re-plan from the wrong episode
+intake.register('playback', handle_playback_event, supersede=True, retry_window=PLAYBACK_RETRY_WINDOW)
+intake.register('sonarr', handle_sonarr_event)
+intake.register('seerr', handle_seerr_request)
+
+def process_new_series(series_ids):
+    """
+    Assign the 'none' rule to new series tagged 'episodes' and apply the default rule to the rest.
+
+    Returns {series_id: error} for series that failed, so intake retries them.
+    """
+    from servertosonarr import series_with_tag, apply_default_rule_to_series
+
+    # Check which series have the 'episodes' tag; if this fails the whole batch is retried
+    with deadline():
+        tagged = series_with_tag(series_ids, "episodes")
+    if tagged:
+        app.logger.info(f"Series {sorted(tagged)} have 'episodes' tag, assigning 'none' rule")
+    
+        # Add to the "none" rule, removing them from any existing rules
+        def apply(config):
+            if "none" not in config['rules']:
+                config['rules']["none"] = {
+                    'get_option': "0",
+                    'action_option': "monitor",
+                    'keep_watched': "0",
+                    'monitor_watched': False,
+                    'series': []
+                }
+            rule_set = rules.RuleSet(config)
+            rule_set.assign("none", sorted(tagged))
+            rule_set.write_assignments(config)
+
+        update_config(apply)
+        app.logger.info(f"Assigned series {sorted(tagged)} to 'none' rule")
+
+    untagged = [series_id for series_id in series_ids if series_id not in tagged]
+    if not untagged:
+        return {}
+    # Apply the default 1n1 rule
+    failed = apply_default_rule_to_series(untagged)
+    applied = [series_id for series_id in untagged if series_id not in failed]
+    if applied:
+        app.logger.info(f"Applied default 1n1 rule to series {applied}")
+    return failed
+
+@app.route('/api-status')
+def api_status():
+    """Report circuit breaker state for the upstream APIs, the push event stream, caches, search pacing, deletions, playback sessions, webhook intake and admission."""
+    status = get_status()
+    status['push_events'] = sonarr_events.get_status()
+    status['episode_cache'] = episode_cache.stats()
+    status['search_coalescer'] = search_coalescer.stats()
+    status['deletion_queue'] = deletion_queue.stats()
+    status['jellyfin_sessions'] = playback_sessions.stats()
+    status['intake'] = intake.stats()
+    status['playback_worker'] = {'pending': playback_worker.queue_depth(), 'series_active': playback_worker.active_series()}
+    status['admission'] = admission.stats()
+    return jsonify(status)
+
+@app.route('/rule-dry-run')
+def rule_dry_run():
+    """Show the changes a rule would make for a watched episode, without making them."""
+    series_name = request.args.get('series')
+    try:
+        season_number = int(request.args.get('season'))
+        episode_number = int(request.args.get('episode'))
+    except (TypeError, ValueError):
+        return jsonify({'status': 'error', 'message': 'series, season and episode are required'}), 400
+    if not series_name:
+        return jsonify({'status': 'error', 'message': 'series, season and episode are required'}), 400
+    provider_ids = {key: request.args.get(f"{key}_id") for key in ('tvdb', 'tmdb', 'imdb') if request.args.get(f"{key}_id")}
 
+    try:
+        from servertosonarr import process_playback
+        with deadline():
+            plan = process_playback(series_name, season_number, episode_number, provider_ids, dry_run=True)
+    except LookupError:
+        return jsonify({'status': 'error', 'message': 'Episode not found in Sonarr'}), 404
+    except Exception as e:
+        app.logger.error(f"Error planning rule run: {str(e)}")
+        return jsonify({'status': 'error', 'message': str(e)}), 500
+    if plan is None:
+        return jsonify({'status': 'error', 'message': f"Series not found: {series_name}"}), 404
+    return jsonify({'status': 'success', 'plan': plan.to_dict()})
 
 
 if __name__ == '__main__':
         
+    # Start the background workers: playback events, new series batches, queued
+    # webhooks, deferred deletions, Sonarr push events and, if enabled, the library mirror sync
+    playback_worker.start()
+    series_import.start(process_new_series)
+    intake.start()
+    deletion_queue.start()
+    sonarr_events.start()
+    library_mirror.start()
+
     # Start the Flask application
     app.logger.info("Starting webhook listener on port 5001")
     app.run(host='0.0.0.0', port=5001, debug=os.getenv('FLASK_DEBUG', 'false').lower() == 'true')
\ No newline at end of file